@@ -0,0 +1,243 @@
+"""
+Size-bounded cache for generated assets (/app/images, /app/audio)
+生成出嚟嘅圖片同讀音以前只係 `Path.exists()` 檢查，目錄會無限咁大。
+
+而家每個目錄有一個 in-memory index（key, size, last access, hits）：
+- lookup / eviction 只睇 index，唔會 scan 目錄（只係 startup 時 scan 一次）
+- 超過 byte / entry budget 就按 LRU 或 LFU evict
+- background janitor 定期 enforce budget 同將 index 寫落 disk（restart 後保留 hit count）
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from file_utils import atomic_write_bytes
+from metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+ASSET_CACHE_POLICY = os.environ.get("ASSET_CACHE_POLICY", "lru").lower()
+ASSET_CACHE_INDEX_DIR = Path(os.environ.get("ASSET_CACHE_INDEX_DIR", "/app/cache/assets"))
+ASSET_CACHE_JANITOR_INTERVAL = float(os.environ.get("ASSET_CACHE_JANITOR_INTERVAL", "300"))
+
+# Evict down to this fraction of the budget, so we don't evict on every insert
+LOW_WATERMARK = 0.9
+
+
+@dataclass
+class AssetEntry:
+    size: int
+    last_access: float
+    hits: int = 0
+
+
+class AssetCache:
+    """
+    Index + eviction for one directory of generated files
+
+    Keys are file names inside `directory`. All index operations run on the
+    event loop; only file deletion and index persistence go to a thread.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        directory: Path,
+        max_bytes: int,
+        max_entries: int,
+        policy: str = ASSET_CACHE_POLICY,
+        index_dir: Path = ASSET_CACHE_INDEX_DIR,
+    ):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown asset cache policy: {policy}")
+        self.name = name
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.policy = policy
+        self.index_path = Path(index_dir) / f"{name}.json"
+
+        # Ordered by last access (oldest first) → LRU eviction is O(1) per entry
+        self._entries: "OrderedDict[str, AssetEntry]" = OrderedDict()
+        self._bytes = 0
+        self._dirty = False
+        self._janitor: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    # --- lookups ---
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def lookup(self, key: str) -> bool:
+        """Record an access; True when the asset is cached"""
+        entry = self._entries.get(key)
+        record_cache(self.name, entry is not None)
+        if entry is None:
+            self.misses += 1
+            return False
+        entry.hits += 1
+        entry.last_access = time.time()
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self._dirty = True
+        return True
+
+    async def add(self, key: str, size: int):
+        """Register a file just written to the directory (replaces an older version)"""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._entries[key] = AssetEntry(size=size, last_access=time.time())
+        self._bytes += size
+        self._dirty = True
+
+        if self._over_budget():
+            await self.evict()
+
+    # --- eviction ---
+
+    def _over_budget(self) -> bool:
+        return self._bytes > self.max_bytes or len(self._entries) > self.max_entries
+
+    def _victims(self) -> List[Tuple[str, AssetEntry]]:
+        """Pop entries until under the low watermark, return what was removed"""
+        target_bytes = int(self.max_bytes * LOW_WATERMARK)
+        target_entries = int(self.max_entries * LOW_WATERMARK)
+
+        if self.policy == "lfu":
+            # Fewest hits first, oldest access breaks ties
+            order = sorted(self._entries, key=lambda k: (self._entries[k].hits, self._entries[k].last_access))
+        else:
+            order = list(self._entries)
+
+        victims = []
+        for key in order:
+            if self._bytes <= target_bytes and len(self._entries) <= target_entries:
+                break
+            entry = self._entries.pop(key)
+            self._bytes -= entry.size
+            victims.append((key, entry))
+        return victims
+
+    def _unlink(self, keys: List[str]):
+        for key in keys:
+            try:
+                (self.directory / key).unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"{self.name} cache: could not delete {key}: {e}")
+
+    async def evict(self) -> int:
+        """Evict down to the low watermark, return the number of files removed"""
+        victims = self._victims()
+        if not victims:
+            return 0
+        self.evictions += len(victims)
+        self.evicted_bytes += sum(entry.size for _, entry in victims)
+        self._dirty = True
+        await asyncio.to_thread(self._unlink, [key for key, _ in victims])
+        logger.info(f"{self.name} cache: evicted {len(victims)} files ({self.policy}), "
+                    f"{self._bytes} bytes / {len(self._entries)} entries left")
+        return len(victims)
+
+    # --- persistence ---
+
+    def _load(self) -> Dict[str, AssetEntry]:
+        """Scan the directory once, keeping access stats from the saved index"""
+        saved: Dict[str, Dict] = {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                saved = json.load(f).get("entries", {})
+        except (OSError, ValueError):
+            pass
+
+        entries: Dict[str, AssetEntry] = {}
+        with os.scandir(self.directory) as it:
+            for item in it:
+                # Skip temp files of in-progress writes
+                if item.name.startswith(".") or not item.is_file():
+                    continue
+                st = item.stat()
+                meta = saved.get(item.name, {})
+                entries[item.name] = AssetEntry(
+                    size=st.st_size,
+                    last_access=meta.get("last_access", st.st_mtime),
+                    hits=meta.get("hits", 0),
+                )
+        return entries
+
+    def _save(self, entries: Dict[str, Dict]):
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps({"saved": time.time(), "entries": entries}, separators=(",", ":"))
+        atomic_write_bytes(self.index_path, data.encode("utf-8"))
+
+    async def load(self):
+        entries = await asyncio.to_thread(self._load)
+        self._entries = OrderedDict(sorted(entries.items(), key=lambda kv: kv[1].last_access))
+        self._bytes = sum(entry.size for entry in self._entries.values())
+        logger.info(f"{self.name} cache: indexed {len(self._entries)} files, {self._bytes} bytes")
+        if self._over_budget():
+            await self.evict()
+
+    async def save(self):
+        if not self._dirty:
+            return
+        snapshot = {
+            key: {"size": e.size, "last_access": e.last_access, "hits": e.hits}
+            for key, e in self._entries.items()
+        }
+        self._dirty = False
+        try:
+            await asyncio.to_thread(self._save, snapshot)
+        except OSError as e:
+            logger.error(f"{self.name} cache: saving index failed: {e}")
+
+    # --- lifecycle ---
+
+    async def _janitor_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self._over_budget():
+                    await self.evict()
+                await self.save()
+            except Exception as e:
+                logger.error(f"{self.name} cache janitor failed: {e}")
+
+    async def start(self, interval: float = ASSET_CACHE_JANITOR_INTERVAL):
+        await self.load()
+        self._janitor = asyncio.create_task(self._janitor_loop(interval))
+
+    async def stop(self):
+        if self._janitor is not None:
+            self._janitor.cancel()
+            await asyncio.gather(self._janitor, return_exceptions=True)
+            self._janitor = None
+        await self.save()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "policy": self.policy,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "evicted_bytes": self.evicted_bytes,
+        }
@@ -0,0 +1,9 @@
+"""
+Load / latency benchmarks for the OCR service
+用本地 mock DashScope（mock_dashscope.py）代替真 API，唔使 API key 都可以重複跑：
+
+    cd backend/ocr
+    python -m bench.run --spawn --concurrency 1,8,32 --requests 200
+
+結果 JSON 寫去 bench/results/，可以用 `--compare` 同之前 commit 嘅結果比較。
+"""
@@ -0,0 +1,155 @@
+"""
+Compact output schema vs JSON over recorded model outputs (bench/fixtures/model_outputs.jsonl)
+將每個完整嘅 recorded reply 用 compact 格式（TSV 行 + END）重新寫一次，比較 output token 數、
+按 decode 速度估計慳幾多秒，同埋 expand 返 public shape 要幾耐、係咪同 JSON parse 出嚟一樣：
+
+    cd backend/ocr
+    python -m bench.compact_bench --tokens-per-second 30
+
+有裝 tiktoken 就用 cl100k_base 數 token，冇就用粗略估計（中文每字一個，其餘每個字 / 符號一個）。
+截斷咗嘅 record（`expected_items` 係 null）唔計：佢哋本身就冇完整答案可以比。
+"""
+
+import argparse
+import json
+import re
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from bench.parse_bench import FIXTURES, extractor
+from bench.run import RESULTS_DIR, git_commit
+from compact_schema import END_MARKER, SECTION_MARKER, expand_text, expand_vocabulary
+from vocabulary import parse_vocabulary_line
+
+_PIECE = re.compile(r"[㐀-鿿豈-﫿]|\w+|[^\w\s]")
+
+
+def has_tiktoken() -> bool:
+    try:
+        import tiktoken  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def token_counter() -> Callable[[str], int]:
+    if has_tiktoken():
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text))
+    return lambda text: len(_PIECE.findall(text))
+
+
+def normalize(item: Dict) -> Dict:
+    return {key: (item.get(key) or "").strip() for key in ("chinese", "english", "pinyin")}
+
+
+def row(item: Dict) -> str:
+    item = normalize(item)
+    return f"{item['chinese']}\t{item['english']}\t{item['pinyin']}"
+
+
+def render_compact(record: Dict, result: Dict) -> Optional[str]:
+    """What the model would have written for the same answer in compact mode"""
+    if record["expect_key"] == "vocabulary":
+        rows = [row(item) for item in result["vocabulary"]]
+    else:
+        lines = result.get("lines") or result.get("text", "").split("\n")
+        words = [word for word in result.get("words", []) if isinstance(word, dict)]
+        if not words:
+            # Older recordings list words as bare strings: rebuild the rows from the lines
+            words = [item for item in map(parse_vocabulary_line, lines) if item]
+        rows = [line.strip() for line in lines] + [SECTION_MARKER] + [row(item) for item in words]
+    return "\n".join(rows + [END_MARKER]) + "\n"
+
+
+def same_answer(record: Dict, json_result: Dict, compact_result: Optional[Dict]) -> bool:
+    if not compact_result or compact_result.get("partial"):
+        return False
+    if record["expect_key"] == "vocabulary":
+        return [normalize(i) for i in json_result["vocabulary"]] == compact_result["vocabulary"]
+    lines = [line.strip() for line in json_result.get("lines") or json_result.get("text", "").split("\n")]
+    return compact_result["lines"] == lines
+
+
+def median_us(fn: Callable[[str], object], text: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(text)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1e6
+
+
+def run(repeat: int, tokens_per_second: float) -> List[Dict]:
+    count = token_counter()
+    records = [json.loads(line) for line in FIXTURES.read_text(encoding="utf-8").splitlines() if line.strip()]
+    rows = []
+    for record in records:
+        key = record["expect_key"]
+        parse = extractor(key)
+        result = parse(record["output"])
+        if not (isinstance(result, dict) and key in result) or (key == "vocabulary" and record["expected_items"] is None):
+            continue
+        compact = render_compact(record, result)
+        expand = expand_vocabulary if key == "vocabulary" else expand_text
+        json_tokens, compact_tokens = count(record["output"]), count(compact)
+        rows.append({
+            "name": record["name"],
+            "json_tokens": json_tokens,
+            "compact_tokens": compact_tokens,
+            "saved_pct": round((1 - compact_tokens / json_tokens) * 100, 1),
+            "saved_seconds": round((json_tokens - compact_tokens) / tokens_per_second, 2),
+            "json_parse_us": round(median_us(parse, record["output"], repeat), 1),
+            "expand_us": round(median_us(expand, compact, repeat), 1),
+            "round_trip": same_answer(record, result, expand(compact)),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact output schema vs JSON: tokens and decode time")
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--tokens-per-second", type=float, default=30.0,
+                        help="model decode rate used to turn tokens into seconds")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    rows = run(args.repeat, args.tokens_per_second)
+    json_total = sum(r["json_tokens"] for r in rows)
+    compact_total = sum(r["compact_tokens"] for r in rows)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "tokens_per_second": args.tokens_per_second,
+            "tokenizer": "tiktoken" if has_tiktoken() else "estimate",
+        },
+        "summary": {
+            "json_tokens": json_total,
+            "compact_tokens": compact_total,
+            "saved_pct": round((1 - compact_total / json_total) * 100, 1) if json_total else 0,
+            "saved_seconds": round((json_total - compact_total) / args.tokens_per_second, 2),
+        },
+        "results": rows,
+    }
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"compact-{time.strftime('%Y%m%d-%H%M%S')}-{report['meta']['commit'] or 'nogit'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    print(f"{'fixture':<22}{'json tok':>10}{'compact':>9}{'saved':>8}{'sec':>7}{'parse us':>10}{'expand us':>11}  same")
+    for r in rows:
+        print(f"{r['name']:<22}{r['json_tokens']:>10}{r['compact_tokens']:>9}{r['saved_pct']:>7}%{r['saved_seconds']:>7}"
+              f"{r['json_parse_us']:>10}{r['expand_us']:>11}  {'yes' if r['round_trip'] else 'NO'}")
+    s = report["summary"]
+    print(f"\nTotal: {s['json_tokens']} → {s['compact_tokens']} tokens ({s['saved_pct']}% fewer), "
+          f"~{s['saved_seconds']} s of decode at {args.tokens_per_second:g} tok/s ({report['meta']['tokenizer']})")
+    print(f"Saved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Local stand-in for the DashScope endpoints used by main.py
+Chat completions（Qwen-VL，包括 `stream: true`）、Wanx text2image task、CosyVoice TTS。
+
+Latency 同 error 都可以 inject：
+    python -m bench.mock_dashscope --port 3900 --latency-ms 800 --jitter-ms 200 --error-rate 0.05
+
+然後個 service 用 `DASHSCOPE_BASE_URL=http://127.0.0.1:3900` 起就會打去呢度。
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from compact_schema import COMPACT_UPLOAD_PROMPT, COMPACT_VOCAB_PROMPT, END_MARKER, SECTION_MARKER
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MockConfig:
+    latency_ms: float = float(os.environ.get("MOCK_LATENCY_MS", "500"))
+    jitter_ms: float = float(os.environ.get("MOCK_JITTER_MS", "100"))
+    error_rate: float = float(os.environ.get("MOCK_ERROR_RATE", "0"))
+    error_status: int = int(os.environ.get("MOCK_ERROR_STATUS", "503"))
+    retry_after: Optional[float] = None
+    vocab_words: int = int(os.environ.get("MOCK_VOCAB_WORDS", "20"))
+    task_seconds: float = float(os.environ.get("MOCK_TASK_SECONDS", "1"))
+    audio_bytes: int = int(os.environ.get("MOCK_AUDIO_BYTES", str(24 * 1024)))
+    image_bytes: int = int(os.environ.get("MOCK_IMAGE_BYTES", str(200 * 1024)))
+    stream_chunks: int = 20
+
+
+config = MockConfig()
+requests_seen: Counter = Counter()
+errors_sent: Counter = Counter()
+_task_ids = itertools.count(1)
+_tasks: Dict[str, float] = {}
+
+app = FastAPI(title="Mock DashScope")
+
+
+async def simulate(kind: str) -> Optional[Response]:
+    """Sleep for the configured latency; return an error response to inject one"""
+    requests_seen[kind] += 1
+    delay = max(0.0, random.gauss(config.latency_ms, config.jitter_ms)) / 1000
+    await asyncio.sleep(delay)
+    if config.error_rate and random.random() < config.error_rate:
+        errors_sent[kind] += 1
+        headers = {"Retry-After": str(config.retry_after)} if config.retry_after is not None else {}
+        return JSONResponse({"code": "Throttling", "message": "injected error"},
+                            status_code=config.error_status, headers=headers)
+    return None
+
+
+def vision_reply(prompt: str) -> str:
+    """A reply in the shape the prompt asks for (vocabulary list or plain OCR, JSON or compact rows)"""
+    words = [f"word{i}" for i in range(config.vocab_words)]
+    rows = [f"詞語{i}\t{w}\t" for i, w in enumerate(words)]
+    if prompt.strip() == COMPACT_VOCAB_PROMPT.strip():
+        return "\n".join(rows + [END_MARKER])
+    if prompt.strip() == COMPACT_UPLOAD_PROMPT.strip():
+        lines = [f"詞語{i} {w}" for i, w in enumerate(words)]
+        return "\n".join(lines + [SECTION_MARKER] + rows + [END_MARKER])
+    if "vocabulary" in prompt:
+        body = {"vocabulary": [{"english": w, "chinese": f"詞語{i}"} for i, w in enumerate(words)]}
+    else:
+        body = {"text": " ".join(words), "words": words, "lines": words}
+    return "```json\n" + json.dumps(body, ensure_ascii=False) + "\n```"
+
+
+def prompt_of(payload: Dict) -> str:
+    for message in payload.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            return content
+        for part in content or []:
+            if part.get("type") == "text":
+                return part.get("text", "")
+    return ""
+
+
+@app.post("/compatible-mode/v1/chat/completions")
+async def chat_completions(request: Request):
+    payload = await request.json()
+    error = await simulate("chat")
+    if error is not None:
+        return error
+
+    content = vision_reply(prompt_of(payload))
+    if not payload.get("stream"):
+        return {
+            "id": "mock",
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        }
+
+    async def events():
+        size = max(1, len(content) // config.stream_chunks)
+        for i in range(0, len(content), size):
+            chunk = {"choices": [{"index": 0, "delta": {"content": content[i:i + size]}}]}
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(0)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/api/v1/services/aigc/text2image/image-synthesis")
+async def image_synthesis(request: Request):
+    await request.json()
+    error = await simulate("text2image")
+    if error is not None:
+        return error
+    task_id = f"mock-{next(_task_ids)}"
+    _tasks[task_id] = time.monotonic() + config.task_seconds
+    return {"output": {"task_id": task_id, "task_status": "PENDING"}, "request_id": task_id}
+
+
+@app.get("/api/v1/tasks/{task_id}")
+async def get_task(task_id: str, request: Request):
+    requests_seen["task"] += 1
+    ready_at = _tasks.get(task_id)
+    if ready_at is None:
+        return {"output": {"task_id": task_id, "task_status": "UNKNOWN"}}
+    if time.monotonic() < ready_at:
+        return {"output": {"task_id": task_id, "task_status": "RUNNING"}}
+    _tasks.pop(task_id, None)
+    url = str(request.base_url).rstrip("/") + f"/mock-files/{task_id}.png"
+    return {"output": {"task_id": task_id, "task_status": "SUCCEEDED", "results": [{"url": url}]}}
+
+
+@app.get("/mock-files/{name}")
+async def mock_file(name: str):
+    requests_seen["download"] += 1
+    return Response(b"\x89PNG\r\n\x1a\n" + b"\0" * config.image_bytes, media_type="image/png")
+
+
+@app.post("/api/v1/services/audio/tts/generation")
+async def tts_generation(request: Request):
+    await request.json()
+    error = await simulate("tts")
+    if error is not None:
+        return error
+
+    async def audio():
+        chunk = b"\xff\xf3" + b"\0" * 4094
+        for _ in range(max(1, config.audio_bytes // len(chunk))):
+            yield chunk
+            await asyncio.sleep(0)
+
+    return StreamingResponse(audio(), media_type="audio/mpeg")
+
+
+@app.get("/mock/stats")
+async def mock_stats():
+    return {"config": asdict(config), "requests": dict(requests_seen), "errors": dict(errors_sent)}
+
+
+@app.post("/mock/config")
+async def update_config(changes: Dict):
+    """Change latency / error injection between benchmark runs"""
+    for key, value in changes.items():
+        if hasattr(config, key):
+            setattr(config, key, value)
+    return asdict(config)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Mock DashScope server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3900)
+    parser.add_argument("--latency-ms", type=float, default=config.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=config.jitter_ms)
+    parser.add_argument("--error-rate", type=float, default=config.error_rate)
+    parser.add_argument("--error-status", type=int, default=config.error_status)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--vocab-words", type=int, default=config.vocab_words)
+    parser.add_argument("--task-seconds", type=float, default=config.task_seconds)
+    args = parser.parse_args()
+
+    config.latency_ms = args.latency_ms
+    config.jitter_ms = args.jitter_ms
+    config.error_rate = args.error_rate
+    config.error_status = args.error_status
+    config.retry_after = args.retry_after
+    config.vocab_words = args.vocab_words
+    config.task_seconds = args.task_seconds
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
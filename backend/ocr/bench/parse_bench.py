@@ -0,0 +1,124 @@
+"""
+JSON extraction benchmark over recorded model outputs (bench/fixtures/model_outputs.jsonl)
+比較舊嘅 greedy regex / markdown split 同 json_extract：parse 到幾多個、救返幾多個詞語、每次幾耐。
+
+    cd backend/ocr
+    python -m bench.parse_bench --repeat 2000
+
+Fixture 格式：每行 {"name", "expect_key", "expected_items", "output"}；
+`expected_items` 係 null 即係截斷咗，救得幾多得幾多。
+"""
+
+import argparse
+import json
+import re
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import json_extract
+from json_extract import JSONExtractError, extract_json, recover_vocabulary
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "model_outputs.jsonl"
+
+
+def legacy_regex(text: str) -> Any:
+    """main.py / main_qwen.py before json_extract"""
+    match = re.search(r'\{[\s\S]*\}', text)
+    return json.loads(match.group()) if match else None
+
+
+def legacy_fence(text: str) -> Any:
+    """main_openai.py / main_anthropic.py / ... before json_extract"""
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0].strip()
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0].strip()
+    return json.loads(text)
+
+
+def extractor(key: str) -> Callable[[str], Any]:
+    """What main.call_vision does: extract, then salvage vocabulary items"""
+    def parse(text: str) -> Any:
+        try:
+            result, _ = extract_json(text, expect=dict)
+        except JSONExtractError:
+            result = None
+        if key == "vocabulary" and not (isinstance(result, dict) and key in result):
+            items = recover_vocabulary(text)
+            if items:
+                result = {key: items}
+        return result
+    return parse
+
+
+def evaluate(parse: Callable[[str], Any], record: Dict, repeat: int) -> Dict:
+    key = record["expect_key"]
+    try:
+        result = parse(record["output"])
+    except ValueError:
+        result = None
+    ok = isinstance(result, dict) and key in result
+    items = len(result[key]) if ok and key == "vocabulary" else None
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        try:
+            parse(record["output"])
+        except ValueError:
+            pass
+        timings.append(time.perf_counter() - started)
+    return {"ok": ok, "items": items, "us": statistics.median(timings) * 1e6}
+
+
+def run(repeat: int) -> List[Dict]:
+    records = [json.loads(line) for line in FIXTURES.read_text(encoding="utf-8").splitlines() if line.strip()]
+    orjson = json_extract.orjson
+    rows = []
+    for record in records:
+        row = {"name": record["name"], "bytes": len(record["output"].encode()), "expected": record["expected_items"]}
+        row["legacy_regex"] = evaluate(legacy_regex, record, repeat)
+        row["legacy_fence"] = evaluate(legacy_fence, record, repeat)
+        # Same extractor with the stdlib codec, then with orjson (when installed)
+        json_extract.orjson = None
+        row["extract_json"] = evaluate(extractor(record["expect_key"]), record, repeat)
+        json_extract.orjson = orjson
+        if orjson is not None:
+            row["extract_orjson"] = evaluate(extractor(record["expect_key"]), record, repeat)
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON extraction on recorded model outputs")
+    parser.add_argument("--repeat", type=int, default=1000)
+    parser.add_argument("--output", help="write the rows as JSON")
+    args = parser.parse_args()
+
+    rows = run(args.repeat)
+    strategies = [s for s in ("legacy_regex", "legacy_fence", "extract_json", "extract_orjson") if s in rows[0]]
+
+    print(f"{'fixture':<22}{'bytes':>7}" + "".join(f"{s:>18}" for s in strategies))
+    for row in rows:
+        cells = []
+        for s in strategies:
+            r = row[s]
+            result = (f"{r['items']}" if r["items"] is not None else "ok") if r["ok"] else "FAIL"
+            cells.append(f"{result:>7} {r['us']:>8.1f}us")
+        print(f"{row['name']:<22}{row['bytes']:>7}" + "".join(f"{c:>18}" for c in cells))
+
+    print()
+    for s in strategies:
+        ok = sum(1 for row in rows if row[s]["ok"])
+        items = sum(row[s]["items"] or 0 for row in rows)
+        total_us = sum(row[s]["us"] for row in rows)
+        print(f"{s:<16} parsed {ok}/{len(rows)}, vocabulary items {items}, {total_us:.0f}us per pass")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Near-duplicate index latency: pHash multi-index search with hundreds of thousands of entries
+直接用 PHashIndex（唔經 HTTP），塞 `--entries` 個 hash（一半係同一批模板嘅變化，模擬好多份相似工作紙），
+再量 search 嘅 p50 / p99，同埋一張相計 fingerprint（pHash + layout signature）要幾耐：
+
+    cd backend/ocr
+    python -m bench.phash_index --entries 300000,500000 --queries 2000
+"""
+
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+
+from bench.run import RESULTS_DIR, git_commit
+from bench.tesseract_pages import synthetic_page
+from near_duplicate import NEAR_DUP_MAX_DISTANCE, PHashIndex, fingerprint
+
+
+def noisy(rng: np.random.Generator, value: int, bits: int) -> int:
+    for bit in rng.choice(64, bits, replace=False):
+        value ^= 1 << int(bit)
+    return value
+
+
+def percentile(values, q: float) -> float:
+    return float(np.percentile(values, q))
+
+
+def run_size(entries: int, queries: int, templates: int, radius: int, seed: int) -> Dict:
+    rng = np.random.default_rng(seed)
+    index = PHashIndex(entries)
+    centers = [int(v) for v in rng.integers(0, 2 ** 63, templates, dtype=np.int64)]
+
+    started = time.perf_counter()
+    for i in range(entries):
+        if i % 2:
+            value = noisy(rng, centers[i % templates], int(rng.integers(0, 12)))
+        else:
+            value = int(rng.integers(0, 2 ** 63, dtype=np.int64)) << 1 | int(rng.integers(0, 2))
+        index.add(value, rng.bytes(32))
+    insert_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    index.rebuild()
+    rebuild_seconds = time.perf_counter() - started
+
+    results = {}
+    for kind in ("near", "random"):
+        timings, found = [], []
+        for _ in range(queries):
+            if kind == "near":
+                value = noisy(rng, centers[int(rng.integers(0, templates))], int(rng.integers(0, radius + 1)))
+            else:
+                value = int(rng.integers(0, 2 ** 63, dtype=np.int64)) << 1
+            started = time.perf_counter()
+            matches = index.search(value, radius)
+            timings.append(time.perf_counter() - started)
+            found.append(len(matches))
+        results[kind] = {
+            "p50_us": round(statistics.median(timings) * 1e6, 1),
+            "p99_us": round(percentile(timings, 99) * 1e6, 1),
+            "mean_matches": round(statistics.mean(found), 1),
+        }
+    return {
+        "entries": entries,
+        "insert_us": round(insert_seconds / entries * 1e6, 2),
+        "rebuild_ms": round(rebuild_seconds * 1000),
+        **results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Near-duplicate pHash index latency")
+    parser.add_argument("--entries", default="100000,300000,500000")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--templates", type=int, default=2000, help="clusters of similar worksheets")
+    parser.add_argument("--radius", type=int, default=NEAR_DUP_MAX_DISTANCE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    page, _ = synthetic_page(30, None, 1.5)
+    timings = []
+    for _ in range(5):
+        started = time.perf_counter()
+        fingerprint(page)
+        timings.append(time.perf_counter() - started)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "radius": args.radius,
+            "templates": args.templates,
+            "fingerprint_ms": round(statistics.median(timings) * 1000, 1),
+        },
+        "results": [run_size(int(n), args.queries, args.templates, args.radius, args.seed)
+                    for n in args.entries.split(",")],
+    }
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"phash-{time.strftime('%Y%m%d-%H%M%S')}-{report['meta']['commit'] or 'nogit'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    print(f"fingerprint (A4 page): {report['meta']['fingerprint_ms']} ms\n")
+    print(f"{'entries':>8}{'insert us':>11}{'rebuild ms':>12}{'near p50':>10}{'near p99':>10}"
+          f"{'rand p50':>10}{'rand p99':>10}{'matches':>9}")
+    for r in report["results"]:
+        print(f"{r['entries']:>8}{r['insert_us']:>11}{r['rebuild_ms']:>12}{r['near']['p50_us']:>10}"
+              f"{r['near']['p99_us']:>10}{r['random']['p50_us']:>10}{r['random']['p99_us']:>10}"
+              f"{r['near']['mean_matches']:>9}")
+    print(f"\nSaved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+Load driver: concurrency sweep over the main endpoints
+每個 endpoint × concurrency level 跑固定數量 request，報告 throughput、p50/p95/p99 latency 同 service RSS。
+
+    # 自己起 mock DashScope + service（uvicorn main:app），跑完自動關
+    python -m bench.run --spawn --endpoints ocr-upload,extract-vocab,tts,generate-image \\
+        --concurrency 1,8,32 --requests 200 --latency-ms 800 --error-rate 0.02
+
+    # 打一個已經起咗嘅 service（RSS 要畀 --pid）
+    python -m bench.run --target http://localhost:3002 --pid 12345
+
+    # 同上一次結果比較
+    python -m bench.run --spawn --compare bench/results/20250101-120000-abc1234.json
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+BENCH_DIR = Path(__file__).resolve().parent
+SERVICE_DIR = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / "results"
+
+ENDPOINTS = ("ocr-upload", "extract-vocab", "tts", "generate-image")
+
+
+# --- Request builders ---
+
+def sample_image(path: Optional[str]) -> bytes:
+    """The upload used for OCR requests: a real photo, or a synthetic worksheet page"""
+    if path:
+        return Path(path).read_bytes()
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (2400, 1800), "white")
+    draw = ImageDraw.Draw(image)
+    for row in range(40):
+        y = 40 + row * 42
+        draw.text((80, y), f"{row + 1}. apple banana orange  蘋果 香蕉 橙", fill="black")
+        draw.line((60, y + 30, 2340, y + 30), fill=(200, 200, 200))
+    buf = io.BytesIO()
+    image.save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def unique_upload(image: bytes, tag: str) -> bytes:
+    # Bytes after the end-of-image marker are ignored by decoders but change
+    # the SHA-256, so every request misses the OCR cache
+    return image + f"bench-{tag}".encode()
+
+
+def make_request(endpoint: str, image: bytes, run_id: str, index: int, cached: bool) -> Callable:
+    tag = "cached" if cached else f"{run_id}-{index}"
+    upload = image if cached else unique_upload(image, tag)
+
+    if endpoint == "ocr-upload":
+        return lambda c: c.post("/ocr/upload", files={"file": ("page.jpg", upload, "image/jpeg")})
+    if endpoint == "extract-vocab":
+        return lambda c: c.post("/ocr/extract-vocab", params={"prewarm": "false"},
+                                files={"file": ("page.jpg", upload, "image/jpeg")})
+    if endpoint == "tts":
+        return lambda c: c.post("/tts", json={"text": f"word {tag}"})
+    if endpoint == "generate-image":
+        return lambda c: c.post("/generate-image", json={"word": f"word-{tag}"})
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+# --- Measurement ---
+
+def read_rss_mb(pid: Optional[int]) -> Optional[float]:
+    """Resident set size of `pid` (Linux /proc), None when unavailable"""
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+async def sample_rss(pid: Optional[int], samples: List[float], interval: float = 0.1):
+    while True:
+        rss = read_rss_mb(pid)
+        if rss is not None:
+            samples.append(rss)
+        await asyncio.sleep(interval)
+
+
+async def run_level(client: httpx.AsyncClient, endpoint: str, concurrency: int, total: int,
+                    image: bytes, pid: Optional[int], cached: bool) -> Dict:
+    """Send `total` requests with at most `concurrency` in flight"""
+    run_id = uuid.uuid4().hex[:8]
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    counter = iter(range(total))
+
+    if cached:
+        # Fill the cache first so the sweep measures hits only
+        await make_request(endpoint, image, run_id, 0, cached)(client)
+
+    async def worker():
+        for index in counter:
+            send = make_request(endpoint, image, run_id, index, cached)
+            started = time.perf_counter()
+            try:
+                response = await send(client)
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    rss_samples: List[float] = []
+    rss_start = read_rss_mb(pid)
+    sampler = asyncio.create_task(sample_rss(pid, rss_samples))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+    await asyncio.gather(sampler, return_exceptions=True)
+
+    rss_end = read_rss_mb(pid)
+    ok = statuses.get("200", 0)
+    ordered = sorted(latencies)
+
+    def ms(seconds: Optional[float]) -> Optional[float]:
+        return round(seconds * 1000, 1) if seconds is not None else None
+
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": ok,
+        "statuses": dict(statuses),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(ok / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": ms(percentile(ordered, 50)),
+            "p95": ms(percentile(ordered, 95)),
+            "p99": ms(percentile(ordered, 99)),
+            "mean": ms(sum(ordered) / len(ordered)) if ordered else None,
+            "max": ms(ordered[-1]) if ordered else None,
+        },
+        "rss_mb": {
+            "start": round(rss_start, 1) if rss_start is not None else None,
+            "peak": round(max(rss_samples), 1) if rss_samples else None,
+            "end": round(rss_end, 1) if rss_end is not None else None,
+        },
+    }
+
+
+# --- Spawned mock + service ---
+
+async def wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def spawn(args, workdir: Path) -> List[subprocess.Popen]:
+    mock_cmd = [
+        sys.executable, "-m", "bench.mock_dashscope", "--port", str(args.mock_port),
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--error-rate", str(args.error_rate), "--task-seconds", str(args.task_seconds),
+    ]
+    env = {
+        **os.environ,
+        "DASHSCOPE_BASE_URL": f"http://127.0.0.1:{args.mock_port}",
+        "DASHSCOPE_API_KEY": "bench",
+        "IMAGES_DIR": str(workdir / "images"),
+        "AUDIO_DIR": str(workdir / "audio"),
+        "OCR_CACHE_DIR": str(workdir / "cache" / "ocr"),
+        "ASSET_CACHE_INDEX_DIR": str(workdir / "cache" / "assets"),
+        # Every upload is the same page with different trailing bytes: the near-duplicate
+        # index would answer them all (and share /app/cache's index); --env OCR_NEAR_DUP=true to measure it
+        "OCR_NEAR_DUP": "false",
+        "NEAR_DUP_INDEX_PATH": str(workdir / "cache" / "near_dup" / "index.npz"),
+        "IMAGE_JOB_POLL_INTERVAL": "0.2",
+        # Measure the service, not the quota limiter (override with --env)
+        "UPSTREAM_RATE_LIMIT": "1000",
+        "UPSTREAM_BURST": "1000",
+    }
+    env.pop("DATABASE_URL", None)
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    service_cmd = [
+        sys.executable, "-m", "uvicorn", f"{args.app}:app", "--host", "127.0.0.1",
+        "--port", str(args.port), "--log-level", "warning",
+    ]
+    # The service logs every upstream call at INFO; keep it quiet unless asked
+    output = None if args.verbose else subprocess.DEVNULL
+    return [
+        subprocess.Popen(mock_cmd, cwd=SERVICE_DIR, stdout=output, stderr=output),
+        subprocess.Popen(service_cmd, cwd=SERVICE_DIR, env=env, stdout=output, stderr=output),
+    ]
+
+
+# --- Reporting ---
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results: List[Dict], baseline: Optional[Dict] = None):
+    base = {(r["endpoint"], r["concurrency"]): r for r in (baseline or {}).get("results", [])}
+    print(f"{'endpoint':<16}{'conc':>5}{'ok':>7}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'rss':>8}")
+    for r in results:
+        lat = r["latency_ms"]
+        print(f"{r['endpoint']:<16}{r['concurrency']:>5}{r['ok']:>7}{r['throughput_rps'] or 0:>9.1f}"
+              f"{lat['p50'] or 0:>9.0f}{lat['p95'] or 0:>9.0f}{lat['p99'] or 0:>9.0f}"
+              f"{r['rss_mb']['peak'] or 0:>8.0f}")
+        old = base.get((r["endpoint"], r["concurrency"]))
+        if old:
+            def delta(new, prev):
+                return f"{(new - prev) / prev * 100:+.0f}%" if new is not None and prev else "-"
+            print(f"{'  vs baseline':<28}{delta(r['throughput_rps'], old['throughput_rps']):>9}"
+                  f"{delta(lat['p50'], old['latency_ms']['p50']):>9}"
+                  f"{delta(lat['p95'], old['latency_ms']['p95']):>9}"
+                  f"{delta(lat['p99'], old['latency_ms']['p99']):>9}"
+                  f"{delta(r['rss_mb']['peak'], old['rss_mb']['peak']):>8}")
+
+
+async def run(args) -> Dict:
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    for endpoint in endpoints:
+        if endpoint not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint {endpoint} (choose from {', '.join(ENDPOINTS)})")
+    levels = [int(c) for c in args.concurrency.split(",")]
+    image = sample_image(args.image)
+
+    processes: List[subprocess.Popen] = []
+    workdir = tempfile.TemporaryDirectory(prefix="spellquest-bench-")
+    target, pid = args.target, args.pid
+    try:
+        if args.spawn:
+            processes = spawn(args, Path(workdir.name))
+            target, pid = f"http://127.0.0.1:{args.port}", processes[1].pid
+            await wait_ready(f"http://127.0.0.1:{args.mock_port}/mock/stats")
+        await wait_ready(f"{target}/health")
+
+        results = []
+        limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+        async with httpx.AsyncClient(base_url=target, timeout=args.timeout, limits=limits) as client:
+            for endpoint in endpoints:
+                for concurrency in levels:
+                    result = await run_level(client, endpoint, concurrency, args.requests,
+                                             image, pid, args.cached)
+                    results.append(result)
+                    print(f"{endpoint} x{concurrency}: {result['throughput_rps']} rps, "
+                          f"p95 {result['latency_ms']['p95']} ms", file=sys.stderr)
+
+            mock_stats = None
+            if args.spawn:
+                mock_stats = (await client.get(f"http://127.0.0.1:{args.mock_port}/mock/stats")).json()
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        workdir.cleanup()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "target": target,
+            "app": args.app if args.spawn else None,
+            "image_bytes": len(image),
+            "cached": args.cached,
+            "mock": mock_stats,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SpellQuest OCR service load benchmark")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated levels")
+    parser.add_argument("--requests", type=int, default=100, help="requests per level")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--image", help="image to upload (default: synthetic 2400x1800 page)")
+    parser.add_argument("--cached", action="store_true", help="repeat the same input (cache hits)")
+    parser.add_argument("--target", default="http://localhost:3002")
+    parser.add_argument("--pid", type=int, help="service PID for RSS sampling (with --target)")
+    parser.add_argument("--spawn", action="store_true", help="start the mock and the service locally")
+    parser.add_argument("--app", default="main", help="service module to spawn")
+    parser.add_argument("--port", type=int, default=3902)
+    parser.add_argument("--mock-port", type=int, default=3900)
+    parser.add_argument("--latency-ms", type=float, default=500)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--task-seconds", type=float, default=1.0)
+    parser.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the spawned service")
+    parser.add_argument("--verbose", action="store_true", help="show the spawned processes' logs")
+    parser.add_argument("--output", help="result file (default: bench/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="previous result file to diff against")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{report['meta']['commit'] or 'nogit'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    baseline = json.loads(Path(args.compare).read_text(encoding="utf-8")) if args.compare else None
+    print_table(report["results"], baseline)
+    print(f"\nSaved {output}")
+
+
+if __name__ == "__main__":
+    main()
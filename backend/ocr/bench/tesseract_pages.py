@@ -0,0 +1,139 @@
+"""
+Per-page Tesseract latency: whole page vs parallel line strips
+直接用 TesseractPool（唔經 HTTP），每個 mode × worker 數逐張 OCR，報告 p50 latency 同文字準確度：
+
+    cd backend/ocr
+    python -m bench.tesseract_pages --workers 1,8 --pages 5
+    python -m bench.tesseract_pages --image worksheet.jpg --expected worksheet.txt
+
+冇 `--image` 就用 Pillow 畫一版有輕微傾斜嘅詞語表（`--font` 可以指定中文字型），
+準確度 = difflib ratio（OCR 文字 vs 原文，唔計空白）。
+"""
+
+import argparse
+import asyncio
+import difflib
+import io
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from bench.run import RESULTS_DIR, git_commit
+from tesseract_pool import TesseractPool
+
+WORDS = [
+    ("蘋果", "apple", "píng guǒ"), ("香蕉", "banana", "xiāng jiāo"), ("老師", "teacher", "lǎo shī"),
+    ("學校", "school", "xué xiào"), ("朋友", "friend", "péng you"), ("圖書館", "library", "tú shū guǎn"),
+    ("星期", "week", "xīng qī"), ("天氣", "weather", "tiān qì"), ("早餐", "breakfast", "zǎo cān"),
+    ("電腦", "computer", "diàn nǎo"), ("公園", "park", "gōng yuán"), ("醫生", "doctor", "yī shēng"),
+]
+
+
+def synthetic_page(lines: int, font_path: Optional[str], skew: float) -> Tuple[bytes, str]:
+    """A vocabulary list photo: numbered rows, three columns, slightly rotated"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    font = ImageFont.truetype(font_path, 40) if font_path else ImageFont.load_default(size=40)
+    page = Image.new("L", (2480, 3508), 240)  # A4 @ 300 dpi
+    draw = ImageDraw.Draw(page)
+    expected = []
+    for i in range(lines):
+        chinese, english, pinyin = WORDS[i % len(WORDS)]
+        if not font_path:
+            chinese = ""
+        y = 200 + i * 3000 // lines
+        draw.text((200, y), f"{i + 1}.", fill=20, font=font)
+        draw.text((360, y), chinese, fill=20, font=font)
+        draw.text((1000, y), english, fill=20, font=font)
+        draw.text((1700, y), pinyin, fill=20, font=font)
+        expected.append(" ".join(part for part in (f"{i + 1}.", chinese, english, pinyin) if part))
+    page = page.rotate(skew, resample=Image.BICUBIC, fillcolor=240)
+    buf = io.BytesIO()
+    page.save(buf, "JPEG", quality=90)
+    return buf.getvalue(), "\n".join(expected)
+
+
+def accuracy(text: str, expected: Optional[str]) -> Optional[float]:
+    if expected is None:
+        return None
+    return difflib.SequenceMatcher(None, "".join(text.split()), "".join(expected.split())).ratio()
+
+
+async def run_mode(image: bytes, expected: Optional[str], workers: int, segment: bool, pages: int,
+                   lang: str) -> Dict:
+    pool = TesseractPool(workers=workers, lang=lang, segment_lines=segment)
+    await pool.start()
+    try:
+        timings: List[float] = []
+        text = ""
+        for _ in range(pages):
+            started = time.perf_counter()
+            text = await pool.recognize(image)
+            timings.append(time.perf_counter() - started)
+    finally:
+        await pool.stop()
+    score = accuracy(text, expected)
+    return {
+        "mode": "lines" if segment else "page",
+        "workers": workers,
+        "p50_ms": round(statistics.median(timings) * 1000),
+        "max_ms": round(max(timings) * 1000),
+        "accuracy": round(score, 3) if score is not None else None,
+        "text": text,
+    }
+
+
+async def run(args) -> Dict:
+    if args.image:
+        image = Path(args.image).read_bytes()
+        expected = Path(args.expected).read_text(encoding="utf-8") if args.expected else None
+    else:
+        image, expected = synthetic_page(args.lines, args.font, args.skew)
+
+    results = []
+    for workers in (int(w) for w in args.workers.split(",")):
+        for mode in args.modes.split(","):
+            results.append(await run_mode(image, expected, workers, mode == "lines", args.pages, args.lang))
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "image_bytes": len(image),
+            "lang": args.lang,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-page Tesseract latency: whole page vs line strips")
+    parser.add_argument("--image", help="page to OCR (default: generated vocabulary list)")
+    parser.add_argument("--expected", help="ground-truth text for --image")
+    parser.add_argument("--font", help="TTF/OTF with CJK glyphs for the generated page")
+    parser.add_argument("--lines", type=int, default=30)
+    parser.add_argument("--skew", type=float, default=1.5, help="degrees the generated page is rotated")
+    parser.add_argument("--workers", default="1,8")
+    parser.add_argument("--modes", default="page,lines")
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--lang", default="chi_tra+eng")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"tesseract-{time.strftime('%Y%m%d-%H%M%S')}-{report['meta']['commit'] or 'nogit'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    print(f"{'mode':<7}{'workers':>8}{'p50 ms':>9}{'max ms':>9}{'accuracy':>10}")
+    for r in report["results"]:
+        score = f"{r['accuracy']:.3f}" if r["accuracy"] is not None else "-"
+        print(f"{r['mode']:<7}{r['workers']:>8}{r['p50_ms']:>9}{r['max_ms']:>9}{score:>10}")
+    print(f"\nSaved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Peak RSS per concurrent upload
+用大張相（預設 4000x3000 noise JPEG，壓唔細）同時上載 N 張，量 service RSS 升咗幾多：
+
+    cd backend/ocr
+    python -m bench.upload_rss --spawn --concurrency 1,4,8 --rounds 3
+
+`per_upload_mb` = (peak RSS - idle RSS) / concurrency，結果 JSON 寫去 bench/results/。
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+from bench.run import RESULTS_DIR, git_commit, read_rss_mb, sample_rss, spawn, unique_upload, wait_ready
+
+
+def noise_photo(width: int, height: int) -> bytes:
+    """Random pixels: JPEG can't compress them, like a worst-case phone photo"""
+    from PIL import Image
+
+    image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    buf = io.BytesIO()
+    image.save(buf, "JPEG", quality=95)
+    return buf.getvalue()
+
+
+async def measure(client: httpx.AsyncClient, endpoint: str, image: bytes, concurrency: int,
+                  rounds: int, pid: int) -> Dict:
+    idle = read_rss_mb(pid)
+    samples: List[float] = []
+    statuses: Dict[str, int] = {}
+    sampler = asyncio.create_task(sample_rss(pid, samples, interval=0.02))
+
+    async def upload(tag: str):
+        response = await client.post(endpoint, params={"prewarm": "false"},
+                                     files={"file": ("photo.jpg", unique_upload(image, tag), "image/jpeg")})
+        statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    for round_no in range(rounds):
+        await asyncio.gather(*(upload(f"{time.time_ns()}-{round_no}-{i}") for i in range(concurrency)))
+    sampler.cancel()
+    await asyncio.gather(sampler, return_exceptions=True)
+
+    peak = max(samples) if samples else None
+    return {
+        "concurrency": concurrency,
+        "statuses": statuses,
+        "idle_rss_mb": round(idle, 1) if idle is not None else None,
+        "peak_rss_mb": round(peak, 1) if peak is not None else None,
+        "per_upload_mb": round((peak - idle) / concurrency, 1) if peak is not None and idle is not None else None,
+    }
+
+
+async def run_level(args, image: bytes, concurrency: int) -> Dict:
+    """One level; with --spawn every level gets a fresh service so freed-but-kept heap doesn't carry over"""
+    workdir = tempfile.TemporaryDirectory(prefix="spellquest-bench-")
+    processes = spawn(args, Path(workdir.name)) if args.spawn else []
+    target = f"http://127.0.0.1:{args.port}" if args.spawn else args.target
+    pid = processes[1].pid if args.spawn else args.pid
+    try:
+        if args.spawn:
+            await wait_ready(f"http://127.0.0.1:{args.mock_port}/mock/stats")
+        await wait_ready(f"{target}/health")
+        async with httpx.AsyncClient(base_url=target, timeout=args.timeout) as client:
+            # Warm up imports / pools so they don't count as upload memory
+            await client.post(args.endpoint, params={"prewarm": "false"},
+                              files={"file": ("photo.jpg", unique_upload(image, "warmup"), "image/jpeg")})
+            return await measure(client, args.endpoint, image, concurrency, args.rounds, pid)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+        workdir.cleanup()
+
+
+async def run(args) -> Dict:
+    if args.image:
+        image = Path(args.image).read_bytes()
+    elif args.raw:
+        # Undecodable bytes: preprocessing passes them through, so only the copies are measured
+        image = os.urandom(args.raw * 1024 * 1024)
+    else:
+        image = noise_photo(args.width, args.height)
+    results = [await run_level(args, image, int(c)) for c in args.concurrency.split(",")]
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "endpoint": args.endpoint,
+            "upload_bytes": len(image),
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak RSS per concurrent upload")
+    parser.add_argument("--endpoint", default="/ocr/extract-vocab")
+    parser.add_argument("--concurrency", default="1,4,8")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--image", help="upload this file instead of a generated noise photo")
+    parser.add_argument("--raw", type=int, metavar="MB",
+                        help="upload MB of undecodable bytes (measures intake / base64 / body copies only)")
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--target", default="http://localhost:3002")
+    parser.add_argument("--pid", type=int)
+    parser.add_argument("--spawn", action="store_true")
+    parser.add_argument("--app", default="main")
+    parser.add_argument("--port", type=int, default=3902)
+    parser.add_argument("--mock-port", type=int, default=3900)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--task-seconds", type=float, default=1.0)
+    parser.add_argument("--env", action="append", default=[])
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"upload-rss-{time.strftime('%Y%m%d-%H%M%S')}-{report['meta']['commit'] or 'nogit'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    print(f"upload {report['meta']['upload_bytes'] / 1024 / 1024:.1f} MB → {args.endpoint}")
+    print(f"{'conc':>5}{'idle MB':>10}{'peak MB':>10}{'MB/upload':>11}")
+    for r in report["results"]:
+        print(f"{r['concurrency']:>5}{r['idle_rss_mb'] or 0:>10.0f}{r['peak_rss_mb'] or 0:>10.0f}"
+              f"{r['per_upload_mb'] or 0:>11.1f}")
+    print(f"\nSaved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Compact wire format for OCR replies
+Vision model 嘅 latency 主要係 output token：JSON 每個詞都要寫 `{"chinese": ..., "english": ..., "pinyin": ...}`，
+/ocr/upload 仲要將同一堆字寫三次（text、words、lines）。
+
+OCR_COMPACT_OUTPUT=true 之後 model 只需要回：
+- 詞語：每個一行 `中文<TAB>english<TAB>pinyin`
+- 全文：逐行抄一次，`---` 之後再係詞語行（text 由 lines 砌返，唔使 model 再寫）
+最尾一行 `END`：冇 END 即係俾 `max_tokens` 截斷咗（partial）。
+呢度將佢 expand 返同 JSON 一樣嘅 response shape；model 唔聽話照舊回 JSON 都得（fallback 去 json_extract）。
+
+`max_tokens` 跟圖入面有幾多行字 × 幾多欄 scale（line_segment 數行，兩欄詞語表當兩倍），唔再一律 4096。
+"""
+
+import logging
+import math
+import os
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from image_preprocess import run_in_preprocess_pool
+from line_segment import SEGMENT_MAX_EDGE, SEGMENT_MIN_LINES, _runs, binarize, estimate_skew, find_lines, load_gray
+from vocab_stream import VocabularyStreamParser
+from vocabulary import parse_vocabulary_line
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+OCR_COMPACT_OUTPUT = os.environ.get("OCR_COMPACT_OUTPUT", "false").lower() in ("1", "true", "yes")
+OCR_TOKENS_PER_LINE = int(os.environ.get("OCR_TOKENS_PER_LINE", "40"))  # output budget per text line in the image
+OCR_MIN_OUTPUT_TOKENS = int(os.environ.get("OCR_MIN_OUTPUT_TOKENS", "256"))
+
+COLUMN_GAP = 2.0  # line heights of white space between two columns
+MAX_COLUMNS = 4
+
+END_MARKER = "END"
+SECTION_MARKER = "---"
+
+COMPACT_VOCAB_PROMPT = """
+提取詞彙。每個詞一行，用 Tab 分隔：
+中文<TAB>英文<TAB>拼音
+冇嘅欄留空。唔好加編號、標題、JSON 或 markdown。
+全部寫完之後最後一行寫 END。
+"""
+
+COMPACT_UPLOAD_PROMPT = """
+識別圖片中的所有文字。
+先逐行照抄原文（一行對一行）。
+然後寫一行 ---
+再將詞語每個一行，用 Tab 分隔：中文<TAB>英文<TAB>拼音（冇嘅欄留空）。
+唔好加 JSON 或 markdown。全部寫完之後最後一行寫 END。
+"""
+
+_NUMBERING = re.compile(r"^\s*\d+[\.\)、]\s*")
+# `{"` / `["` / a ```json fence: the model answered in JSON after all
+_JSON_START = re.compile(r'[\{\[]\s*"|```json')
+
+
+@dataclass(frozen=True)
+class ReplyFormat:
+    """
+    What the model is asked to write and how its reply becomes the response
+
+    `expand(text)` turns a reply into the public shape, or returns None when
+    the reply isn't in this format (the caller then parses it as JSON).
+    Without `expand` (plain JSON) the provider's fixed `max_tokens` is kept.
+    `lines_factor`: output budget per text line, relative to a vocabulary row.
+    """
+    prompt: str
+    expand: Optional[Callable[[str], Optional[Dict]]] = None
+    lines_factor: float = 1.0
+
+    def max_tokens(self, items: Optional[int]) -> Optional[int]:
+        """Output budget for an image with `items` rows of text (None = provider default)"""
+        if not items or self.expand is None:
+            return None
+        return OCR_MIN_OUTPUT_TOKENS + math.ceil(items * OCR_TOKENS_PER_LINE * self.lines_factor)
+
+
+def _reply_lines(text: str) -> Optional[Tuple[List[str], bool]]:
+    """Non-empty lines of a compact reply and whether it is complete; None for JSON"""
+    if _JSON_START.search(text):
+        return None
+    lines = [line.rstrip() for line in text.split("\n")]
+    lines = [line for line in lines if line.strip() and not line.strip().startswith("```")]
+    if lines and lines[-1].strip() == END_MARKER:
+        return lines[:-1], True
+    if lines and not text.endswith("\n"):
+        # Cut off mid-row
+        lines = lines[:-1]
+    return lines, False
+
+
+def parse_row(row: str) -> Optional[Dict]:
+    """`中文<TAB>english<TAB>pinyin` → vocabulary item (falls back to the space-separated heuristic)"""
+    row = _NUMBERING.sub("", row)
+    if "\t" in row:
+        parts = row.split("\t")
+    elif "|" in row:
+        parts = row.strip().strip("|").split("|")
+    else:
+        return parse_vocabulary_line(row)
+    parts = [part.strip() for part in parts] + ["", "", ""]
+    chinese, english, pinyin = parts[:3]
+    if not (chinese or english):
+        return None
+    return {"chinese": chinese, "english": english, "pinyin": pinyin}
+
+
+def expand_vocabulary(text: str) -> Optional[Dict]:
+    """Rows → {"vocabulary": [...]} (+ "partial" when the END line is missing)"""
+    reply = _reply_lines(text)
+    if reply is None:
+        return None
+    lines, complete = reply
+    items = [item for item in map(parse_row, lines) if item]
+    if not items and not complete:
+        return None
+    result: Dict = {"vocabulary": items}
+    if not complete:
+        result["partial"] = True
+    return result
+
+
+def expand_text(text: str) -> Optional[Dict]:
+    """Lines, `---`, rows → {"text", "words", "lines"} like the JSON /ocr/upload reply"""
+    reply = _reply_lines(text)
+    if reply is None:
+        return None
+    lines, complete = reply
+    if SECTION_MARKER in (line.strip() for line in lines):
+        split = [line.strip() for line in lines].index(SECTION_MARKER)
+        lines, rows = lines[:split], lines[split + 1:]
+        words = [item for item in map(parse_row, rows) if item]
+    else:
+        # Cut off before the word rows (or the model skipped them): split the lines locally
+        words = [item for item in map(parse_vocabulary_line, lines) if item]
+    lines = [line.strip() for line in lines]
+    if not lines and not complete:
+        return None
+    result: Dict = {"text": "\n".join(lines), "words": words, "lines": lines}
+    if not complete:
+        result["partial"] = True
+    return result
+
+
+COMPACT_VOCAB = ReplyFormat(COMPACT_VOCAB_PROMPT, expand_vocabulary)
+# Every line is written once as text, and most lines again as a word row
+COMPACT_UPLOAD = ReplyFormat(COMPACT_UPLOAD_PROMPT, expand_text, lines_factor=2.0)
+
+
+class VocabularyRowStreamParser:
+    """Streamed compact reply → each vocabulary item as soon as its row ends (same API as VocabularyStreamParser)"""
+
+    def __init__(self):
+        self._buffer = ""
+        self._done = False
+        self._json: Optional[VocabularyStreamParser] = None
+        self.items: List[Dict] = []
+
+    def feed(self, chunk: str) -> List[Dict]:
+        if self._json is not None:
+            return self._json.feed(chunk)
+        if self._done:
+            return []
+        self._buffer += chunk
+        head = self._buffer.lstrip()
+        if not self.items and (head[:1] in ("{", "[") or head.startswith("```json")):
+            # The model answered in JSON after all
+            self._json = VocabularyStreamParser()
+            self.items = self._json.items
+            return self._json.feed(self._buffer)
+        *rows, self._buffer = self._buffer.split("\n")
+        completed = []
+        for row in rows:
+            if row.strip() == END_MARKER:
+                self._done = True
+                break
+            if not row.strip() or row.strip().startswith("```"):
+                continue
+            item = parse_row(row)
+            if item:
+                self.items.append(item)
+                completed.append(item)
+        return completed
+
+
+def count_columns(ink: np.ndarray, lines: List[Tuple[int, int]]) -> int:
+    """
+    Blocks of text side by side across the line bands (a two-column word list = 2)
+
+    Gaps wider than COLUMN_GAP line heights split columns; a table with
+    wide-spaced fields counts high too, which only errs towards a larger budget.
+    """
+    rows = np.zeros(ink.shape[0], dtype=bool)
+    for top, bottom in lines:
+        rows[top:bottom] = True
+    profile = ink[rows].sum(axis=0)
+    columns = _runs(profile > max(2, rows.sum() * 0.01))
+    if not columns:
+        return 1
+    height = float(np.median([bottom - top for top, bottom in lines]))
+    blocks = [list(columns[0])]
+    for left, right in columns[1:]:
+        if left - blocks[-1][1] < height * COLUMN_GAP:
+            blocks[-1][1] = right
+        else:
+            blocks.append([left, right])
+    wide = sum(1 for left, right in blocks if right - left >= height)
+    return min(MAX_COLUMNS, max(1, wide))
+
+
+def estimate_text_items(contents: bytes) -> Optional[int]:
+    """
+    Lines × columns of text in the image (deskewed projection profiles on a small copy), None if unknown
+
+    Each item is a vocabulary row or a line the model copies out.
+    """
+    try:
+        gray = load_gray(contents, SEGMENT_MAX_EDGE)
+        ink = binarize(np.asarray(gray))
+        angle = estimate_skew(ink)
+        if abs(angle) >= 0.3:
+            gray = gray.rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=255)
+            ink = binarize(np.asarray(gray))
+        lines = find_lines(ink)
+        if len(lines) < SEGMENT_MIN_LINES:
+            return None
+        columns = count_columns(ink, lines)
+    except Exception as e:
+        logger.warning(f"Text line estimate failed: {e}")
+        return None
+    # Lines too close to separate come out as one tall band: count it by height
+    heights = [bottom - top for top, bottom in lines]
+    median = float(np.median(heights))
+    return columns * sum(max(1, round(height / median)) for height in heights)
+
+
+async def count_text_items(contents: bytes) -> Optional[int]:
+    """`estimate_text_items` in the preprocessing thread pool (None without compact output)"""
+    if not OCR_COMPACT_OUTPUT:
+        return None
+    return await run_in_preprocess_pool(estimate_text_items, contents)
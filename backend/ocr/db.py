@@ -0,0 +1,245 @@
+"""
+Direct PostgreSQL data path (optional)
+設定咗 DATABASE_URL 又裝咗 asyncpg，就用 connection pool 直接寫 DB：
+- 細批：prepared statement（asyncpg 會 cache）一次 call `upsert_words`
+- 大批 import / learning record flush：COPY 入 staging table，再一條 set-based INSERT
+
+冇 DATABASE_URL（或者冇 asyncpg）就照用 PostgREST，每批都只係一個 HTTP request。
+"""
+
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+from fastapi import FastAPI
+
+from http_client import get_client
+
+logger = logging.getLogger(__name__)
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+# --- Configuration ---
+DATABASE_URL = os.environ.get("DATABASE_URL")
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", "10"))
+DB_COMMAND_TIMEOUT = float(os.environ.get("DB_COMMAND_TIMEOUT", "60"))
+# Batches at least this big go through COPY instead of the upsert_words RPC
+DB_COPY_THRESHOLD = int(os.environ.get("DB_COPY_THRESHOLD", "200"))
+
+POSTGREST_URL = os.environ.get("POSTGREST_URL", "http://postgrest:3000")
+
+GAME_TYPES = ("spelling", "sentence", "flashcard")
+WORD_COLUMNS = ("chinese", "english", "pinyin", "category", "grade")
+
+_pool = None
+
+
+class DatabaseError(Exception):
+    """A bulk write failed (on either path)"""
+
+
+def direct_enabled() -> bool:
+    return _pool is not None
+
+
+async def init_db():
+    global _pool
+    if not DATABASE_URL:
+        logger.info("DATABASE_URL not set, DB writes go through PostgREST")
+        return
+    if asyncpg is None:
+        logger.warning("DATABASE_URL is set but asyncpg is not installed, using PostgREST")
+        return
+    try:
+        _pool = await asyncpg.create_pool(
+            DATABASE_URL,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            command_timeout=DB_COMMAND_TIMEOUT,
+        )
+        logger.info(f"PostgreSQL pool ready (max {DB_POOL_MAX_SIZE} connections)")
+    except Exception as e:
+        logger.error(f"PostgreSQL pool failed ({e}), using PostgREST")
+        _pool = None
+
+
+async def close_db():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def setup_database(app: FastAPI):
+    """Register pool startup/shutdown hooks on `app`"""
+
+    @app.on_event("startup")
+    async def _open_db_pool():
+        await init_db()
+
+    @app.on_event("shutdown")
+    async def _close_db_pool():
+        await close_db()
+
+
+# --- words ---
+
+def _word_row(word: Dict) -> Tuple:
+    english = str(word.get("english") or "").strip() or None
+    return (
+        str(word.get("chinese") or "").strip(),
+        english,
+        word.get("pinyin") or "",
+        word.get("category", "general"),
+        word.get("grade", "P1"),
+    )
+
+
+async def _copy_upsert_words(words: List[Dict]) -> Dict[str, List]:
+    """COPY into a temp table, then one INSERT ... ON CONFLICT for the whole batch"""
+    rows = [(i, *_word_row(w)) for i, w in enumerate(words)]
+    errors = [{"english": "", "chinese": r[1], "error": "english is required"} for r in rows if r[2] is None]
+
+    async with _pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("""
+                CREATE TEMP TABLE words_import (
+                    ord INTEGER, chinese TEXT, english TEXT, pinyin TEXT,
+                    category VARCHAR(50), grade VARCHAR(10)
+                ) ON COMMIT DROP
+            """)
+            await conn.copy_records_to_table(
+                "words_import",
+                records=[r for r in rows if r[2] is not None],
+                columns=("ord", *WORD_COLUMNS),
+            )
+            created = await conn.fetch("""
+                INSERT INTO words (chinese, english, pinyin, category, grade)
+                SELECT chinese, english, pinyin, category, grade
+                FROM (
+                    SELECT DISTINCT ON (lower(english)) *
+                    FROM words_import
+                    ORDER BY lower(english), ord
+                ) deduped
+                ORDER BY ord
+                ON CONFLICT (lower(english)) WHERE english IS NOT NULL AND english <> ''
+                DO NOTHING
+                RETURNING id, chinese, english, pinyin, category, grade
+            """)
+            existing = await conn.fetch("""
+                SELECT DISTINCT ON (lower(w.english)) lower(w.english) AS key, w.id
+                FROM words w
+                JOIN words_import i ON lower(w.english) = lower(i.english)
+                ORDER BY lower(w.english), w.id
+            """)
+
+    created_keys = {r["english"].lower() for r in created}
+    ids = {r["key"]: r["id"] for r in existing}
+    skipped, seen = [], set()
+    for _, _, english, *_ in rows:
+        if english is None:
+            continue
+        key = english.lower()
+        if key in seen:
+            skipped.append({"english": english, "reason": "duplicate in batch", "id": ids.get(key)})
+        elif key not in created_keys:
+            skipped.append({"english": english, "reason": "already exists", "id": ids.get(key)})
+        seen.add(key)
+
+    return {"created": [dict(r) for r in created], "skipped": skipped, "errors": errors}
+
+
+async def upsert_words(words: List[Dict], postgrest_url: str = POSTGREST_URL) -> Dict[str, List]:
+    """
+    Insert words, skipping existing English (case-insensitive)
+
+    Returns {"created": [...], "skipped": [...], "errors": [...]}, same as
+    the `upsert_words` SQL function.
+    """
+    if not words:
+        return {"created": [], "skipped": [], "errors": []}
+
+    if _pool is not None:
+        try:
+            if len(words) >= DB_COPY_THRESHOLD:
+                return await _copy_upsert_words(words)
+            async with _pool.acquire() as conn:
+                # asyncpg prepares and caches this statement per connection
+                result = await conn.fetchval("SELECT upsert_words($1::jsonb)", json.dumps(words))
+            return json.loads(result)
+        except Exception as e:
+            raise DatabaseError(f"upsert_words failed: {e}")
+
+    url = f"{postgrest_url}/rpc/upsert_words"
+    client = get_client(url)
+    response = await client.post(url, json={"p_words": words})
+    if response.status_code != 200:
+        raise DatabaseError(f"PostgREST HTTP {response.status_code}: {response.text}")
+    return response.json()
+
+
+# --- learning records ---
+
+def learning_record_row(record: Dict) -> Tuple:
+    """Validate one record (same rules as submit_learning_record)"""
+    if record.get("game_type") not in GAME_TYPES:
+        raise ValueError(f"Invalid game type: {record.get('game_type')}")
+    created_at = record.get("created_at") or datetime.now(timezone.utc)
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    return (
+        int(record["word_id"]),
+        record["game_type"],
+        bool(record.get("correct")),
+        int(record["time_spent_ms"]) if record.get("time_spent_ms") is not None else None,
+        created_at,
+    )
+
+
+async def insert_learning_records(records: List[Dict], postgrest_url: str = POSTGREST_URL) -> int:
+    """Bulk insert learning records (COPY on the direct path), return the count"""
+    rows = [learning_record_row(r) for r in records]
+    if not rows:
+        return 0
+
+    if _pool is not None:
+        try:
+            async with _pool.acquire() as conn:
+                await conn.copy_records_to_table(
+                    "learning_records", records=rows,
+                    columns=("word_id", "game_type", "correct", "time_spent_ms", "created_at"),
+                )
+            return len(rows)
+        except Exception as e:
+            raise DatabaseError(f"learning record COPY failed: {e}")
+
+    # PostgREST inserts a JSON array in one request (every object needs the same keys)
+    payload: List[Dict[str, Any]] = [
+        {"word_id": word_id, "game_type": game_type, "correct": correct,
+         "time_spent_ms": time_spent_ms, "created_at": created_at.isoformat()}
+        for word_id, game_type, correct, time_spent_ms, created_at in rows
+    ]
+
+    url = f"{postgrest_url}/learning_records"
+    client = get_client(url)
+    response = await client.post(url, json=payload, headers={"Prefer": "return=minimal"})
+    if response.status_code not in (200, 201, 204):
+        raise DatabaseError(f"PostgREST HTTP {response.status_code}: {response.text}")
+    return len(rows)
+
+
+def stats() -> Dict:
+    if _pool is None:
+        return {"path": "postgrest", "url": POSTGREST_URL}
+    return {
+        "path": "direct",
+        "pool_size": _pool.get_size(),
+        "pool_idle": _pool.get_idle_size(),
+        "pool_max": _pool.get_max_size(),
+    }
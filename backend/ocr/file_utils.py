@@ -0,0 +1,29 @@
+"""
+File helpers for the cache directories
+"""
+
+import os
+import uuid
+from pathlib import Path
+
+
+def temp_path_for(path: Path) -> Path:
+    """Hidden, unique temp file next to `path` (same filesystem → atomic rename)"""
+    return path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """
+    Write `data` to `path` via temp file + rename
+
+    Readers (e.g. the /audio and /images static mounts) either see the old
+    file or the complete new one, never a half-written file.
+    """
+    tmp_path = temp_path_for(path)
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
@@ -0,0 +1,106 @@
+"""
+Shared upstream HTTP client pool
+所有 upstream call（DashScope / OpenAI / Anthropic / GitHub / PostgREST）共用 app-lifetime client，
+避免每個 request 都重新做 DNS + TCP + TLS handshake。
+"""
+
+import logging
+import os
+from typing import Dict
+from urllib.parse import urlsplit
+
+import httpx
+from fastapi import FastAPI
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "60"))
+HTTP_WRITE_TIMEOUT = float(os.environ.get("HTTP_WRITE_TIMEOUT", "30"))
+HTTP_POOL_TIMEOUT = float(os.environ.get("HTTP_POOL_TIMEOUT", "10"))
+
+# Limits 係 per-host：每個 upstream origin 有自己一個 client / connection pool
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.environ.get("HTTP_MAX_CONNECTIONS_PER_HOST", "20"))
+HTTP_MAX_KEEPALIVE_PER_HOST = int(os.environ.get("HTTP_MAX_KEEPALIVE_PER_HOST", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+HTTP2_ENABLED = os.environ.get("HTTP2_ENABLED", "false").lower() in ("1", "true", "yes")
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _new_client() -> httpx.AsyncClient:
+    http2 = HTTP2_ENABLED and _http2_available()
+    if HTTP2_ENABLED and not http2:
+        logger.warning("HTTP2_ENABLED is set but `h2` is not installed, falling back to HTTP/1.1")
+
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=httpx.Timeout(
+            connect=HTTP_CONNECT_TIMEOUT,
+            read=HTTP_READ_TIMEOUT,
+            write=HTTP_WRITE_TIMEOUT,
+            pool=HTTP_POOL_TIMEOUT,
+        ),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS_PER_HOST,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_PER_HOST,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_client(url: str) -> httpx.AsyncClient:
+    """
+    Return the pooled client for the origin of `url`
+
+    Unknown origins (e.g. OSS download URLs) get a client lazily.
+    """
+    origin = _origin(url)
+    client = _clients.get(origin)
+    if client is None or client.is_closed:
+        client = _new_client()
+        _clients[origin] = client
+    return client
+
+
+async def close_clients():
+    """Close every pooled client (app shutdown)"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def setup_http_client(app: FastAPI, *upstream_urls: str):
+    """
+    Register startup/shutdown hooks on `app`
+
+    Clients for the known upstreams are created on startup, so the first
+    request does not pay pool construction; all clients are closed on shutdown.
+    """
+
+    @app.on_event("startup")
+    async def _open_http_clients():
+        for url in upstream_urls:
+            get_client(url)
+        logger.info(f"HTTP client pool ready for {len(upstream_urls)} upstream(s)")
+
+    @app.on_event("shutdown")
+    async def _close_http_clients():
+        await close_clients()
@@ -0,0 +1,163 @@
+"""
+Confidence-gated hybrid OCR: local Tesseract first, vision model only when needed
+每張相都送去收費、要幾秒嘅 vision model 好浪費：印刷得清楚嘅詞語表 Tesseract 已經讀得好好。
+
+OCR_HYBRID=true 之後：
+1. 本地 Tesseract（tesseract_pool，line strip + 每行 confidence）先讀
+2. 成版 confidence ≥ HYBRID_PAGE_CONFIDENCE → 即刻返，唔 call API
+3. 否則淨係將 confidence 低過 HYBRID_LINE_CONFIDENCE 嘅行（strip 圖）砌成一張細圖，一次過問 vision model，
+   再塞返原本位置
+4. 低 confidence 嘅行太多（> HYBRID_MAX_VISION_FRACTION）、切唔到行、或者 Tesseract queue 滿 → 成版照舊問 vision model
+"""
+
+import io
+import logging
+import os
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from metrics import HYBRID_PAGES
+from tesseract_pool import OCRLine, TesseractBusyError, TesseractPool
+from timing import phase
+from vocabulary import parse_vocabulary_line
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+OCR_HYBRID = os.environ.get("OCR_HYBRID", "false").lower() in ("1", "true", "yes")
+HYBRID_PAGE_CONFIDENCE = float(os.environ.get("HYBRID_PAGE_CONFIDENCE", "80"))
+HYBRID_LINE_CONFIDENCE = float(os.environ.get("HYBRID_LINE_CONFIDENCE", "70"))
+HYBRID_MAX_VISION_FRACTION = float(os.environ.get("HYBRID_MAX_VISION_FRACTION", "0.5"))
+
+# White space between stacked strips, so the model sees separate lines
+STRIP_GAP = 24
+
+
+@dataclass
+class HybridResult:
+    lines: List[str]
+    source: str  # "local" / "hybrid"
+    confidence: float
+    vision_lines: int = 0
+
+    def stats(self) -> Dict:
+        return {
+            "source": self.source,
+            "confidence": round(self.confidence, 1),
+            "lines": len(self.lines),
+            "vision_lines": self.vision_lines,
+        }
+
+
+def page_confidence(lines: List[OCRLine]) -> float:
+    """Mean line confidence weighted by text length (empty lines count as one char)"""
+    weights = [max(1, len(line.text)) for line in lines]
+    return sum(w * line.confidence for w, line in zip(weights, lines)) / sum(weights)
+
+
+def stack_strips(strips: List[np.ndarray]) -> bytes:
+    """Stack line strips top to bottom on white, as one PNG"""
+    from PIL import Image
+
+    width = max(strip.shape[1] for strip in strips)
+    height = sum(strip.shape[0] for strip in strips) + STRIP_GAP * (len(strips) - 1)
+    canvas = np.full((height, width), 255, dtype=np.uint8)
+    y = 0
+    for strip in strips:
+        canvas[y:y + strip.shape[0], :strip.shape[1]] = strip
+        y += strip.shape[0] + STRIP_GAP
+    buf = io.BytesIO()
+    Image.fromarray(canvas).save(buf, "PNG", optimize=True)
+    return buf.getvalue()
+
+
+def vocabulary_result(lines: List[str]) -> List[Dict]:
+    return [item for item in map(parse_vocabulary_line, lines) if item]
+
+
+def text_result(lines: List[str]) -> Dict:
+    """Same shape as the vision /ocr/upload reply: text, words (vocabulary items), lines"""
+    lines = [line.strip() for line in lines if line.strip()]
+    return {"text": "\n".join(lines), "words": vocabulary_result(lines), "lines": lines}
+
+
+class HybridOCR:
+    """
+    Local-first OCR in front of the vision providers
+
+    `read_lines(image, media_type, count)` reads `count` stacked lines with
+    the configured vision provider and returns their text top to bottom.
+    """
+
+    def __init__(self, pool: TesseractPool,
+                 read_lines: Callable[[bytes, str, int], Awaitable[List[str]]],
+                 enabled: bool = OCR_HYBRID):
+        self.pool = pool
+        self.read_lines = read_lines
+        self.enabled = enabled
+
+    async def start(self):
+        if not self.enabled:
+            return
+        try:
+            await self.pool.start()
+        except Exception as e:
+            # e.g. tesseract / traineddata not installed: keep serving through the vision model
+            logger.error(f"Hybrid OCR disabled, Tesseract pool failed to start: {e}")
+            self.enabled = False
+            await self.pool.stop()
+
+    async def stop(self):
+        if self.enabled:
+            await self.pool.stop()
+
+    def stats(self) -> Dict:
+        if not self.enabled:
+            return {"enabled": False}
+        return {"enabled": True, "tesseract": self.pool.stats()}
+
+    async def recognize(self, contents: bytes) -> Optional[HybridResult]:
+        """Lines read locally (low-confidence ones by the vision model), None to send the whole page"""
+        try:
+            with phase("local_ocr"):
+                lines = await self.pool.recognize_lines(contents)
+        except TesseractBusyError:
+            HYBRID_PAGES.labels("busy").inc()
+            return None
+        except Exception as e:
+            logger.warning(f"Local OCR failed, sending the whole page to the vision model: {e}")
+            HYBRID_PAGES.labels("vision").inc()
+            return None
+        if not lines:
+            HYBRID_PAGES.labels("vision").inc()
+            return None
+
+        confidence = page_confidence(lines)
+        if confidence >= HYBRID_PAGE_CONFIDENCE:
+            HYBRID_PAGES.labels("local").inc()
+            return HybridResult([line.text for line in lines], "local", confidence)
+
+        low = [i for i, line in enumerate(lines) if line.confidence < HYBRID_LINE_CONFIDENCE]
+        if lines[0].image is None or len(low) > HYBRID_MAX_VISION_FRACTION * len(lines):
+            # Didn't segment, or mostly unreadable: the model does better with the whole page
+            HYBRID_PAGES.labels("vision").inc()
+            return None
+
+        texts = [line.text for line in lines]
+        if low:
+            with phase("crop"):
+                image = stack_strips([lines[i].image for i in low])
+            read = await self.read_lines(image, "image/png", len(low))
+            if len(read) != len(low):
+                # Can't tell which reply belongs to which crop: don't put text on the wrong line
+                logger.warning(f"Vision model returned {len(read)} lines for {len(low)} crops, "
+                               f"sending the whole page instead")
+                HYBRID_PAGES.labels("vision").inc()
+                return None
+            for i, text in zip(low, read):
+                if text.strip():
+                    texts[i] = text.strip()
+        HYBRID_PAGES.labels("hybrid").inc()
+        return HybridResult(texts, "hybrid", confidence, len(low))
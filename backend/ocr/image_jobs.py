@@ -0,0 +1,252 @@
+"""
+Asynchronous image-generation job queue
+Wanx 係 async task API：提交之後要 poll。以前每個 /generate-image request 自己 poll 10 次，
+成個 HTTP request 同一條 connection 都要等住。
+
+而家：
+- submit 即刻返 job id
+- 一個 background scheduler 負責 submit（有 concurrency 上限）同一次過 poll 晒所有未完成嘅 task
+- client 用 long-poll / SSE 睇進度
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+IMAGE_JOB_CONCURRENCY = int(os.environ.get("IMAGE_JOB_CONCURRENCY", "4"))
+IMAGE_JOB_POLL_INTERVAL = float(os.environ.get("IMAGE_JOB_POLL_INTERVAL", "2"))
+IMAGE_JOB_TIMEOUT = float(os.environ.get("IMAGE_JOB_TIMEOUT", "120"))
+IMAGE_JOB_RETENTION = float(os.environ.get("IMAGE_JOB_RETENTION", "3600"))
+
+# Typical Wanx latency, only used to estimate progress
+EXPECTED_RUN_SECONDS = 20.0
+
+QUEUED, SUBMITTING, RUNNING, SUCCEEDED, FAILED = "queued", "submitting", "running", "succeeded", "failed"
+
+
+@dataclass
+class ImageJob:
+    word: str
+    force: bool = False
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    url: Optional[str] = None
+    cached: bool = False
+    error: Optional[str] = None
+    task_id: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    @property
+    def progress(self) -> int:
+        if self.status == SUCCEEDED:
+            return 100
+        if self.status in (QUEUED, FAILED):
+            return 0
+        if self.status == SUBMITTING or self.started_at is None:
+            return 5
+        elapsed = time.time() - self.started_at
+        return min(95, 10 + int(85 * elapsed / EXPECTED_RUN_SECONDS))
+
+    def notify(self):
+        """Wake everyone waiting for a change of this job"""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_changed(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def wait_done(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while not self.done:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not await self.wait_changed(remaining):
+                break
+        return self.done
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "word": self.word,
+            "status": self.status,
+            "progress": self.progress,
+            "url": self.url,
+            "cached": self.cached,
+            "error": self.error,
+        }
+
+
+class ImageJobScheduler:
+    """
+    Drives all outstanding Wanx tasks from background coroutines
+
+    The provider specifics are injected:
+    - start_task(word) -> task_id
+    - get_task(task_id) -> DashScope task "output" dict
+    - on_success(word, result_url) -> local url (downloads the image)
+    """
+
+    def __init__(
+        self,
+        start_task: Callable[[str], Awaitable[str]],
+        get_task: Callable[[str], Awaitable[Dict]],
+        on_success: Callable[[str, str], Awaitable[str]],
+        concurrency: int = IMAGE_JOB_CONCURRENCY,
+        poll_interval: float = IMAGE_JOB_POLL_INTERVAL,
+        timeout: float = IMAGE_JOB_TIMEOUT,
+    ):
+        self.start_task = start_task
+        self.get_task = get_task
+        self.on_success = on_success
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+        self.jobs: Dict[str, ImageJob] = {}
+        self._active_by_word: Dict[str, ImageJob] = {}
+        self._cached_by_word: Dict[str, ImageJob] = {}
+        self._queue: "asyncio.Queue[ImageJob]" = asyncio.Queue()
+        self._running: Dict[str, ImageJob] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: List[asyncio.Task] = []
+
+    # --- lifecycle ---
+
+    def start(self):
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._tasks = [asyncio.create_task(self._submitter(i)) for i in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._poller()))
+        logger.info(f"Image job scheduler started (concurrency={self.concurrency})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # --- public API ---
+
+    def submit(self, word: str, force: bool = False) -> ImageJob:
+        """Queue a job; an identical job already in flight is reused"""
+        active = self._active_by_word.get(word)
+        if active is not None and not active.done:
+            return active
+
+        job = ImageJob(word=word, force=force)
+        self.jobs[job.id] = job
+        self._active_by_word[word] = job
+        self._queue.put_nowait(job)
+        return job
+
+    def completed(self, word: str, url: str) -> ImageJob:
+        """
+        A finished job for an already-available (cached) image
+
+        One job per word is reused across cache hits (and kept for another
+        retention window each time it is handed out), so hit traffic doesn't
+        fill the job table.
+        """
+        job = self._cached_by_word.get(word)
+        if job is not None and job.url == url and job.id in self.jobs:
+            job.finished_at = time.time()
+            return job
+        job = ImageJob(word=word, status=SUCCEEDED, url=url, cached=True, finished_at=time.time())
+        self.jobs[job.id] = job
+        self._cached_by_word[word] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[ImageJob]:
+        return self.jobs.get(job_id)
+
+    def stats(self) -> Dict:
+        counts: Dict[str, int] = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"queued": self._queue.qsize(), "running": len(self._running), "jobs": counts}
+
+    # --- internals ---
+
+    def _finish(self, job: ImageJob, status: str, url: Optional[str] = None, error: Optional[str] = None):
+        job.status = status
+        job.url = url
+        job.error = error
+        job.finished_at = time.time()
+        self._running.pop(job.id, None)
+        if self._active_by_word.get(job.word) is job:
+            del self._active_by_word[job.word]
+        self._slots.release()
+        job.notify()
+
+    async def _submitter(self, worker: int):
+        while True:
+            job = await self._queue.get()
+            await self._slots.acquire()
+            job.status = SUBMITTING
+            job.notify()
+            try:
+                job.task_id = await self.start_task(job.word)
+            except Exception as e:
+                logger.error(f"Image job {job.id} ({job.word}) submit failed: {e}")
+                self._finish(job, FAILED, error=str(e))
+                continue
+            job.status = RUNNING
+            job.started_at = time.time()
+            self._running[job.id] = job
+            job.notify()
+
+    async def _poll_one(self, job: ImageJob):
+        try:
+            output = await self.get_task(job.task_id)
+        except Exception as e:
+            # 一直 poll 唔到都要 timeout，否則個 job 永遠 RUNNING，個 slot 都唔會還
+            if time.time() - job.started_at > self.timeout:
+                logger.error(f"Image job {job.id} ({job.word}) timed out, last poll failed: {e}")
+                self._finish(job, FAILED, error=f"Generation timed out (poll failed: {e})")
+            else:
+                logger.warning(f"Image job {job.id} poll failed: {e}")
+            return
+
+        status = output.get("task_status")
+        if status == "SUCCEEDED":
+            try:
+                url = await self.on_success(job.word, output["results"][0]["url"])
+                self._finish(job, SUCCEEDED, url=url)
+            except Exception as e:
+                self._finish(job, FAILED, error=f"Download failed: {e}")
+        elif status in ("FAILED", "CANCELED", "UNKNOWN"):
+            self._finish(job, FAILED, error=output.get("message") or f"Generation {status.lower()}")
+        elif time.time() - job.started_at > self.timeout:
+            self._finish(job, FAILED, error="Generation timed out")
+        else:
+            job.notify()  # progress moved on
+
+    async def _poller(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            running = list(self._running.values())
+            if running:
+                await asyncio.gather(*(self._poll_one(job) for job in running))
+
+            # Forget finished jobs after the retention window
+            cutoff = time.time() - IMAGE_JOB_RETENTION
+            for job_id in [j.id for j in self.jobs.values() if j.done and j.finished_at < cutoff]:
+                job = self.jobs.pop(job_id)
+                if self._cached_by_word.get(job.word) is job:
+                    del self._cached_by_word[job.word]
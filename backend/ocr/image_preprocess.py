@@ -0,0 +1,143 @@
+"""
+Image preprocessing before vision-model calls
+手機相通常 4-12 MB / 4000 px，直接 base64 送上 API 好浪費。
+呢度做 EXIF 轉正、縮細、(可選) 灰階 + 對比度正規化，再 re-encode 做細 JPEG/WebP。
+
+Pillow 係 CPU-bound，所以一律喺 thread pool 度行，唔會 block event loop。
+"""
+
+import asyncio
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, TypeVar
+
+from PIL import Image, ImageOps
+
+from metrics import IMAGE_BYTES
+
+logger = logging.getLogger(__name__)
+
+# HEIC (iPhone) support is optional
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    logger.info("pillow-heif not installed, HEIC uploads will be sent as-is")
+
+# --- Configuration ---
+IMAGE_MAX_EDGE = int(os.environ.get("IMAGE_MAX_EDGE", "2048"))
+IMAGE_FORMAT = os.environ.get("IMAGE_FORMAT", "JPEG").upper()  # JPEG / WEBP
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", "85"))
+IMAGE_GRAYSCALE = os.environ.get("IMAGE_GRAYSCALE", "false").lower() in ("1", "true", "yes")
+IMAGE_AUTOCONTRAST = os.environ.get("IMAGE_AUTOCONTRAST", "false").lower() in ("1", "true", "yes")
+IMAGE_PREPROCESS_WORKERS = int(os.environ.get("IMAGE_PREPROCESS_WORKERS", str(os.cpu_count() or 2)))
+
+_MEDIA_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+T = TypeVar("T")
+
+
+@dataclass
+class PreparedImage:
+    """Image bytes ready to be sent to a vision model"""
+    data: bytes
+    media_type: str
+    original_bytes: int
+    width: int = 0
+    height: int = 0
+
+    def stats(self) -> Dict:
+        return {
+            "original_bytes": self.original_bytes,
+            "processed_bytes": len(self.data),
+            "media_type": self.media_type,
+            "width": self.width,
+            "height": self.height,
+        }
+
+
+def preprocess_image(contents: bytes, content_type: str = "image/jpeg") -> PreparedImage:
+    """
+    EXIF rotate → downscale → (grayscale / autocontrast) → re-encode
+
+    If the image cannot be decoded, or re-encoding would not make it smaller,
+    the original bytes are returned untouched.
+    """
+    original = PreparedImage(data=contents, media_type=content_type, original_bytes=len(contents))
+
+    try:
+        image = Image.open(io.BytesIO(contents))
+        image.load()
+    except Exception as e:
+        logger.warning(f"Image decode failed, sending original: {e}")
+        return original
+
+    original.width, original.height = image.size
+
+    rotated = ImageOps.exif_transpose(image)
+    changed = rotated is not image
+    image = rotated
+
+    if max(image.size) > IMAGE_MAX_EDGE or IMAGE_GRAYSCALE or IMAGE_AUTOCONTRAST:
+        changed = True
+
+    prepared = encode_image(image, len(contents))
+
+    if not changed and len(prepared.data) >= len(contents) and content_type in _MEDIA_TYPES.values():
+        return original
+    return prepared
+
+
+def encode_image(image: Image.Image, original_bytes: int) -> PreparedImage:
+    """Downscale (in place) → (grayscale / autocontrast) → encode an already decoded, upright image"""
+    if max(image.size) > IMAGE_MAX_EDGE:
+        image.thumbnail((IMAGE_MAX_EDGE, IMAGE_MAX_EDGE), Image.Resampling.LANCZOS)
+
+    if IMAGE_GRAYSCALE:
+        image = image.convert("L")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    if IMAGE_AUTOCONTRAST:
+        image = ImageOps.autocontrast(image, cutoff=1)
+
+    fmt = IMAGE_FORMAT if IMAGE_FORMAT in _MEDIA_TYPES else "JPEG"
+    buf = io.BytesIO()
+    image.save(buf, format=fmt, quality=IMAGE_QUALITY, optimize=True)
+    return PreparedImage(
+        data=buf.getvalue(),
+        media_type=_MEDIA_TYPES[fmt],
+        original_bytes=original_bytes,
+        width=image.width,
+        height=image.height,
+    )
+
+
+async def run_in_preprocess_pool(fn: Callable[..., T], *args) -> T:
+    """Run CPU-bound Pillow work in the preprocessing thread pool"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=IMAGE_PREPROCESS_WORKERS,
+            thread_name_prefix="image-preprocess",
+        )
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, fn, *args)
+
+
+async def prepare_image(contents: bytes, content_type: str = "image/jpeg") -> PreparedImage:
+    """Run `preprocess_image` in the preprocessing thread pool"""
+    prepared = await run_in_preprocess_pool(preprocess_image, contents, content_type)
+    IMAGE_BYTES.labels("original").observe(prepared.original_bytes)
+    IMAGE_BYTES.labels("prepared").observe(len(prepared.data))
+    logger.info(
+        f"Image preprocessed: {prepared.original_bytes} -> {len(prepared.data)} bytes "
+        f"({prepared.media_type})"
+    )
+    return prepared
@@ -0,0 +1,119 @@
+"""
+Tiled OCR for large / dense photos
+密密麻麻嘅兩欄詞語表一次過問 vision model，output 會撞到 `max_tokens`（截斷 → partial），
+而一張超大相本身就係最慢嘅 request。
+
+呢度將相切成幾條上下重疊嘅橫 band（每條 full width，所以「中文 english pinyin」一行唔會俾切開），
+每條各自 preprocess、平行 OCR，output token 上限同 latency 都跟 tile 數 scale，唔再跟成版大小。
+- 切位會 snap 去兩行字之間嘅空白（line_segment.find_lines），上下各多包一整行做 overlap，
+  所以重疊嗰啲詞語喺兩個 tile 都係完整嘅，merge_vocabulary 去重就得
+- 搵唔到行（例如相片太花）就用固定 OCR_TILE_OVERLAP 比例重疊
+"""
+
+import io
+import logging
+import math
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from image_preprocess import PreparedImage, encode_image, run_in_preprocess_pool
+from line_segment import SEGMENT_MAX_EDGE, binarize, find_lines
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+OCR_TILE_MIN_EDGE = int(os.environ.get("OCR_TILE_MIN_EDGE", "3000"))  # auto-tile from this long edge (px)
+OCR_TILE_TARGET_HEIGHT = int(os.environ.get("OCR_TILE_TARGET_HEIGHT", "1600"))
+OCR_TILE_MAX_TILES = int(os.environ.get("OCR_TILE_MAX_TILES", "6"))
+OCR_TILE_OVERLAP = float(os.environ.get("OCR_TILE_OVERLAP", "0.08"))  # fallback overlap, fraction of a band
+OCR_TILE_CONCURRENCY = int(os.environ.get("OCR_TILE_CONCURRENCY", "4"))
+OCR_TILE_ON_TRUNCATION = os.environ.get("OCR_TILE_ON_TRUNCATION", "true").lower() in ("1", "true", "yes")
+
+# EXIF orientations that swap width / height
+_TRANSPOSED = (5, 6, 7, 8)
+
+
+def _upright_size(image: Image.Image) -> Tuple[int, int]:
+    width, height = image.size
+    if image.getexif().get(0x0112) in _TRANSPOSED:
+        return height, width
+    return width, height
+
+
+def tile_count(contents: bytes, requested: Optional[int] = None, minimum: int = 1) -> int:
+    """
+    How many bands to cut the image into (1 = don't tile)
+
+    `requested`: None = auto (large images only), 0 / 1 = off, n = n bands.
+    Only reads the image header, so it is cheap enough to call inline.
+    """
+    if requested is not None and requested <= 1 and minimum <= 1:
+        return 1
+    try:
+        width, height = _upright_size(Image.open(io.BytesIO(contents)))
+    except Exception:
+        return 1
+    if requested is not None and requested > 1:
+        count = requested
+    elif max(width, height) >= OCR_TILE_MIN_EDGE or minimum > 1:
+        count = math.ceil(height / OCR_TILE_TARGET_HEIGHT)
+    else:
+        count = 1
+    return min(OCR_TILE_MAX_TILES, max(minimum, count))
+
+
+def plan_bands(ink: Optional[np.ndarray], height: int, count: int, scale: float = 1.0) -> List[Tuple[int, int]]:
+    """
+    (top, bottom) of `count` overlapping full-width bands
+
+    With text lines found in `ink` (a downscaled mask, `scale` = full / small)
+    the cuts fall between lines and every band also carries the whole line
+    just above and below it; otherwise fixed-size bands with OCR_TILE_OVERLAP.
+    """
+    lines = find_lines(ink) if ink is not None else []
+    if len(lines) >= 2 * count:
+        centers = [(top + bottom) / 2 * scale for top, bottom in lines]
+        # Index of the first line of each band
+        starts = [0] + [sum(1 for c in centers if c < height * k / count) for k in range(1, count)] + [len(lines)]
+        bands = []
+        for k in range(count):
+            first = max(0, starts[k] - 1)
+            last = min(len(lines), starts[k + 1] + 1) - 1
+            top = 0 if first == 0 else int((lines[first - 1][1] + lines[first][0]) / 2 * scale)
+            bottom = height if last == len(lines) - 1 else int((lines[last][1] + lines[last + 1][0]) / 2 * scale)
+            bands.append((top, bottom))
+        return bands
+
+    band = height / count
+    overlap = band * OCR_TILE_OVERLAP
+    return [(max(0, int(k * band - overlap)), min(height, int((k + 1) * band + overlap))) for k in range(count)]
+
+
+def split_tiles(contents: bytes, count: int) -> List[PreparedImage]:
+    """Decode once, cut into `count` bands, preprocess + encode each (CPU-bound)"""
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(contents)))
+    image.load()
+
+    small = image.convert("L")
+    small.thumbnail((SEGMENT_MAX_EDGE, SEGMENT_MAX_EDGE))
+    try:
+        ink = binarize(np.asarray(small))
+    except Exception as e:
+        logger.warning(f"Tile planning without line detection: {e}")
+        ink = None
+    bands = plan_bands(ink, image.height, count, image.height / small.height)
+
+    tiles = []
+    for top, bottom in bands:
+        tile = encode_image(image.crop((0, top, image.width, bottom)), len(contents))
+        tiles.append(tile)
+    logger.info(f"Split {image.width}x{image.height} into {len(tiles)} tiles: {bands}")
+    return tiles
+
+
+async def prepare_tiles(contents: bytes, count: int) -> List[PreparedImage]:
+    """`split_tiles` in the preprocessing thread pool"""
+    return await run_in_preprocess_pool(split_tiles, contents, count)
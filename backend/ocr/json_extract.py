@@ -0,0 +1,231 @@
+"""
+JSON extraction from model output
+Model 回覆可能包住 markdown fence、前後有解釋文字，或者俾 `max_tokens` 截斷咗。
+以前用 greedy `re.search(r'\\{[\\s\\S]*\\}')` / `split("```json")` 再 `json.loads`，
+parse 唔到就 500，付咗錢嘅 call 要重做。
+
+- 搵第一個 balanced 嘅 JSON object / array（string-aware，唔會俾 string 入面嘅 `}` 搞亂）
+- 截斷咗嘅 output：退返去最後一個完整 value，再補返 `]` / `}`
+- 清走 trailing comma
+- 有 orjson 就用 orjson parse 同 serialise（response 都係）
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+except ImportError:
+    orjson = None
+    FastJSONResponse = JSONResponse
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+# A whole string literal (possibly cut off at the end of the text) or one structural character;
+# lets the scanner skip string contents in C instead of walking them char by char
+_TOKEN = re.compile(r'"(?:[^"\\]+|\\.)*(?:"|\\?\Z)|[{}\[\],]')
+
+
+class JSONExtractError(ValueError):
+    """No JSON value could be recovered from the text"""
+
+
+def loads(data) -> Any:
+    """Parse JSON from str / bytes with the fastest codec available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> str:
+    """Serialise to a JSON str (non-ASCII kept as is)"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def _scan(text: str, start: int) -> Tuple[int, int, List[str]]:
+    """
+    Walk one JSON value starting at `text[start]` (a `{` or `[`)
+
+    Returns (end, safe, safe_stack): `end` is the index after the matching
+    bracket, -1 when the text ends first (truncated) and 0 on a mismatched
+    bracket. `safe` is the last point where everything before it is
+    complete JSON once `safe_stack` is closed; used to repair truncation.
+    """
+    stack: List[str] = []
+    # Everything after `safe` only pushes onto or pops below stack[:safe_depth],
+    # so the stack at the safe point can be rebuilt at the end instead of copied per token
+    safe, safe_depth = -1, 0
+    # Objects that are array elements still open: no safe point inside them, a half-written
+    # item ({"english": "banana"} without its "chinese") is dropped rather than closed
+    open_items = 0
+    for match in _TOKEN.finditer(text, start):
+        token = match.group()
+        ch = token[0]
+        if ch == '"':
+            if len(token) == 1 or token[-1] != '"' or token.endswith('\\"') and _odd_backslashes(token):
+                # Unterminated string: the text was cut off inside it
+                break
+        elif ch == "{" or ch == "[":
+            if ch == "{" and stack and stack[-1] == "[":
+                open_items += 1
+            stack.append(ch)
+            if ch == "[" and len(stack) > 1 and not open_items:
+                # An empty list is a valid partial result ({} items are not)
+                safe, safe_depth = match.end(), len(stack)
+        elif ch == "}" or ch == "]":
+            if not stack or _CLOSERS[stack[-1]] != ch:
+                return 0, safe, stack[:safe_depth]
+            if ch == "}" and len(stack) > 1 and stack[-2] == "[":
+                open_items -= 1
+            stack.pop()
+            if not stack:
+                return match.end(), safe, []
+            if not open_items:
+                safe, safe_depth = match.end(), len(stack)
+        elif not open_items:
+            safe, safe_depth = match.start(), len(stack)
+    return -1, safe, stack[:safe_depth]
+
+
+def _odd_backslashes(token: str) -> bool:
+    """True when the closing quote of `token` is escaped, i.e. the string never ended"""
+    count = 0
+    for ch in reversed(token[:-1]):
+        if ch != "\\":
+            break
+        count += 1
+    return count % 2 == 1
+
+
+def _strip_trailing_commas(segment: str) -> str:
+    """Remove `,` directly before `]` / `}` (outside strings)"""
+    out: List[str] = []
+    in_string = escape = False
+    pending_comma = False
+    for ch in segment:
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == ",":
+            if pending_comma:
+                out.append(",")
+            pending_comma = True
+            continue
+        if ch in " \t\r\n":
+            if not pending_comma:
+                out.append(ch)
+            continue
+        if pending_comma and ch not in "]}":
+            out.append(",")
+        pending_comma = False
+        if ch == '"':
+            in_string = True
+        out.append(ch)
+    return "".join(out)
+
+
+def _parse(segment: str) -> Any:
+    try:
+        return loads(segment)
+    except ValueError:
+        return loads(_strip_trailing_commas(segment))
+
+
+def _repair(text: str, start: int, safe: int, safe_stack: List[str]) -> Any:
+    """Cut a truncated value back to its last complete element and close it"""
+    if safe < 0:
+        raise JSONExtractError("truncated before the first complete value")
+    head = text[start:safe].rstrip().rstrip(",")
+    closing = "".join(_CLOSERS[opener] for opener in reversed(safe_stack))
+    return _parse(head + closing)
+
+
+def extract_json(text: str, repair: bool = True, expect: Optional[type] = None) -> Tuple[Any, bool]:
+    """
+    Return (value, repaired) for the first JSON object / array in `text`
+
+    `repaired` is True when the value had to be rebuilt from truncated
+    output, i.e. trailing elements may be missing. With `expect` (e.g.
+    dict) values of another type are skipped, so `Page [1]: {...}` gives
+    the object rather than `[1]`. Raises JSONExtractError when nothing can
+    be recovered.
+    """
+    def wanted(value: Any) -> bool:
+        return expect is None or isinstance(value, expect)
+
+    stripped = text.strip()
+    if stripped[:1] in ("{", "["):
+        # Fast path: the whole reply is JSON
+        try:
+            value = loads(stripped)
+            if wanted(value):
+                return value, False
+        except ValueError:
+            pass
+    fence = text.find("```")
+    if fence >= 0:
+        # Fast path: the first markdown code block is complete JSON
+        body = text.find("\n", fence)
+        close = text.find("```", body) if body >= 0 else -1
+        if close >= 0:
+            try:
+                value = loads(text[body + 1:close])
+                if wanted(value):
+                    return value, False
+            except ValueError:
+                pass
+
+    pos = 0
+    last_error = "no JSON object or array found"
+    while True:
+        starts = [i for i in (text.find("{", pos), text.find("[", pos)) if i >= 0]
+        if not starts:
+            break
+        start = min(starts)
+        end, safe, safe_stack = _scan(text, start)
+        if end > 0:
+            try:
+                value = _parse(text[start:end])
+                if wanted(value):
+                    return value, False
+                # Valid JSON of the wrong type (`[1]` in `Page [1]: {...}`): keep looking
+                last_error = f"no JSON {expect.__name__} found"
+            except ValueError:
+                pass
+        elif end < 0:
+            # Ran off the end: repair this value rather than returning one of its children
+            if not repair:
+                raise JSONExtractError("truncated JSON")
+            try:
+                value = _repair(text, start, safe, safe_stack)
+            except ValueError as e:
+                last_error = f"could not repair truncated JSON: {e}"
+            else:
+                if wanted(value):
+                    return value, True
+                last_error = f"truncated JSON is not a {expect.__name__}"
+        # Not JSON here (e.g. `{name}` in prose): try the next bracket
+        pos = start + 1
+    raise JSONExtractError(last_error)
+
+
+def recover_vocabulary(text: str, key: str = "vocabulary") -> List[Dict]:
+    """Complete vocabulary items from a reply that doesn't parse as a whole"""
+    # Local import: vocab_stream pulls in metrics, json_extract is also used standalone (bench)
+    from vocab_stream import VocabularyStreamParser
+
+    parser = VocabularyStreamParser(key)
+    parser.feed(text)
+    return parser.items
@@ -0,0 +1,163 @@
+"""
+Local page preprocessing for Tesseract: binarise, deskew, cut into line strips
+成版工作紙交俾 Tesseract 一次 `image_to_string`，只用到一個 core，而且 PSM 3 成日將
+「中文 / english / pinyin」幾欄當做唔同 block 讀，同一行嘅詞語會散開。
+
+呢度全部用 NumPy vectorised 做：
+- Otsu threshold（histogram 一次過計晒 between-class variance）
+- Deskew：將墨水 pixel 按唔同角度投影，揀 row profile 最尖嗰個角度
+- 橫向 projection profile 搵每一行，切出 line strip（灰階，Tesseract 自己再 binarise）
+Strip 逐條用 PSM 7（single line）喺 worker pool 平行 OCR，再按由上到下次序砌返。
+"""
+
+import io
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# --- Configuration ---
+DESKEW_MAX_ANGLE = float(os.environ.get("DESKEW_MAX_ANGLE", "5"))  # degrees
+SEGMENT_MAX_EDGE = int(os.environ.get("SEGMENT_MAX_EDGE", "1200"))  # analysis resolution for deskew
+SEGMENT_MIN_LINES = int(os.environ.get("SEGMENT_MIN_LINES", "2"))
+SEGMENT_MAX_LINES = int(os.environ.get("SEGMENT_MAX_LINES", "200"))
+
+
+def load_gray(contents: bytes, max_edge: Optional[int] = None) -> Image.Image:
+    """
+    Decode, apply EXIF orientation, convert to 8-bit grayscale
+
+    With `max_edge` the copy is no larger than that (JPEG decodes at
+    reduced scale, much faster than a full decode + resize).
+    """
+    image = Image.open(io.BytesIO(contents))
+    if max_edge:
+        image.draft("L", (max_edge, max_edge))
+    image = ImageOps.exif_transpose(image).convert("L")
+    if max_edge:
+        image.thumbnail((max_edge, max_edge))
+    return image
+
+
+def otsu_threshold(gray: np.ndarray) -> int:
+    """Grey level that maximises the between-class variance"""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256, dtype=np.float64)
+    weight_bg = np.cumsum(hist)
+    weight_fg = weight_bg[-1] - weight_bg
+    cum_mean = np.cumsum(hist * levels)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_bg = cum_mean / weight_bg
+        mean_fg = (cum_mean[-1] - cum_mean) / weight_fg
+        between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.nanargmax(between))
+
+
+def binarize(gray: np.ndarray) -> np.ndarray:
+    """Boolean ink mask (True = text); handles light text on a dark background"""
+    ink = gray <= otsu_threshold(gray)
+    if ink.mean() > 0.5:
+        ink = ~ink
+    return ink
+
+
+def estimate_skew(ink: np.ndarray, max_angle: float = DESKEW_MAX_ANGLE) -> float:
+    """
+    Skew angle in degrees (positive = lines slope down to the right)
+
+    Shears the ink coordinates for each candidate angle and scores the row
+    histogram by its sum of squares: aligned text lines give tall, narrow peaks.
+    Coarse 0.5° search, then 0.1° around the best.
+    """
+    ys, xs = np.nonzero(ink)
+    if len(ys) < 100:
+        return 0.0
+    if len(ys) > 200_000:
+        pick = np.random.default_rng(0).choice(len(ys), 200_000, replace=False)
+        ys, xs = ys[pick], xs[pick]
+    ys = ys.astype(np.float64)
+    xs = xs.astype(np.float64)
+    span = ink.shape[0] + int(ink.shape[1] * np.tan(np.radians(max_angle))) + 2
+
+    def best(angles: np.ndarray) -> float:
+        scores = []
+        for angle in angles:
+            rows = np.rint(ys - xs * np.tan(np.radians(angle))).astype(np.int64) + span
+            profile = np.bincount(rows, minlength=2 * span)
+            scores.append(float(np.dot(profile, profile)))
+        return round(float(angles[int(np.argmax(scores))]), 1)
+
+    coarse = best(np.arange(-max_angle, max_angle + 1e-9, 0.5))
+    return best(np.arange(coarse - 0.5, coarse + 0.5 + 1e-9, 0.1))
+
+
+def deskew(gray: Image.Image) -> Image.Image:
+    """Rotate the page so text lines are horizontal (angle found on a downscaled copy)"""
+    small = gray.copy()
+    small.thumbnail((SEGMENT_MAX_EDGE, SEGMENT_MAX_EDGE))
+    angle = estimate_skew(binarize(np.asarray(small)))
+    if abs(angle) < 0.3:
+        # Drift of a few pixels across a strip is within its padding
+        return gray
+    # Pillow rotates counter-clockwise, which lifts the right end of a down-sloping line.
+    # Bilinear: ~3x faster than bicubic on a full page and Tesseract re-binarises anyway
+    return gray.rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=255)
+
+
+def _runs(mask: np.ndarray) -> List[Tuple[int, int]]:
+    """[start, end) of every run of True"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist()))
+
+
+def find_lines(ink: np.ndarray, min_fraction: float = 0.002) -> List[Tuple[int, int]]:
+    """
+    Text line bands (top, bottom) from the horizontal projection profile
+
+    A row is text when more than `min_fraction` of it is ink. Bands closer
+    than a third of the median line height are merged (tone marks over
+    pinyin, the separate strokes of a Chinese character); bands much shorter
+    than the median are treated as noise.
+    """
+    profile = ink.sum(axis=1)
+    rows = profile > max(2, ink.shape[1] * min_fraction)
+    bands = _runs(rows)
+    if not bands:
+        return []
+
+    heights = np.array([bottom - top for top, bottom in bands])
+    median = float(np.median(heights))
+    merged = [list(bands[0])]
+    for top, bottom in bands[1:]:
+        if top - merged[-1][1] < median / 3:
+            merged[-1][1] = bottom
+        else:
+            merged.append([top, bottom])
+    min_height = max(4, median * 0.35)
+    return [(top, bottom) for top, bottom in merged if bottom - top >= min_height]
+
+
+def segment_lines(contents: bytes) -> List[np.ndarray]:
+    """
+    Deskewed grayscale line strips in reading order (top to bottom)
+
+    Returns [] when the page doesn't look like lines of text (too few /
+    too many bands); callers then OCR the whole page instead.
+    """
+    gray = deskew(load_gray(contents))
+    pixels = np.asarray(gray)
+    ink = binarize(pixels)
+    lines = find_lines(ink)
+    if not SEGMENT_MIN_LINES <= len(lines) <= SEGMENT_MAX_LINES:
+        return []
+
+    strips = []
+    height, width = pixels.shape
+    for top, bottom in lines:
+        pad = max(4, (bottom - top) // 4)
+        top, bottom = max(0, top - pad), min(height, bottom + pad)
+        columns = np.flatnonzero(ink[top:bottom].any(axis=0))
+        left, right = max(0, columns[0] - 2 * pad), min(width, columns[-1] + 1 + 2 * pad)
+        strips.append(np.ascontiguousarray(pixels[top:bottom, left:right]))
+    return strips
@@ -5,18 +5,42 @@ SpellQuest OCR Service (Qwen-VL Vision & Image Generation & TTS)
 from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
-import httpx
 import base64
 import os
-import json
 import uuid
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable
 import asyncio
 from pathlib import Path
 import hashlib
+import time
+
+from http_client import get_client, setup_http_client
+from ocr_cache import OCRCache, image_digest, make_cache_key
+from image_preprocess import PreparedImage, prepare_image
+from image_tiles import OCR_TILE_CONCURRENCY, OCR_TILE_ON_TRUNCATION, prepare_tiles, tile_count
+from vocabulary import merge_vocabulary
+from hybrid_ocr import HybridOCR, text_result, vocabulary_result
+from tesseract_pool import TesseractPool
+from near_duplicate import Fingerprint, NearDuplicate, NearDuplicateIndex
+from vocab_stream import VocabularyStreamParser
+from compact_schema import (COMPACT_UPLOAD, COMPACT_VOCAB, OCR_COMPACT_OUTPUT, ReplyFormat,
+                            VocabularyRowStreamParser, count_text_items)
+from json_extract import FastJSONResponse, JSONExtractError, dumps, extract_json, loads, recover_vocabulary
+from providers import DASHSCOPE_BASE_URL, IMAGE_PLACEHOLDER, HedgedVisionRouter, ProviderError, encode_json_with_image
+from image_jobs import ImageJob, ImageJobScheduler, SUCCEEDED
+from singleflight import SingleFlight
+from file_utils import atomic_write_bytes, temp_path_for
+from asset_cache import AssetCache
+import db
+from db import DatabaseError, POSTGREST_URL, setup_database
+from metrics import UPSTREAM_PAYLOAD_BYTES, record_parse_failure, setup_metrics
+from timing import phase, setup_timing
+from uploads import read_upload, setup_uploads
+from resilience import CircuitOpenError, any_circuit_open, get_upstream, upstreams_snapshot
+from prewarm import PrewarmScheduler, Warmer, PREWARM_TTS_RATE, PREWARM_TTS_CONCURRENCY, PREWARM_IMAGE_RATE, PREWARM_IMAGE_CONCURRENCY
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -25,7 +49,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="SpellQuest Services (OCR + ImageGen + TTS)",
     description="OCR (Qwen-VL), Image Generation (Wanx-v1), and TTS (CosyVoice) services",
-    version="2.3.0"
+    version="2.3.0",
+    default_response_class=FastJSONResponse
 )
 
 # CORS
@@ -37,20 +62,76 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Prometheus /metrics + per-route latency
+setup_metrics(app)
+# Server-Timing phases + admin-only profiling (X-Profile)
+setup_timing(app)
+# Upload size cap (413) + spooling large files to disk
+setup_uploads(app)
+
 # --- Configuration ---
 DASHSCOPE_API_KEY = os.environ.get("DASHSCOPE_API_KEY") or os.environ.get("QWEN_API_KEY")
 if not DASHSCOPE_API_KEY:
     logger.warning("DASHSCOPE_API_KEY/QWEN_API_KEY not set!")
 
-# OCR API URL
-DASHSCOPE_OCR_API = "https://dashscope.aliyuncs.com/compatible-mode/v1/chat/completions"
+# OCR API URL (DASHSCOPE_BASE_URL → e.g. the local mock in bench/)
+DASHSCOPE_OCR_API = f"{DASHSCOPE_BASE_URL}/compatible-mode/v1/chat/completions"
+DASHSCOPE_IMAGE_API = f"{DASHSCOPE_BASE_URL}/api/v1/services/aigc/text2image/image-synthesis"
+DASHSCOPE_TASK_API = f"{DASHSCOPE_BASE_URL}/api/v1/tasks"
+DASHSCOPE_TTS_API = f"{DASHSCOPE_BASE_URL}/api/v1/services/audio/tts/generation"
+
+QWEN_VL_MODEL = "qwen-vl-max"
+
+# Max concurrent vision calls per batch request
+OCR_BATCH_CONCURRENCY = int(os.environ.get("OCR_BATCH_CONCURRENCY", "4"))
+OCR_BATCH_MAX_FILES = int(os.environ.get("OCR_BATCH_MAX_FILES", "20"))
+
+# How long the legacy synchronous /generate-image waits for its job
+IMAGE_SYNC_WAIT = float(os.environ.get("IMAGE_SYNC_WAIT", "30"))
+IMAGE_JOB_MAX_WAIT = 30.0
+
+# Budgets for the generated image / audio directories
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+IMAGE_CACHE_MAX_ENTRIES = int(os.environ.get("IMAGE_CACHE_MAX_ENTRIES", "5000"))
+AUDIO_CACHE_MAX_BYTES = int(os.environ.get("AUDIO_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+AUDIO_CACHE_MAX_ENTRIES = int(os.environ.get("AUDIO_CACHE_MAX_ENTRIES", "20000"))
+
+# Pre-generate audio + illustrations for every OCR import by default
+PREWARM_ON_OCR = os.environ.get("PREWARM_ON_OCR", "false").lower() in ("1", "true", "yes")
+PREWARM_MAX_WAIT = 30.0
+
+# Vision providers (OCR_PROVIDERS=dashscope,dashscope-intl,... → hedged requests)
+vision_router = HedgedVisionRouter.from_env()
+
+# Pooled upstream clients (keep-alive across requests)
+setup_http_client(app, DASHSCOPE_OCR_API, POSTGREST_URL, *vision_router.upstream_urls)
+
+# Direct PostgreSQL pool when DATABASE_URL is set (PostgREST otherwise)
+setup_database(app)
+
+# OCR result cache (image SHA-256 + prompt version + model)
+ocr_cache = OCRCache()
 
 # Directories
-IMAGES_DIR = Path("/app/images")
-AUDIO_DIR = Path("/app/audio")
+IMAGES_DIR = Path(os.environ.get("IMAGES_DIR", "/app/images"))
+AUDIO_DIR = Path(os.environ.get("AUDIO_DIR", "/app/audio"))
 IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 AUDIO_DIR.mkdir(parents=True, exist_ok=True)
 
+# Size-bounded indexes over the generated files (LRU/LFU eviction)
+image_cache = AssetCache("images", IMAGES_DIR, IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_MAX_ENTRIES)
+audio_cache = AssetCache("audio", AUDIO_DIR, AUDIO_CACHE_MAX_BYTES, AUDIO_CACHE_MAX_ENTRIES)
+
+@app.on_event("startup")
+async def start_asset_caches():
+    await image_cache.start()
+    await audio_cache.start()
+
+@app.on_event("shutdown")
+async def stop_asset_caches():
+    await image_cache.stop()
+    await audio_cache.stop()
+
 # Mount static directories
 app.mount("/images", StaticFiles(directory=str(IMAGES_DIR)), name="images")
 app.mount("/audio", StaticFiles(directory=str(AUDIO_DIR)), name="audio")
@@ -65,17 +146,65 @@ class ImageGenRequest(BaseModel):
     word: str
     force: bool = False
 
+class PrewarmRequest(BaseModel):
+    word_set_id: Optional[int] = None
+    words: Optional[List[str]] = None
+    tts: bool = True
+    images: bool = True
+
+class WordsBulkRequest(BaseModel):
+    words: List[Dict[str, Any]]
+
+class LearningRecordsBulkRequest(BaseModel):
+    records: List[Dict[str, Any]]
+
+class ImageJobBatchRequest(BaseModel):
+    words: List[str]
+    force: bool = False
+
+# --- Prompts ---
+OCR_UPLOAD_PROMPT = """
+請識別圖片中的所有文字。
+返回 JSON:
+{
+  "text": "完整文字",
+  "words": [{"chinese": "中文", "english": "eng", "pinyin": "py"}],
+  "lines": ["row1", "row2"]
+}
+"""
+
+# Hybrid OCR: only the low-confidence lines, stacked top to bottom
+READ_LINES_PROMPT = """
+圖中有 {count} 行文字（由上到下，每行之間有空白）。
+逐行照抄，中文、英文、拼音都保留，唔好翻譯或者加解釋。
+返回 JSON:
+{{
+  "lines": ["第一行", "第二行"]
+}}
+"""
+
+EXTRACT_VOCAB_PROMPT = """
+提取詞彙。
+返回 JSON:
+{
+  "vocabulary": [{"chinese": "中文", "english": "eng", "pinyin": "py"}]
+}
+"""
+
+# What the model writes: compact rows expanded locally (OCR_COMPACT_OUTPUT=true), or the JSON above
+VOCAB_FORMAT = COMPACT_VOCAB if OCR_COMPACT_OUTPUT else ReplyFormat(EXTRACT_VOCAB_PROMPT)
+UPLOAD_FORMAT = COMPACT_UPLOAD if OCR_COMPACT_OUTPUT else ReplyFormat(OCR_UPLOAD_PROMPT)
+
 # --- Helper Functions ---
 
-async def call_qwen_vision(image_b64: str, prompt: str) -> Dict:
-    """Call Qwen-VL API with image (OCR)"""
-    headers = {
-        "Authorization": f"Bearer {DASHSCOPE_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "model": "qwen-vl-max",
+def circuit_open_exception(e: CircuitOpenError) -> HTTPException:
+    """503 + Retry-After so clients back off instead of retrying at once"""
+    return HTTPException(503, str(e), headers={"Retry-After": str(max(1, round(e.retry_after)))})
+
+def build_vision_payload(prompt: str, media_type: str = "image/jpeg", max_tokens: Optional[int] = None) -> Dict:
+    """Chat-completions payload for Qwen-VL (IMAGE_PLACEHOLDER + text prompt)"""
+    return {
+        "model": QWEN_VL_MODEL,
         "messages": [
             {
                 "role": "user",
@@ -83,7 +212,7 @@ async def call_qwen_vision(image_b64: str, prompt: str) -> Dict:
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_b64}"
+                            "url": f"data:{media_type};base64,{IMAGE_PLACEHOLDER}"
                         }
                     },
                     {
@@ -93,42 +222,362 @@ async def call_qwen_vision(image_b64: str, prompt: str) -> Dict:
                 ]
             }
         ],
-        "max_tokens": 4096
+        "max_tokens": min(max_tokens, 4096) if max_tokens else 4096
     }
+
+def parse_vision_content(content: Any) -> Any:
+    """
+    Parse the JSON out of a model reply (markdown fences, text around it)
     
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(DASHSCOPE_OCR_API, headers=headers, json=payload)
-        
+    Output cut off by max_tokens is repaired to its last complete element
+    and marked `"partial": true`.
+    """
+    if not isinstance(content, str):
+        return content
+    try:
+        result, repaired = extract_json(content, expect=dict)
+    except JSONExtractError:
+        record_parse_failure("vision")
+        return {"text": content} # Fallback
+    if repaired:
+        record_parse_failure("vision_truncated")
+        if isinstance(result, dict):
+            result["partial"] = True
+    return result
+
+async def call_vision(image_b64: bytes, prompt: str, media_type: str = "image/jpeg",
+                      required_key: Optional[str] = None, expand: Optional[Callable[[str], Optional[Dict]]] = None,
+                      max_tokens: Optional[int] = None) -> Dict:
+    """
+    Call the configured vision provider(s) with image (OCR)
+    
+    With more than one provider the call is hedged: the first reply that
+    parses to a dict containing `required_key` wins. `expand` turns a
+    compact-format reply into the response shape (JSON replies still parse).
+    """
+    def parse(content: Any) -> Dict:
+        with phase("parse"):
+            result = expand(content) if expand and isinstance(content, str) else None
+            if result is None:
+                result = parse_vision_content(content)
+            elif result.get("partial"):
+                record_parse_failure("vision_truncated")
+                if max_tokens:
+                    logger.warning(f"Compact reply truncated at sized max_tokens={max_tokens}")
+            if required_key == "vocabulary" and isinstance(content, str) and \
+                    not (isinstance(result, dict) and "vocabulary" in result):
+                # e.g. one malformed item: keep the complete ones instead of paying for a retry
+                items = recover_vocabulary(content)
+                if items:
+                    result = {"vocabulary": items, "partial": True}
+        if not isinstance(result, dict) or (required_key and required_key not in result):
+            raise ValueError(f"no '{required_key}' in reply")
+        if result.get("partial") and not result.get(required_key):
+            raise ValueError(f"reply cut off before the first '{required_key}' item")
+        return result
+    
+    try:
+        with phase("upstream"):
+            result, provider = await vision_router.call(image_b64, prompt, media_type, parse, max_tokens)
+    except ProviderError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=f"Vision API error ({e.provider}): {e.detail}"
+        )
+    except CircuitOpenError as e:
+        raise circuit_open_exception(e)
+    logger.info(f"OCR answered by {provider}")
+    return result
+
+async def stream_qwen_vision(image_b64: bytes, prompt: str, media_type: str = "image/jpeg",
+                             max_tokens: Optional[int] = None) -> AsyncIterator[str]:
+    """Call Qwen-VL with `stream: true`, yield content deltas as they arrive"""
+    headers = {
+        "Authorization": f"Bearer {DASHSCOPE_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    payload = build_vision_payload(prompt, media_type, max_tokens)
+    payload["stream"] = True
+    body = encode_json_with_image(payload, image_b64)
+    UPSTREAM_PAYLOAD_BYTES.labels("dashscope").observe(len(body))
+    
+    client = get_client(DASHSCOPE_OCR_API)
+    response = await get_upstream("dashscope", DASHSCOPE_API_KEY).call(
+        lambda: client.send(client.build_request("POST", DASHSCOPE_OCR_API, headers=headers, content=body), stream=True),
+        model=QWEN_VL_MODEL
+    )
+    try:
         if response.status_code != 200:
+            body = await response.aread()
             raise HTTPException(
                 status_code=response.status_code,
-                detail=f"Qwen API error: {response.text}"
+                detail=f"Qwen API error: {body.decode('utf-8', 'replace')}"
             )
         
-        result = response.json()
-        content = result["choices"][0]["message"]["content"]
-        
-        # Try to parse JSON from markdown code block if present
-        try:
-            if isinstance(content, str):
-                import re
-                json_match = re.search(r'\{[\s\S]*\}', content)
-                if json_match:
-                    return json.loads(json_match.group())
-                return {"text": content} # Fallback
-            return content
-        except:
-            return content
-
-async def download_file(url: str, dest_path: Path):
-    """Download file from URL to local path"""
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url)
-        if resp.status_code == 200:
-            with open(dest_path, "wb") as f:
-                f.write(resp.content)
-        else:
-            logger.error(f"Failed to download: {url}")
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = loads(data)
+            except ValueError:
+                continue
+            for choice in chunk.get("choices", []):
+                delta = (choice.get("delta") or {}).get("content")
+                if delta:
+                    yield delta
+    finally:
+        await response.aclose()
+
+async def read_lines_with_vision(image: bytes, media_type: str, count: int) -> List[str]:
+    """Hybrid OCR: the vision provider reads the stacked low-confidence line strips"""
+    result = await call_vision(base64.b64encode(image), READ_LINES_PROMPT.format(count=count), media_type, "lines")
+    return [str(line) for line in result.get("lines") or []]
+
+# Local Tesseract first, vision model only for what it can't read (OCR_HYBRID=true)
+hybrid_ocr = HybridOCR(TesseractPool(), read_lines_with_vision)
+
+@app.on_event("startup")
+async def start_hybrid_ocr():
+    await hybrid_ocr.start()
+
+@app.on_event("shutdown")
+async def stop_hybrid_ocr():
+    await hybrid_ocr.stop()
+
+def ocr_cache_model() -> str:
+    """Hybrid results are cached apart from pure vision-model results"""
+    if hybrid_ocr.enabled:
+        return f"hybrid+{vision_router.cache_model}"
+    return vision_router.cache_model
+
+# Re-photographed worksheets → the stored result of an earlier photo (opt-in: OCR_NEAR_DUP=true)
+near_duplicates = NearDuplicateIndex()
+
+@app.on_event("startup")
+async def start_near_duplicates():
+    await near_duplicates.start()
+
+@app.on_event("shutdown")
+async def stop_near_duplicates():
+    await near_duplicates.stop()
+
+async def find_near_duplicate(fingerprint: Fingerprint) -> Optional[NearDuplicate]:
+    """Cached extract-vocab result of a near-identical earlier image"""
+    async def load(digest: str) -> Optional[Dict]:
+        return await ocr_cache.get(make_cache_key(digest, VOCAB_FORMAT.prompt, ocr_cache_model()))
+    return await near_duplicates.find(fingerprint, load)
+
+async def store_vocabulary(cache_key: str, digest: str, vocabulary: List[Dict], fingerprint: Optional[Fingerprint]):
+    """Cache an extract-vocab result (with its layout signature) and index the image"""
+    value = {"vocabulary": vocabulary}
+    if fingerprint is not None:
+        value["layout"] = fingerprint.layout
+    await ocr_cache.set(cache_key, value)
+    if fingerprint is not None:
+        near_duplicates.add(fingerprint, digest)
+
+async def read_vocab_tile(tile: PreparedImage, semaphore: asyncio.Semaphore) -> Dict:
+    async with semaphore:
+        max_tokens = VOCAB_FORMAT.max_tokens(await count_text_items(tile.data))
+        return await call_vision(base64.b64encode(tile.data), VOCAB_FORMAT.prompt, tile.media_type, "vocabulary",
+                                 VOCAB_FORMAT.expand, max_tokens)
+
+async def extract_vocab_tiled(contents: bytes, count: int) -> Dict:
+    """
+    Cut a large / dense image into overlapping bands and OCR them concurrently
+    
+    Words in the overlaps are merged; a failed tile makes the result partial
+    (the call only fails when every tile does).
+    """
+    with phase("preprocess"):
+        tiles = await prepare_tiles(contents, count)
+    semaphore = asyncio.Semaphore(OCR_TILE_CONCURRENCY)
+    results = await asyncio.gather(*(read_vocab_tile(tile, semaphore) for tile in tiles), return_exceptions=True)
+    failed = [r for r in results if isinstance(r, BaseException)]
+    if len(failed) == len(results):
+        raise failed[0]
+    for e in failed:
+        logger.warning(f"OCR tile failed: {e}")
+    done = [r for r in results if not isinstance(r, BaseException)]
+    return {
+        "success": True,
+        "vocabulary": merge_vocabulary(r.get("vocabulary", []) for r in done),
+        "cached": False,
+        "partial": bool(failed) or any(r.get("partial") for r in done),
+        "tiles": [tile.stats() for tile in tiles]
+    }
+
+async def run_extract_vocab(contents: bytes, content_type: str, tiles: Optional[int] = None) -> Dict:
+    """
+    Extract vocabulary from one image (cache → [near duplicate] → [local OCR] → preprocess → vision provider)
+    
+    `tiles`: None = tile large images automatically (and retry a truncated
+    reply as tiles), 0 / 1 = never, n = cut into n bands.
+    """
+    digest = image_digest(contents)
+    with phase("cache"):
+        cache_key = make_cache_key(digest, VOCAB_FORMAT.prompt, ocr_cache_model())
+        cached = await ocr_cache.get(cache_key)
+    if cached is not None:
+        return {"success": True, "vocabulary": cached.get("vocabulary", []), "cached": True}
+    
+    fingerprint = None
+    if near_duplicates.enabled:
+        with phase("near_dup"):
+            fingerprint = await near_duplicates.fingerprint(contents)
+            match = await find_near_duplicate(fingerprint) if fingerprint else None
+        if match:
+            vocabulary = match.value.get("vocabulary", [])
+            with phase("cache"):
+                await store_vocabulary(cache_key, digest, vocabulary, fingerprint)
+            return {"success": True, "vocabulary": vocabulary, "cached": True,
+                    "near_duplicate": match.stats()}
+    
+    if hybrid_ocr.enabled:
+        local = await hybrid_ocr.recognize(contents)
+        vocabulary = vocabulary_result(local.lines) if local else []
+        if vocabulary:
+            with phase("cache"):
+                await store_vocabulary(cache_key, digest, vocabulary, fingerprint)
+            return {"success": True, "vocabulary": vocabulary, "cached": False, "partial": False,
+                    "ocr": local.stats()}
+    
+    count = tile_count(contents, tiles)
+    if count > 1:
+        response = await extract_vocab_tiled(contents, count)
+    else:
+        with phase("preprocess"):
+            prepared, items = await asyncio.gather(prepare_image(contents, content_type), count_text_items(contents))
+        with phase("encode"):
+            image_b64 = base64.b64encode(prepared.data)
+        result = await call_vision(image_b64, VOCAB_FORMAT.prompt, prepared.media_type, "vocabulary",
+                                   VOCAB_FORMAT.expand, VOCAB_FORMAT.max_tokens(items))
+        response = {
+            "success": True,
+            "vocabulary": result.get("vocabulary", []),
+            "cached": False,
+            "partial": bool(result.get("partial")),
+            "image": prepared.stats()
+        }
+        if response["partial"] and tiles is None and OCR_TILE_ON_TRUNCATION:
+            # Hit max_tokens: smaller pieces each get the whole output budget
+            count = tile_count(contents, minimum=2)
+            if count > 1:
+                logger.info(f"OCR reply truncated, retrying as {count} tiles")
+                try:
+                    response = await extract_vocab_tiled(contents, count)
+                except Exception as e:
+                    logger.warning(f"Tiled retry failed, keeping the truncated reply: {e}")
+    
+    if not response["partial"]:
+        # A truncated reply may succeed in full next time, so don't pin it in the cache
+        with phase("cache"):
+            await store_vocabulary(cache_key, digest, response["vocabulary"], fingerprint)
+    return response
+
+def format_stream_event(event: str, data: Dict, fmt: str) -> str:
+    """Encode one streamed result as an NDJSON line or an SSE event"""
+    body = dumps(data)
+    if fmt == "sse":
+        return f"event: {event}\ndata: {body}\n\n"
+    return dumps({"event": event, **data}) + "\n"
+
+async def download_file(url: str, dest_path: Path) -> int:
+    """Download file from URL to local path, return its size"""
+    client = get_client(url)
+    resp = await client.get(url)
+    if resp.status_code == 200:
+        await asyncio.to_thread(atomic_write_bytes, dest_path, resp.content)
+        return len(resp.content)
+    else:
+        logger.error(f"Failed to download: {url}")
+        raise HTTPException(502, f"Failed to download generated file: HTTP {resp.status_code}")
+
+# --- Image generation (Wanx) ---
+
+def image_paths(word: str):
+    """Local file path and public URL of a word's illustration"""
+    filename = f"{word}.png"
+    return IMAGES_DIR / filename, f"/images/{filename}"
+
+def wanx_headers() -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {DASHSCOPE_API_KEY}",
+        "Content-Type": "application/json",
+        "X-DashScope-Async": "enable"
+    }
+
+async def start_wanx_task(word: str) -> str:
+    """Start a Wanx text2image task, return its task id"""
+    payload = {
+        "model": "wanx-v1",
+        "input": {
+            "prompt": f"Cartoon illustration of {word}, cute style, white background, for kids education, simple, colorful"
+        },
+        "parameters": {
+            "style": "<auto>",
+            "size": "1024*1024",
+            "n": 1
+        }
+    }
+    client = get_client(DASHSCOPE_IMAGE_API)
+    resp = await get_upstream("wanx", DASHSCOPE_API_KEY).call(
+        lambda: client.post(DASHSCOPE_IMAGE_API, headers=wanx_headers(), json=payload),
+        model="wanx-v1"
+    )
+    data = resp.json()
+    
+    if "output" not in data or "task_id" not in data["output"]:
+        raise HTTPException(500, f"Failed to start gen task: {data}")
+    return data["output"]["task_id"]
+
+async def get_wanx_task(task_id: str) -> Dict:
+    """Fetch the `output` section of a DashScope task"""
+    client = get_client(DASHSCOPE_TASK_API)
+    # The scheduler polls again next round anyway, so no retries here
+    resp = await get_upstream("wanx-task", DASHSCOPE_API_KEY).call(
+        lambda: client.get(f"{DASHSCOPE_TASK_API}/{task_id}", headers=wanx_headers()),
+        max_retries=0,
+        model="wanx-v1"
+    )
+    data = resp.json()
+
+    if "output" not in data:
+        raise HTTPException(500, f"Failed to fetch gen task: {data}")
+    return data["output"]
+
+async def save_generated_image(word: str, image_url: str) -> str:
+    """Download a finished illustration into IMAGES_DIR, return its local URL"""
+    local_path, local_url = image_paths(word)
+    size = await download_file(image_url, local_path)
+    await image_cache.add(local_path.name, size)
+    return local_url
+
+image_jobs = ImageJobScheduler(start_wanx_task, get_wanx_task, save_generated_image)
+
+@app.on_event("startup")
+async def start_image_jobs():
+    image_jobs.start()
+
+@app.on_event("shutdown")
+async def stop_image_jobs():
+    await image_jobs.stop()
+
+def submit_image_job(word: str, force: bool = False) -> ImageJob:
+    """Queue generation for `word`, or return a finished job if it is already cached"""
+    local_path, local_url = image_paths(word)
+    if not force and image_cache.lookup(local_path.name):
+        return image_jobs.completed(word, local_url)
+    return image_jobs.submit(word, force)
+
+def get_image_job(job_id: str) -> ImageJob:
+    job = image_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return job
 
 # --- Endpoints ---
 
@@ -140,6 +589,28 @@ async def root():
         "features": ["ocr", "image-generation", "tts"]
     }
 
+@app.get("/health")
+async def health_check():
+    """Service health with upstream circuit-breaker state"""
+    return {
+        "status": "degraded" if any_circuit_open() else "healthy",
+        "upstreams": upstreams_snapshot(),
+        "vision": vision_router.snapshot(),
+        "hybrid_ocr": hybrid_ocr.stats(),
+        "near_duplicates": near_duplicates.stats(),
+        "database": db.stats()
+    }
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit / miss / eviction counters of the generated-asset caches"""
+    return {
+        "images": image_cache.stats(),
+        "audio": audio_cache.stats(),
+        "image_jobs": image_jobs.stats(),
+        "prewarm": prewarm_scheduler.stats()
+    }
+
 # 1. OCR Endpoints
 @app.post("/ocr/upload")
 async def ocr_upload(file: UploadFile = File(...)):
@@ -147,168 +618,557 @@ async def ocr_upload(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="Image only")
     
     try:
-        contents = await file.read()
-        image_b64 = base64.b64encode(contents).decode('utf-8')
+        with phase("read"):
+            contents = await read_upload(file)
+        with phase("cache"):
+            cache_key = make_cache_key(image_digest(contents), UPLOAD_FORMAT.prompt, ocr_cache_model())
+            cached = await ocr_cache.get(cache_key)
+        if cached is not None:
+            return {"success": True, "data": cached, "cached": True}
         
-        prompt = """
-請識別圖片中的所有文字。
-返回 JSON:
-{
-  "text": "完整文字",
-  "words": [{"chinese": "中文", "english": "eng", "pinyin": "py"}],
-  "lines": ["row1", "row2"]
-}
-"""
-        result = await call_qwen_vision(image_b64, prompt)
-        return {"success": True, "data": result}
+        if hybrid_ocr.enabled:
+            local = await hybrid_ocr.recognize(contents)
+            if local and any(local.lines):
+                result = text_result(local.lines)
+                with phase("cache"):
+                    await ocr_cache.set(cache_key, result)
+                return {"success": True, "data": result, "cached": False, "ocr": local.stats()}
+        
+        with phase("preprocess"):
+            prepared, items = await asyncio.gather(prepare_image(contents, file.content_type),
+                                                   count_text_items(contents))
+        with phase("encode"):
+            image_b64 = base64.b64encode(prepared.data)
+        result = await call_vision(image_b64, UPLOAD_FORMAT.prompt, prepared.media_type, "text",
+                                   UPLOAD_FORMAT.expand, UPLOAD_FORMAT.max_tokens(items))
+        if isinstance(result, dict) and "words" in result and not result.get("partial"):
+            with phase("cache"):
+                await ocr_cache.set(cache_key, result)
+        return {"success": True, "data": result, "cached": False, "image": prepared.stats()}
             
+    except HTTPException:
+        # Keep upstream status codes (429 / 503 + Retry-After) for the client
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/ocr/extract-vocab")
-async def extract_vocabulary(file: UploadFile = File(...)):
+async def extract_vocabulary(file: UploadFile = File(...), prewarm: bool = PREWARM_ON_OCR,
+                             tiles: Optional[int] = None):
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Image only")
     
     try:
-        contents = await file.read()
-        image_b64 = base64.b64encode(contents).decode('utf-8')
-        
-        prompt = """
-提取詞彙。
-返回 JSON:
-{
-  "vocabulary": [{"chinese": "中文", "english": "eng", "pinyin": "py"}]
-}
-"""
-        result = await call_qwen_vision(image_b64, prompt)
-        return {"success": True, "vocabulary": result.get("vocabulary", [])}
+        with phase("read"):
+            contents = await read_upload(file)
+        result = await run_extract_vocab(contents, file.content_type, tiles)
+        if prewarm:
+            result["prewarm_job_id"] = prewarm_vocabulary(result["vocabulary"])
+        return result
             
+    except HTTPException:
+        # Keep upstream status codes (429 / 503 + Retry-After) for the client
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/ocr/extract-vocab/stream")
+async def extract_vocabulary_stream(file: UploadFile = File(...), prewarm: bool = PREWARM_ON_OCR):
+    """
+    Streaming version of /ocr/extract-vocab (Server-Sent Events).
+
+    Each vocabulary item is pushed as a `word` event as soon as the model has
+    finished writing it; a final `done` event carries the full list and the
+    time-to-first-word.
+    """
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Image only")
+    
+    with phase("read"):
+        contents = await read_upload(file)
+    content_type = file.content_type
+    
+    async def stream():
+        started = time.perf_counter()
+        
+        def elapsed_ms() -> int:
+            return round((time.perf_counter() - started) * 1000)
+        
+        cache_key = make_cache_key(image_digest(contents), VOCAB_FORMAT.prompt, ocr_cache_model())
+        cached = await ocr_cache.get(cache_key)
+        if cached is not None:
+            vocabulary = cached.get("vocabulary", [])
+            for index, item in enumerate(vocabulary):
+                yield format_stream_event("word", {"index": index, "word": item}, "sse")
+            yield format_stream_event("done", {
+                "success": True,
+                "vocabulary": vocabulary,
+                "cached": True,
+                "time_to_first_word_ms": elapsed_ms() if vocabulary else None,
+                "elapsed_ms": elapsed_ms(),
+                "prewarm_job_id": prewarm_vocabulary(vocabulary) if prewarm else None
+            }, "sse")
+            return
+        
+        try:
+            prepared, items = await asyncio.gather(prepare_image(contents, content_type), count_text_items(contents))
+            image_b64 = base64.b64encode(prepared.data)
+            
+            parser = VocabularyRowStreamParser() if VOCAB_FORMAT.expand else VocabularyStreamParser()
+            text_parts: List[str] = []
+            first_word_ms = None
+            max_tokens = VOCAB_FORMAT.max_tokens(items)
+            async for delta in stream_qwen_vision(image_b64, VOCAB_FORMAT.prompt, prepared.media_type, max_tokens):
+                text_parts.append(delta)
+                for item in parser.feed(delta):
+                    if first_word_ms is None:
+                        first_word_ms = elapsed_ms()
+                    yield format_stream_event("word", {"index": len(parser.items) - 1, "word": item}, "sse")
+            
+            # Final parse of the whole completion; fall back to what we streamed
+            text = "".join(text_parts)
+            result = (VOCAB_FORMAT.expand and VOCAB_FORMAT.expand(text)) or parse_vision_content(text)
+            partial = not (isinstance(result, dict) and "vocabulary" in result) or bool(result.get("partial"))
+            if partial and max_tokens:
+                logger.warning(f"Compact stream truncated at sized max_tokens={max_tokens}")
+            if isinstance(result, dict) and "vocabulary" in result and len(result["vocabulary"]) >= len(parser.items):
+                vocabulary = result["vocabulary"]
+            else:
+                vocabulary = parser.items
+            if not partial:
+                await ocr_cache.set(cache_key, result)
+            
+            logger.info(f"OCR stream: first word {first_word_ms} ms, total {elapsed_ms()} ms")
+            yield format_stream_event("done", {
+                "success": True,
+                "vocabulary": vocabulary,
+                "cached": False,
+                "partial": partial,
+                "image": prepared.stats(),
+                "time_to_first_word_ms": first_word_ms,
+                "elapsed_ms": elapsed_ms(),
+                "prewarm_job_id": prewarm_vocabulary(vocabulary) if prewarm else None
+            }, "sse")
+        except Exception as e:
+            logger.error(f"OCR stream error: {e}")
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            yield format_stream_event("error", {"success": False, "error": detail}, "sse")
+    
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+@app.post("/ocr/extract-vocab/batch")
+async def extract_vocabulary_batch(files: List[UploadFile] = File(...), format: str = "ndjson",
+                                   prewarm: bool = PREWARM_ON_OCR):
+    """
+    Extract vocabulary from several pages concurrently.
+
+    Streams one `page` event per image as soon as it finishes (NDJSON by
+    default, `?format=sse` for Server-Sent Events), then a final `done`
+    event with the merged, de-duplicated vocabulary.
+    """
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or sse")
+    if len(files) > OCR_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Max {OCR_BATCH_MAX_FILES} files per batch")
+    for f in files:
+        if not f.content_type.startswith("image/"):
+            raise HTTPException(status_code=400, detail=f"Image only: {f.filename}")
+    
+    # Read everything before streaming starts (uploads are closed afterwards)
+    with phase("read"):
+        pages = [(f.filename, f.content_type, await read_upload(f)) for f in files]
+    semaphore = asyncio.Semaphore(OCR_BATCH_CONCURRENCY)
+    
+    async def process(index: int, filename: str, content_type: str, contents: bytes) -> Dict:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                result = await run_extract_vocab(contents, content_type)
+            except Exception as e:
+                logger.error(f"Batch page {index} ({filename}) failed: {e}")
+                result = {"success": False, "vocabulary": [], "error": str(e)}
+            result["elapsed_ms"] = round((time.perf_counter() - started) * 1000)
+            return {"index": index, "filename": filename, **result}
+    
+    async def stream():
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(process(i, *page)) for i, page in enumerate(pages)]
+        results: List[Optional[Dict]] = [None] * len(tasks)
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                page_result = await next_done
+                results[page_result["index"]] = page_result
+                yield format_stream_event("page", page_result, format)
+            
+            # Merge in page order, not completion order
+            merged = merge_vocabulary(r["vocabulary"] for r in results if r)
+            yield format_stream_event("done", {
+                "success": True,
+                "pages": len(results),
+                "failed": sum(1 for r in results if r and not r["success"]),
+                "vocabulary": merged,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000),
+                "prewarm_job_id": prewarm_vocabulary(merged) if prewarm else None
+            }, format)
+        finally:
+            # Client went away → stop paying for the remaining pages
+            for task in tasks:
+                task.cancel()
+    
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(stream(), media_type=media_type)
+
 
 # 2. Image Generation (Z-Image-Turbo / Wanx)
 @app.post("/generate-image")
 async def generate_image(req: ImageGenRequest):
     """
     Generate image for a word using Wanx-v1.
+    
+    Kept for existing clients: submits a job and waits for it. New clients
+    should use /generate-image/jobs and poll instead of holding the request.
     """
     word = req.word.strip().lower()
-    filename = f"{word}.png"
-    local_path = IMAGES_DIR / filename
-    local_url = f"/images/{filename}"
+    job = submit_image_job(word, req.force)
+    if job.cached:
+        return {"url": job.url, "cached": True}
+    
+    await job.wait_done(IMAGE_SYNC_WAIT)
+    if job.status == SUCCEEDED:
+        return {"url": job.url, "cached": False}
+    
+    logger.error(f"Image gen error: {job.error or 'still running'} ({word})")
+    return {"url": f"https://placehold.co/400x400?text={word}", "fallback": True, "job_id": job.id}
 
-    if not req.force and local_path.exists():
-        return {"url": local_url, "cached": True}
+@app.post("/generate-image/jobs")
+async def create_image_job(req: ImageGenRequest):
+    """Submit an illustration job; returns at once with a job id"""
+    job = submit_image_job(req.word.strip().lower(), req.force)
+    return job.to_dict()
+
+@app.post("/generate-image/jobs/batch")
+async def create_image_jobs(req: ImageJobBatchRequest):
+    """Submit illustration jobs for a whole word list"""
+    words = dict.fromkeys(w.strip().lower() for w in req.words if w.strip())
+    return {"jobs": [submit_image_job(word, req.force).to_dict() for word in words]}
+
+@app.get("/generate-image/jobs/{job_id}")
+async def get_image_job_status(job_id: str, wait: float = 0):
+    """Job status; `?wait=N` long-polls up to N seconds (max 30) for completion"""
+    job = get_image_job(job_id)
+    if wait > 0 and not job.done:
+        await job.wait_done(min(wait, IMAGE_JOB_MAX_WAIT))
+    return job.to_dict()
 
-    api_url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text2image/image-synthesis"
+@app.get("/generate-image/jobs/{job_id}/events")
+async def image_job_events(job_id: str):
+    """Server-Sent Events: one `progress` event per change, then `done`"""
+    job = get_image_job(job_id)
     
-    payload = {
-        "model": "wanx-v1",
-        "input": {
-            "prompt": f"Cartoon illustration of {word}, cute style, white background, for kids education, simple, colorful"
-        },
-        "parameters": {
-            "style": "<auto>",
-            "size": "1024*1024",
-            "n": 1
-        }
-    }
+    async def stream():
+        while not job.done:
+            yield format_stream_event("progress", job.to_dict(), "sse")
+            await job.wait_changed(IMAGE_JOB_MAX_WAIT)
+        yield format_stream_event("done", job.to_dict(), "sse")
     
-    try:
-        headers = {
-            "Authorization": f"Bearer {DASHSCOPE_API_KEY}",
-            "Content-Type": "application/json",
-            "X-DashScope-Async": "enable"
-        }
-        
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            # Start Task
-            resp = await client.post(api_url, headers=headers, json=payload)
-            data = resp.json()
-            
-            if "output" not in data or "task_id" not in data["output"]:
-                 raise HTTPException(500, f"Failed to start gen task: {data}")
-            
-            task_id = data["output"]["task_id"]
-            
-            # Poll for result (max 30s)
-            for _ in range(10):
-                await asyncio.sleep(2)
-                task_url = f"https://dashscope.aliyuncs.com/api/v1/tasks/{task_id}"
-                task_resp = await client.get(task_url, headers=headers)
-                task_data = task_resp.json()
-                
-                if task_data["output"]["task_status"] == "SUCCEEDED":
-                    img_url = task_data["output"]["results"][0]["url"]
-                    await download_file(img_url, local_path)
-                    return {"url": local_url, "cached": False}
-                
-                if task_data["output"]["task_status"] == "FAILED":
-                    raise HTTPException(500, "Generation failed")
-            
-            raise HTTPException(504, "Generation timed out")
-
-    except Exception as e:
-        logger.error(f"Image gen error: {e}")
-        return {"url": f"https://placehold.co/400x400?text={word}", "fallback": True}
+    return StreamingResponse(stream(), media_type="text/event-stream")
 
 
 # 3. TTS (CosyVoice)
-@app.post("/tts")
-async def text_to_speech(req: TTSRequest):
-    """
-    Generate speech using CosyVoice.
-    """
-    text_hash = hashlib.md5(f"{req.text}-{req.speed}".encode()).hexdigest()
+tts_flights = SingleFlight("tts")
+
+def tts_paths(text: str, speed: float):
+    """Local file path and public URL of the cached audio for (text, speed)"""
+    text_hash = hashlib.md5(f"{text}-{speed}".encode()).hexdigest()
     filename = f"{text_hash}.mp3"
-    local_path = AUDIO_DIR / filename
-    local_url = f"/audio/{filename}"
-    
-    if local_path.exists():
-        return {"url": local_url, "cached": True}
+    return AUDIO_DIR / filename, f"/audio/{filename}"
 
-    api_url = "https://dashscope.aliyuncs.com/api/v1/services/audio/tts/generation"
-    
-    payload = {
+def tts_payload(text: str, speed: float) -> Dict:
+    return {
         "model": "cosyvoice-v1",
         "input": {
-            "text": req.text
+            "text": text
         },
         "parameters": {
             "voice": "longxiaochun",
             "format": "mp3",
             "sample_rate": 22050,
             "volume": 50,
-            "rate": req.speed
+            "rate": speed
         }
     }
+
+async def synthesize_speech(text: str, speed: float, local_path: Path):
+    """Call CosyVoice and write the MP3 atomically to `local_path`"""
+    headers = {
+        "Authorization": f"Bearer {DASHSCOPE_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    
+    client = get_client(DASHSCOPE_TTS_API)
+    resp = await get_upstream("cosyvoice", DASHSCOPE_API_KEY).call(
+        lambda: client.post(DASHSCOPE_TTS_API, headers=headers, json=tts_payload(text, speed), timeout=30.0),
+        model="cosyvoice-v1"
+    )
+    
+    if resp.status_code == 200:
+        if resp.headers.get("content-type") == "audio/mpeg":
+            await asyncio.to_thread(atomic_write_bytes, local_path, resp.content)
+            await audio_cache.add(local_path.name, len(resp.content))
+        else:
+            data = resp.json()
+            raise HTTPException(500, f"TTS API Error: {data}")
+    else:
+         raise HTTPException(resp.status_code, f"TTS API Error: {resp.text}")
+
+async def stream_speech(text: str, speed: float, local_path: Path, sink: asyncio.Queue):
+    """
+    Stream CosyVoice audio into `local_path`, mirroring every chunk into `sink`
+    
+    The file is written to a temp path and renamed when complete; `None` is
+    put on `sink` when the stream ends (successfully or not).
+    """
+    headers = {
+        "Authorization": f"Bearer {DASHSCOPE_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    tmp_path = temp_path_for(local_path)
+    size = 0
     
     try:
-        headers = {
-            "Authorization": f"Bearer {DASHSCOPE_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(api_url, headers=headers, json=payload)
+        client = get_client(DASHSCOPE_TTS_API)
+        resp = await get_upstream("cosyvoice", DASHSCOPE_API_KEY).call(
+            lambda: client.send(
+                client.build_request("POST", DASHSCOPE_TTS_API, headers=headers,
+                                     json=tts_payload(text, speed), timeout=30.0),
+                stream=True
+            ),
+            model="cosyvoice-v1"
+        )
+        try:
+            if resp.status_code != 200:
+                body = await resp.aread()
+                raise HTTPException(resp.status_code, f"TTS API Error: {body.decode('utf-8', 'replace')}")
+            if resp.headers.get("content-type") != "audio/mpeg":
+                body = await resp.aread()
+                raise HTTPException(500, f"TTS API Error: {body.decode('utf-8', 'replace')}")
             
-            if resp.status_code == 200:
-                if resp.headers.get("content-type") == "audio/mpeg":
-                    with open(local_path, "wb") as f:
-                        f.write(resp.content)
-                    return {"url": local_url, "cached": False}
-                else:
-                    data = resp.json()
-                    raise HTTPException(500, f"TTS API Error: {data}")
-            else:
-                 raise HTTPException(resp.status_code, f"TTS API Error: {resp.text}")
+            with open(tmp_path, "wb") as f:
+                async for chunk in resp.aiter_bytes():
+                    f.write(chunk)
+                    size += len(chunk)
+                    sink.put_nowait(chunk)
+        finally:
+            await resp.aclose()
+        os.replace(tmp_path, local_path)
+        await audio_cache.add(local_path.name, size)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    finally:
+        sink.put_nowait(None)
 
+@app.post("/tts")
+async def text_to_speech(req: TTSRequest):
+    """
+    Generate speech using CosyVoice.
+    
+    Concurrent requests for the same text share one upstream call.
+    """
+    local_path, local_url = tts_paths(req.text, req.speed)
+    
+    if audio_cache.lookup(local_path.name):
+        return {"url": local_url, "cached": True}
+
+    try:
+        await tts_flights.do(
+            local_path.name,
+            lambda: synthesize_speech(req.text, req.speed, local_path)
+        )
+        return {"url": local_url, "cached": False}
+
+    except CircuitOpenError as e:
+        raise circuit_open_exception(e)
     except Exception as e:
         logger.error(f"TTS error: {e}")
         raise HTTPException(500, str(e))
 
+@app.get("/tts/stream")
+async def text_to_speech_stream(text: str, speed: float = 1.0):
+    """
+    Stream speech audio directly (usable as an <audio> src).
+    
+    Cache hits are served from disk. On a miss, upstream bytes are piped to
+    the client as they arrive and written to the cache at the same time; the
+    cache file is completed even if the client stops listening.
+    """
+    local_path, _ = tts_paths(text, speed)
+    if audio_cache.lookup(local_path.name):
+        return FileResponse(local_path, media_type="audio/mpeg", headers={"X-Cache": "HIT"})
+    
+    sink: asyncio.Queue = asyncio.Queue()
+    flight, leader = tts_flights.start(
+        local_path.name,
+        lambda: stream_speech(text, speed, local_path, sink)
+    )
+    
+    if not leader:
+        # Someone else is already synthesizing this text: wait for the file
+        try:
+            await asyncio.shield(flight)
+        except CircuitOpenError as e:
+            raise circuit_open_exception(e)
+        except Exception as e:
+            raise HTTPException(500, f"TTS error: {e}")
+        return FileResponse(local_path, media_type="audio/mpeg", headers={"X-Cache": "HIT"})
+    
+    # Wait for the first chunk so upstream errors still become a proper status code
+    first = await sink.get()
+    if first is None:
+        try:
+            await asyncio.shield(flight)
+        except HTTPException:
+            raise
+        except CircuitOpenError as e:
+            raise circuit_open_exception(e)
+        except Exception as e:
+            raise HTTPException(500, f"TTS error: {e}")
+        return FileResponse(local_path, media_type="audio/mpeg", headers={"X-Cache": "MISS"})
+    
+    async def body():
+        chunk = first
+        while chunk is not None:
+            yield chunk
+            chunk = await sink.get()
+    
+    return StreamingResponse(body(), media_type="audio/mpeg", headers={"X-Cache": "MISS"})
+
+# 4. Pre-warming (audio + illustrations ahead of play)
+async def tts_generate(text: str):
+    local_path, _ = tts_paths(text, 1.0)
+    await tts_flights.do(local_path.name, lambda: synthesize_speech(text, 1.0, local_path))
+
+async def image_generate(word: str):
+    job = submit_image_job(word.strip().lower())
+    while not job.done:
+        await job.wait_changed(IMAGE_JOB_MAX_WAIT)
+    if job.status != SUCCEEDED:
+        raise RuntimeError(job.error or "image generation failed")
+
+prewarm_scheduler = PrewarmScheduler({
+    "tts": Warmer(
+        is_cached=lambda text: tts_paths(text, 1.0)[0].name in audio_cache,
+        generate=tts_generate,
+        rate=PREWARM_TTS_RATE,
+        concurrency=PREWARM_TTS_CONCURRENCY
+    ),
+    "image": Warmer(
+        is_cached=lambda word: image_paths(word.strip().lower())[0].name in image_cache,
+        generate=image_generate,
+        rate=PREWARM_IMAGE_RATE,
+        concurrency=PREWARM_IMAGE_CONCURRENCY
+    ),
+})
+
+@app.on_event("startup")
+async def start_prewarm():
+    prewarm_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_prewarm():
+    await prewarm_scheduler.stop()
+
+async def fetch_word_set_words(word_set_id: int) -> List[str]:
+    """English words of a word set in play order (via PostgREST get_word_set_details)"""
+    url = f"{POSTGREST_URL}/rpc/get_word_set_details"
+    client = get_client(url)
+    resp = await client.post(url, json={"p_word_set_id": word_set_id})
+    if resp.status_code != 200:
+        raise HTTPException(502, f"PostgREST error: {resp.text}")
+    rows = sorted(resp.json(), key=lambda r: r.get("order_num") or 0)
+    return [r["english"] for r in rows if r.get("english")]
+
+def start_prewarm_job(words: List[str], tts: bool = True, images: bool = True,
+                      source: Optional[str] = None):
+    """Queue pre-warming for words (in play order); None when there is nothing to do"""
+    # 唔好 lowercase：TTS cache key 係 /tts 收到嘅原文，image 嗰邊自己 normalise
+    words = list(dict.fromkeys(w for w in words if isinstance(w, str) and w.strip()))
+    kinds = [kind for kind, enabled in (("tts", tts), ("image", images)) if enabled]
+    if not words or not kinds:
+        return None
+    job = prewarm_scheduler.submit(words, kinds, source)
+    logger.info(f"Prewarm {job.id}: {len(words)} words ({', '.join(kinds)}) from {source}")
+    return job
+
+def prewarm_vocabulary(vocabulary: List[Dict]) -> Optional[str]:
+    """Auto pre-warm after an OCR import, return the job id"""
+    # Model 有時會俾 string / null 做 item，唔好因為 prewarm 令成功嘅 OCR 變 500
+    job = start_prewarm_job([item.get("english", "") for item in vocabulary if isinstance(item, dict)],
+                            source="ocr")
+    return job.id if job else None
+
+@app.post("/prewarm")
+async def create_prewarm_job(req: PrewarmRequest):
+    """
+    Pre-generate TTS audio and illustrations for a word set or a word list.
+    
+    Runs in the background in play order; poll /prewarm/{job_id} for progress.
+    """
+    if req.word_set_id is None and not req.words:
+        raise HTTPException(400, "word_set_id or words required")
+    
+    words = list(req.words or [])
+    source = "words"
+    if req.word_set_id is not None:
+        words = await fetch_word_set_words(req.word_set_id) + words
+        source = f"word_set:{req.word_set_id}"
+    
+    job = start_prewarm_job(words, req.tts, req.images, source)
+    if job is None:
+        raise HTTPException(400, "Nothing to pre-warm")
+    return job.to_dict()
+
+@app.get("/prewarm/{job_id}")
+async def get_prewarm_job(job_id: str, wait: float = 0):
+    """Pre-warm progress; `?wait=N` long-polls up to N seconds (max 30) for completion"""
+    job = prewarm_scheduler.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    if wait > 0 and not job.done:
+        await job.wait_done(min(wait, PREWARM_MAX_WAIT))
+    return job.to_dict()
+
+
+# 5. Bulk DB writes (direct asyncpg pool / PostgREST fallback)
+@app.post("/words/bulk")
+async def bulk_upsert_words(req: WordsBulkRequest):
+    """
+    Insert many words in one go, skipping existing English (case-insensitive).
+    
+    Large batches are COPY'd into the database when DATABASE_URL is set.
+    """
+    try:
+        with phase("db"):
+            result = await db.upsert_words(req.words)
+    except DatabaseError as e:
+        logger.error(f"Bulk word upsert failed: {e}")
+        raise HTTPException(502, str(e))
+    return {**result, "path": db.stats()["path"]}
+
+@app.post("/learning-records/bulk")
+async def bulk_insert_learning_records(req: LearningRecordsBulkRequest):
+    """Flush a batch of learning records (COPY on the direct path)"""
+    try:
+        with phase("db"):
+            inserted = await db.insert_learning_records(req.records)
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(400, f"Invalid record: {e}")
+    except DatabaseError as e:
+        logger.error(f"Learning record flush failed: {e}")
+        raise HTTPException(502, str(e))
+    return {"inserted": inserted, "path": db.stats()["path"]}
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=3002)
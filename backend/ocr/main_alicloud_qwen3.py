@@ -5,11 +5,19 @@ SpellQuest OCR Service (AliCloud Qwen3-VL)
 
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-import httpx
 import base64
 import os
 from typing import List, Dict, Any
-import json
+
+from metrics import setup_metrics
+from json_extract import extract_json
+from timing import phase, setup_timing
+from uploads import read_upload, setup_uploads
+from http_client import get_client, setup_http_client
+from ocr_cache import OCRCache, image_digest, make_cache_key
+from image_preprocess import prepare_image
+import db
+from db import setup_database
 
 app = FastAPI(
     title="SpellQuest OCR Service (AliCloud Qwen3-VL)",
@@ -26,14 +34,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Prometheus /metrics + per-route latency
+setup_metrics(app)
+# Server-Timing phases + admin-only profiling (X-Profile)
+setup_timing(app)
+# Upload size cap (413) + spooling large files to disk
+setup_uploads(app)
+
 # AliCloud Model Studio API
 # Singapore region (default)
 ALICLOUD_API = "https://dashscope-intl.aliyuncs.com/compatible-mode/v1/chat/completions"
 DASHSCOPE_API_KEY = os.environ.get("DASHSCOPE_API_KEY")
+QWEN3_VL_MODEL = "qwen3-vl-plus"
+
+# PostgREST (OCR 結果自動儲存)
+POSTGREST_URL = os.environ.get("POSTGREST_URL", "http://192.168.139.142:3001")
 
 if not DASHSCOPE_API_KEY:
     raise ValueError("DASHSCOPE_API_KEY 環境變數未設定！")
 
+# Pooled upstream client (keep-alive across requests)
+setup_http_client(app, ALICLOUD_API, POSTGREST_URL)
+
+# Direct PostgreSQL pool when DATABASE_URL is set (PostgREST otherwise)
+setup_database(app)
+
+# OCR result cache (image SHA-256 + prompt version + model)
+ocr_cache = OCRCache()
+
 
 @app.get("/")
 async def root():
@@ -41,7 +69,7 @@ async def root():
     return {
         "status": "ok",
         "service": "SpellQuest OCR (AliCloud Qwen3-VL)",
-        "model": "qwen3-vl-plus"
+        "model": QWEN3_VL_MODEL
     }
 
 
@@ -54,16 +82,18 @@ async def ocr_upload(file: UploadFile = File(...)):
     {
         "text": "識別的原始文字",
         "words": ["詞語1", "詞語2", ...],
-        "lines": ["第一行", "第二行", ...]
+        "lines": ["第一行", "第二行", ...],
+        "cached": false
     }
     """
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="只接受圖片檔案")
     
     try:
-        # Read and encode image
-        contents = await file.read()
-        image_b64 = base64.b64encode(contents).decode('utf-8')
+        # Read image, check cache before encoding
+        with phase("read"):
+            contents = await read_upload(file)
+        image_sha256 = image_digest(contents)
         
         # Call Qwen3-VL API
         prompt = """
@@ -77,10 +107,25 @@ async def ocr_upload(file: UploadFile = File(...)):
 }
 """
         
-        result = await call_qwen3_vl(image_b64, prompt)
+        cache_key = make_cache_key(image_sha256, prompt, QWEN3_VL_MODEL)
+        cached = await ocr_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, "cached": True}
+        
+        with phase("preprocess"):
+            prepared = await prepare_image(contents, file.content_type)
+        with phase("encode"):
+            image_b64 = base64.b64encode(prepared.data).decode('utf-8')
+        with phase("upstream"):
+            result = await call_qwen3_vl(image_b64, prompt, prepared.media_type)
+        if not (isinstance(result, dict) and result.get("partial")):
+            await ocr_cache.set(cache_key, result)
         
-        return result
+        return {**result, "cached": False, "image": prepared.stats()}
         
+    except HTTPException:
+        # Keep 4xx (e.g. 413 upload too large) instead of turning it into 500
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OCR 處理失敗: {str(e)}")
 
@@ -102,16 +147,19 @@ async def ocr_extract_vocab(file: UploadFile = File(...)):
             "created": [...],
             "skipped": [...],
             "errors": []
-        }
+        },
+        "cached": false,
+        "partial": false   # true = reply cut off by max_tokens: not cached, not saved
     }
     """
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="只接受圖片檔案")
     
     try:
-        # Read and encode image
-        contents = await file.read()
-        image_b64 = base64.b64encode(contents).decode('utf-8')
+        # Read image, check cache before encoding
+        with phase("read"):
+            contents = await read_upload(file)
+        image_sha256 = image_digest(contents)
         
         # Call Qwen3-VL API with updated prompt (NO PINYIN)
         prompt = """
@@ -145,18 +193,42 @@ async def ocr_extract_vocab(file: UploadFile = File(...)):
 - 不要拼音
 """
         
-        result = await call_qwen3_vl(image_b64, prompt)
+        cache_key = make_cache_key(image_sha256, prompt, QWEN3_VL_MODEL)
+        result = await ocr_cache.get(cache_key)
+        cached = result is not None
+        image_stats = None
+        if not cached:
+            with phase("preprocess"):
+                prepared = await prepare_image(contents, file.content_type)
+            with phase("encode"):
+                image_b64 = base64.b64encode(prepared.data).decode('utf-8')
+            with phase("upstream"):
+                result = await call_qwen3_vl(image_b64, prompt, prepared.media_type)
+            if not result.get("partial"):
+                await ocr_cache.set(cache_key, result)
+            image_stats = prepared.stats()
         vocabulary = result.get("vocabulary", [])
+        partial = bool(result.get("partial"))
         
-        # Auto-save to DB via PostgREST
-        saved_results = await save_vocabulary_to_db(vocabulary)
+        # Auto-save to DB via PostgREST (not a truncated list: the user re-uploads / retries instead)
+        if partial:
+            saved_results = {"created": [], "skipped": [], "errors": []}
+        else:
+            with phase("db"):
+                saved_results = await save_vocabulary_to_db(vocabulary)
         
         return {
             "success": True,
             "vocabulary": vocabulary,
-            "saved": saved_results
+            "saved": saved_results,
+            "cached": cached,
+            "partial": partial,
+            "image": image_stats
         }
         
+    except HTTPException:
+        # Keep 4xx (e.g. 413 upload too large) instead of turning it into 500
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"詞語提取失敗: {str(e)}")
 
@@ -164,7 +236,10 @@ async def ocr_extract_vocab(file: UploadFile = File(...)):
 async def save_vocabulary_to_db(vocabulary: List[Dict]) -> Dict[str, List]:
     """
     Save vocabulary to PostgreSQL via PostgREST
-    Skip duplicates based on english field
+    Skip duplicates based on english field (case-insensitive)
+    
+    One bulk upsert per extraction instead of a GET + POST per word
+    (direct asyncpg pool when DATABASE_URL is set, PostgREST otherwise).
     
     Args:
         vocabulary: List of {english: str, chinese: str}
@@ -172,141 +247,92 @@ async def save_vocabulary_to_db(vocabulary: List[Dict]) -> Dict[str, List]:
     Returns:
         {
             "created": [saved_words],
-            "skipped": [{english, reason}],
+            "skipped": [{english, reason, id}],
             "errors": [{english, error}]
         }
     """
-    POSTGREST_URL = "http://192.168.139.142:3001/words"
-    
-    results = {
-        "created": [],
-        "skipped": [],
-        "errors": []
-    }
-    
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        for word in vocabulary:
-            try:
-                english = word.get("english", "").strip()
-                chinese = word.get("chinese", "").strip()
-                
-                if not english:
-                    continue
-                
-                # Check if word exists
-                check_response = await client.get(
-                    f"{POSTGREST_URL}?english=eq.{english}"
-                )
-                
-                if check_response.status_code == 200:
-                    existing = check_response.json()
-                    
-                    if existing and len(existing) > 0:
-                        # Word exists, skip
-                        results["skipped"].append({
-                            "english": english,
-                            "reason": "already exists",
-                            "id": existing[0].get("id")
-                        })
-                        continue
-                
-                # Insert new word
-                insert_response = await client.post(
-                    POSTGREST_URL,
-                    headers={
-                        "Content-Type": "application/json",
-                        "Prefer": "return=representation"
-                    },
-                    json={
-                        "english": english,
-                        "chinese": chinese,
-                        "pinyin": "",  # Empty string (not null)
-                        "category": "custom",
-                        "grade": None
-                    }
-                )
-                
-                if insert_response.status_code == 201:
-                    created_word = insert_response.json()[0]
-                    results["created"].append(created_word)
-                else:
-                    results["errors"].append({
-                        "english": english,
-                        "error": f"HTTP {insert_response.status_code}: {insert_response.text}"
-                    })
-                    
-            except Exception as e:
-                results["errors"].append({
-                    "english": word.get("english", "unknown"),
-                    "error": str(e)
-                })
+    words = [
+        {
+            "english": str(word.get("english") or "").strip(),
+            "chinese": str(word.get("chinese") or "").strip(),
+            "pinyin": "",  # Empty string (not null)
+            "category": "custom",
+            "grade": None
+        }
+        for word in vocabulary
+        if str(word.get("english") or "").strip()
+    ]
+    if not words:
+        return {"created": [], "skipped": [], "errors": []}
     
-    return results
+    try:
+        return await db.upsert_words(words, POSTGREST_URL)
+    except Exception as e:
+        return {"created": [], "skipped": [], "errors": [{"english": w["english"], "error": str(e)} for w in words]}
 
 
-async def call_qwen3_vl(image_b64: str, prompt: str) -> Dict[str, Any]:
+async def call_qwen3_vl(image_b64: str, prompt: str, media_type: str = "image/jpeg") -> Dict[str, Any]:
     """
     Call AliCloud Qwen3-VL Vision API
     
     Args:
         image_b64: Base64 encoded image
         prompt: Text prompt
+        media_type: Image MIME type (image/jpeg, image/webp, etc.)
         
     Returns:
         Parsed JSON response from Qwen3-VL
     """
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            ALICLOUD_API,
-            headers={
-                "Authorization": f"Bearer {DASHSCOPE_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "qwen3-vl-plus",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_b64}"
-                                }
-                            },
-                            {
-                                "type": "text",
-                                "text": prompt
+    client = get_client(ALICLOUD_API)
+    response = await client.post(
+        ALICLOUD_API,
+        headers={
+            "Authorization": f"Bearer {DASHSCOPE_API_KEY}",
+            "Content-Type": "application/json"
+        },
+        json={
+            "model": QWEN3_VL_MODEL,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:{media_type};base64,{image_b64}"
                             }
-                        ]
-                    }
-                ],
-                "temperature": 0.1,
-                "max_tokens": 4000
-            }
+                        },
+                        {
+                            "type": "text",
+                            "text": prompt
+                        }
+                    ]
+                }
+            ],
+            "temperature": 0.1,
+            "max_tokens": 4000
+        }
+    )
+    
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=f"Qwen3-VL API 錯誤: {response.text}"
         )
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Qwen3-VL API 錯誤: {response.text}"
-            )
-        
-        data = response.json()
-        
-        # Extract content from Qwen3-VL response
-        content = data["choices"][0]["message"]["content"]
-        
-        # Parse JSON from content
-        # Qwen may wrap JSON in markdown code blocks
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0].strip()
-        
-        result = json.loads(content)
-        
-        return result
+    
+    data = response.json()
+    
+    # Extract content from Qwen3-VL response
+    content = data["choices"][0]["message"]["content"]
+    
+    # Parse JSON from content
+    # Qwen may wrap JSON in markdown code blocks, add text around it, or get cut off by max_tokens
+    result, repaired = extract_json(content, expect=dict)
+    if repaired and isinstance(result, dict):
+        # Cut off by max_tokens: trailing items are missing, don't cache / save it as the full list
+        result["partial"] = True
+    
+    return result
 
 
 @app.get("/health")
@@ -319,7 +345,7 @@ async def health_check():
         
         return {
             "status": "healthy",
-            "model": "qwen3-vl-plus",
+            "model": QWEN3_VL_MODEL,
             "provider": "AliCloud Model Studio",
             "region": "Singapore (ap-southeast-1)"
         }
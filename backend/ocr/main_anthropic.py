@@ -5,11 +5,16 @@ SpellQuest OCR Service (Anthropic Claude)
 
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-import httpx
 import base64
 import os
 from typing import List, Dict, Any
-import json
+
+from metrics import setup_metrics
+from json_extract import extract_json
+from timing import setup_timing
+from uploads import read_upload, setup_uploads
+from http_client import get_client, setup_http_client
+from image_preprocess import prepare_image
 
 app = FastAPI(
     title="SpellQuest OCR Service (Anthropic Claude)",
@@ -26,6 +31,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Prometheus /metrics + per-route latency
+setup_metrics(app)
+# Server-Timing phases + admin-only profiling (X-Profile)
+setup_timing(app)
+# Upload size cap (413) + spooling large files to disk
+setup_uploads(app)
+
 # Anthropic API
 ANTHROPIC_API = "https://api.anthropic.com/v1/messages"
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
@@ -33,6 +45,9 @@ ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
 if not ANTHROPIC_API_KEY:
     raise ValueError("ANTHROPIC_API_KEY 環境變數未設定！")
 
+# Pooled upstream client (keep-alive across requests)
+setup_http_client(app, ANTHROPIC_API)
+
 
 @app.get("/")
 async def root():
@@ -61,11 +76,12 @@ async def ocr_upload(file: UploadFile = File(...)):
     
     try:
         # Read and encode image
-        contents = await file.read()
-        image_b64 = base64.b64encode(contents).decode('utf-8')
+        contents = await read_upload(file)
+        prepared = await prepare_image(contents, file.content_type)
+        image_b64 = base64.b64encode(prepared.data).decode('utf-8')
         
         # Detect media type
-        media_type = file.content_type or "image/jpeg"
+        media_type = prepared.media_type
         
         # Call Claude API
         prompt = """
@@ -83,6 +99,9 @@ async def ocr_upload(file: UploadFile = File(...)):
         
         return result
         
+    except HTTPException:
+        # Keep 4xx (e.g. 413 upload too large) instead of turning it into 500
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OCR 處理失敗: {str(e)}")
 
@@ -106,11 +125,12 @@ async def ocr_extract_vocab(file: UploadFile = File(...)):
     
     try:
         # Read and encode image
-        contents = await file.read()
-        image_b64 = base64.b64encode(contents).decode('utf-8')
+        contents = await read_upload(file)
+        prepared = await prepare_image(contents, file.content_type)
+        image_b64 = base64.b64encode(prepared.data).decode('utf-8')
         
         # Detect media type
-        media_type = file.content_type or "image/jpeg"
+        media_type = prepared.media_type
         
         # Call Claude API with structured prompt
         prompt = """
@@ -146,6 +166,9 @@ async def ocr_extract_vocab(file: UploadFile = File(...)):
         
         return result
         
+    except HTTPException:
+        # Keep 4xx (e.g. 413 upload too large) instead of turning it into 500
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"詞語提取失敗: {str(e)}")
 
@@ -162,61 +185,58 @@ async def call_claude_vision(image_b64: str, media_type: str, prompt: str) -> Di
     Returns:
         Parsed JSON response from Claude
     """
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            ANTHROPIC_API,
-            headers={
-                "x-api-key": ANTHROPIC_API_KEY,
-                "anthropic-version": "2023-06-01",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "claude-3-5-sonnet-20241022",
-                "max_tokens": 4000,
-                "temperature": 0.1,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": media_type,
-                                    "data": image_b64
-                                }
-                            },
-                            {
-                                "type": "text",
-                                "text": prompt
+    client = get_client(ANTHROPIC_API)
+    response = await client.post(
+        ANTHROPIC_API,
+        headers={
+            "x-api-key": ANTHROPIC_API_KEY,
+            "anthropic-version": "2023-06-01",
+            "Content-Type": "application/json"
+        },
+        json={
+            "model": "claude-3-5-sonnet-20241022",
+            "max_tokens": 4000,
+            "temperature": 0.1,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "image",
+                            "source": {
+                                "type": "base64",
+                                "media_type": media_type,
+                                "data": image_b64
                             }
-                        ]
-                    }
-                ]
-            }
+                        },
+                        {
+                            "type": "text",
+                            "text": prompt
+                        }
+                    ]
+                }
+            ]
+        }
+    )
+    
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=f"Claude API 錯誤: {response.text}"
         )
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Claude API 錯誤: {response.text}"
-            )
-        
-        data = response.json()
-        
-        # Extract content from Claude response
-        content = data["content"][0]["text"]
-        
-        # Parse JSON from content
-        # Claude may wrap JSON in markdown code blocks
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0].strip()
-        
-        result = json.loads(content)
-        
-        return result
+    
+    data = response.json()
+    
+    # Extract content from Claude response
+    content = data["content"][0]["text"]
+    
+    # Parse JSON from content
+    # Claude may wrap JSON in markdown code blocks, add text around it, or get cut off by max_tokens
+    result, repaired = extract_json(content, expect=dict)
+    if repaired and isinstance(result, dict):
+        result["partial"] = True
+    
+    return result
 
 
 @app.get("/health")
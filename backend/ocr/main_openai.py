@@ -5,11 +5,16 @@ SpellQuest OCR Service (OpenAI GPT-4o Vision)
 
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-import httpx
 import base64
 import os
 from typing import List, Dict, Any
-import json
+
+from metrics import setup_metrics
+from json_extract import extract_json
+from timing import setup_timing
+from uploads import read_upload, setup_uploads
+from http_client import get_client, setup_http_client
+from image_preprocess import prepare_image
 
 app = FastAPI(
     title="SpellQuest OCR Service (OpenAI GPT-4o)",
@@ -26,6 +31,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Prometheus /metrics + per-route latency
+setup_metrics(app)
+# Server-Timing phases + admin-only profiling (X-Profile)
+setup_timing(app)
+# Upload size cap (413) + spooling large files to disk
+setup_uploads(app)
+
 # OpenAI API
 OPENAI_API = "https://api.openai.com/v1/chat/completions"
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
@@ -33,6 +45,9 @@ OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY 環境變數未設定！")
 
+# Pooled upstream client (keep-alive across requests)
+setup_http_client(app, OPENAI_API)
+
 
 @app.get("/")
 async def root():
@@ -61,8 +76,9 @@ async def ocr_upload(file: UploadFile = File(...)):
     
     try:
         # Read and encode image
-        contents = await file.read()
-        image_b64 = base64.b64encode(contents).decode('utf-8')
+        contents = await read_upload(file)
+        prepared = await prepare_image(contents, file.content_type)
+        image_b64 = base64.b64encode(prepared.data).decode('utf-8')
         
         # Call OpenAI API
         prompt = """
@@ -76,10 +92,13 @@ async def ocr_upload(file: UploadFile = File(...)):
 }
 """
         
-        result = await call_gpt4o_vision(image_b64, prompt)
+        result = await call_gpt4o_vision(image_b64, prompt, prepared.media_type)
         
         return result
         
+    except HTTPException:
+        # Keep 4xx (e.g. 413 upload too large) instead of turning it into 500
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OCR 處理失敗: {str(e)}")
 
@@ -103,8 +122,9 @@ async def ocr_extract_vocab(file: UploadFile = File(...)):
     
     try:
         # Read and encode image
-        contents = await file.read()
-        image_b64 = base64.b64encode(contents).decode('utf-8')
+        contents = await read_upload(file)
+        prepared = await prepare_image(contents, file.content_type)
+        image_b64 = base64.b64encode(prepared.data).decode('utf-8')
         
         # Call OpenAI API with structured prompt
         prompt = """
@@ -136,77 +156,78 @@ async def ocr_extract_vocab(file: UploadFile = File(...)):
 - 每個詞語必須有中文或英文
 """
         
-        result = await call_gpt4o_vision(image_b64, prompt)
+        result = await call_gpt4o_vision(image_b64, prompt, prepared.media_type)
         
         return result
         
+    except HTTPException:
+        # Keep 4xx (e.g. 413 upload too large) instead of turning it into 500
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"詞語提取失敗: {str(e)}")
 
 
-async def call_gpt4o_vision(image_b64: str, prompt: str) -> Dict[str, Any]:
+async def call_gpt4o_vision(image_b64: str, prompt: str, media_type: str = "image/jpeg") -> Dict[str, Any]:
     """
     Call OpenAI GPT-4o Vision API
     
     Args:
         image_b64: Base64 encoded image
         prompt: Text prompt
+        media_type: Image MIME type (image/jpeg, image/webp, etc.)
         
     Returns:
         Parsed JSON response from GPT-4o
     """
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            OPENAI_API,
-            headers={
-                "Authorization": f"Bearer {OPENAI_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "gpt-4o",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_b64}"
-                                }
-                            },
-                            {
-                                "type": "text",
-                                "text": prompt
+    client = get_client(OPENAI_API)
+    response = await client.post(
+        OPENAI_API,
+        headers={
+            "Authorization": f"Bearer {OPENAI_API_KEY}",
+            "Content-Type": "application/json"
+        },
+        json={
+            "model": "gpt-4o",
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:{media_type};base64,{image_b64}"
                             }
-                        ]
-                    }
-                ],
-                "temperature": 0.1,
-                "max_tokens": 4000
-            }
+                        },
+                        {
+                            "type": "text",
+                            "text": prompt
+                        }
+                    ]
+                }
+            ],
+            "temperature": 0.1,
+            "max_tokens": 4000
+        }
+    )
+    
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=f"OpenAI API 錯誤: {response.text}"
         )
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"OpenAI API 錯誤: {response.text}"
-            )
-        
-        data = response.json()
-        
-        # Extract content from OpenAI response
-        content = data["choices"][0]["message"]["content"]
-        
-        # Parse JSON from content
-        # GPT may wrap JSON in markdown code blocks
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0].strip()
-        
-        result = json.loads(content)
-        
-        return result
+    
+    data = response.json()
+    
+    # Extract content from OpenAI response
+    content = data["choices"][0]["message"]["content"]
+    
+    # Parse JSON from content
+    # GPT may wrap JSON in markdown code blocks, add text around it, or get cut off by max_tokens
+    result, repaired = extract_json(content, expect=dict)
+    if repaired and isinstance(result, dict):
+        result["partial"] = True
+    
+    return result
 
 
 @app.get("/health")
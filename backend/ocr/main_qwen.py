@@ -5,11 +5,16 @@ SpellQuest OCR Service (Qwen-VL Vision)
 
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-import httpx
 import base64
 import os
 from typing import List, Dict, Any
-import json
+
+from metrics import setup_metrics
+from json_extract import JSONExtractError, extract_json, recover_vocabulary
+from timing import setup_timing
+from uploads import read_upload, setup_uploads
+from http_client import get_client, setup_http_client
+from image_preprocess import prepare_image
 
 app = FastAPI(
     title="SpellQuest OCR Service (Qwen-VL)",
@@ -26,6 +31,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Prometheus /metrics + per-route latency
+setup_metrics(app)
+# Server-Timing phases + admin-only profiling (X-Profile)
+setup_timing(app)
+# Upload size cap (413) + spooling large files to disk
+setup_uploads(app)
+
 # Alibaba DashScope API
 DASHSCOPE_API = "https://dashscope.aliyuncs.com/compatible-mode/v1/chat/completions"
 DASHSCOPE_API_KEY = os.environ.get("DASHSCOPE_API_KEY") or os.environ.get("QWEN_API_KEY")
@@ -33,6 +45,9 @@ DASHSCOPE_API_KEY = os.environ.get("DASHSCOPE_API_KEY") or os.environ.get("QWEN_
 if not DASHSCOPE_API_KEY:
     raise ValueError("DASHSCOPE_API_KEY 或 QWEN_API_KEY 環境變數未設定！")
 
+# Pooled upstream client (keep-alive across requests)
+setup_http_client(app, DASHSCOPE_API)
+
 
 @app.get("/")
 async def root():
@@ -44,7 +59,7 @@ async def root():
     }
 
 
-async def call_qwen_vision(image_b64: str, prompt: str) -> Dict:
+async def call_qwen_vision(image_b64: str, prompt: str, media_type: str = "image/jpeg") -> Dict:
     """Call Qwen-VL API with image"""
     
     headers = {
@@ -61,7 +76,7 @@ async def call_qwen_vision(image_b64: str, prompt: str) -> Dict:
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_b64}"
+                            "url": f"data:{media_type};base64,{image_b64}"
                         }
                     },
                     {
@@ -74,17 +89,17 @@ async def call_qwen_vision(image_b64: str, prompt: str) -> Dict:
         "max_tokens": 4096
     }
     
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(DASHSCOPE_API, headers=headers, json=payload)
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Qwen API error: {response.text}"
-            )
-        
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
+    client = get_client(DASHSCOPE_API)
+    response = await client.post(DASHSCOPE_API, headers=headers, json=payload)
+    
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=f"Qwen API error: {response.text}"
+        )
+    
+    result = response.json()
+    return result["choices"][0]["message"]["content"]
 
 
 @app.post("/ocr/upload")
@@ -104,8 +119,9 @@ async def ocr_upload(file: UploadFile = File(...)):
     
     try:
         # Read and encode image
-        contents = await file.read()
-        image_b64 = base64.b64encode(contents).decode('utf-8')
+        contents = await read_upload(file)
+        prepared = await prepare_image(contents, file.content_type)
+        image_b64 = base64.b64encode(prepared.data).decode('utf-8')
         
         # Call Qwen Vision API
         prompt = """
@@ -124,27 +140,25 @@ async def ocr_upload(file: UploadFile = File(...)):
 如果某個欄位沒有內容，可以留空字串。
 """
         
-        result = await call_qwen_vision(image_b64, prompt)
+        result = await call_qwen_vision(image_b64, prompt, prepared.media_type)
         
         # Parse JSON from response
         try:
-            # Try to extract JSON from response
+            # First balanced JSON object in the reply (truncated output is repaired)
+            repaired = False
             if isinstance(result, str):
-                # Find JSON in response
-                import re
-                json_match = re.search(r'\{[\s\S]*\}', result)
-                if json_match:
-                    parsed = json.loads(json_match.group())
-                else:
-                    parsed = {"text": result, "words": [], "lines": [result]}
+                parsed, repaired = extract_json(result, expect=dict)
             else:
                 parsed = result
                 
-            return {
+            response = {
                 "success": True,
                 "data": parsed
             }
-        except json.JSONDecodeError:
+            if repaired:
+                response["partial"] = True
+            return response
+        except JSONExtractError:
             return {
                 "success": True,
                 "data": {
@@ -154,6 +168,9 @@ async def ocr_upload(file: UploadFile = File(...)):
                 }
             }
             
+    except HTTPException:
+        # Keep 4xx (e.g. 413 upload too large) instead of turning it into 500
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -175,8 +192,9 @@ async def extract_vocabulary(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="只接受圖片檔案")
     
     try:
-        contents = await file.read()
-        image_b64 = base64.b64encode(contents).decode('utf-8')
+        contents = await read_upload(file)
+        prepared = await prepare_image(contents, file.content_type)
+        image_b64 = base64.b64encode(prepared.data).decode('utf-8')
         
         prompt = """
 請從這張圖片中提取所有詞彙。這是一份小學生的默書或詞語表。
@@ -194,30 +212,36 @@ async def extract_vocabulary(file: UploadFile = File(...)):
 - 請識別所有可見的詞語
 """
         
-        result = await call_qwen_vision(image_b64, prompt)
+        result = await call_qwen_vision(image_b64, prompt, prepared.media_type)
         
         try:
+            repaired = False
             if isinstance(result, str):
-                import re
-                json_match = re.search(r'\{[\s\S]*\}', result)
-                if json_match:
-                    parsed = json.loads(json_match.group())
-                else:
-                    parsed = {"vocabulary": []}
+                parsed, repaired = extract_json(result, expect=dict)
             else:
                 parsed = result
                 
-            return {
+            response = {
                 "success": True,
                 "vocabulary": parsed.get("vocabulary", [])
             }
-        except json.JSONDecodeError:
+            if repaired:
+                response["partial"] = True
+            return response
+        except JSONExtractError:
+            # Keep whatever complete items there are
+            vocabulary = recover_vocabulary(result) if isinstance(result, str) else []
+            if vocabulary:
+                return {"success": True, "vocabulary": vocabulary, "partial": True}
             return {
                 "success": False,
                 "error": "無法解析 OCR 結果",
                 "raw": result
             }
             
+    except HTTPException:
+        # Keep 4xx (e.g. 413 upload too large) instead of turning it into 500
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -5,12 +5,15 @@ SpellQuest OCR Service (Tesseract)
 
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-import pytesseract
-from PIL import Image
-import io
 import re
 from typing import List, Dict, Any
 
+from metrics import setup_metrics
+from tesseract_pool import TesseractBusyError, TesseractPool
+from timing import phase, setup_timing
+from uploads import read_upload, setup_uploads
+from vocabulary import parse_vocabulary_line
+
 app = FastAPI(
     title="SpellQuest OCR Service (Tesseract)",
     description="中英文 OCR 識別服務（使用 Tesseract OCR - 免費開源）",
@@ -26,6 +29,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Prometheus /metrics + per-route latency
+setup_metrics(app)
+# Server-Timing phases + admin-only profiling (X-Profile)
+setup_timing(app)
+# Upload size cap (413) + spooling large files to disk
+setup_uploads(app)
+
+# Warm Tesseract engines in worker processes (one per core), fed from an async queue
+tesseract = TesseractPool()
+
+@app.on_event("startup")
+async def start_tesseract():
+    await tesseract.start()
+
+@app.on_event("shutdown")
+async def stop_tesseract():
+    await tesseract.stop()
+
+
+async def run_ocr(contents: bytes) -> str:
+    """OCR in the worker pool; a full queue becomes 503 + Retry-After"""
+    try:
+        with phase("ocr"):
+            return await tesseract.recognize(contents)
+    except TesseractBusyError as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": str(max(1, round(e.retry_after)))})
+
 
 @app.get("/")
 async def root():
@@ -54,11 +84,11 @@ async def ocr_upload(file: UploadFile = File(...)):
     
     try:
         # Read image
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
+        with phase("read"):
+            contents = await read_upload(file)
         
-        # OCR with Tesseract (Chinese + English)
-        text = pytesseract.image_to_string(image, lang='chi_tra+eng')
+        # OCR with Tesseract (Chinese + English), off the event loop
+        text = await run_ocr(contents)
         
         # Parse text
         lines = [line.strip() for line in text.split('\n') if line.strip()]
@@ -75,6 +105,9 @@ async def ocr_upload(file: UploadFile = File(...)):
             "lines": lines
         }
         
+    except HTTPException:
+        # Keep 4xx / 503 (e.g. 413 upload too large, OCR queue full) instead of turning it into 500
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OCR 處理失敗: {str(e)}")
 
@@ -98,59 +131,26 @@ async def ocr_extract_vocab(file: UploadFile = File(...)):
     
     try:
         # Read image
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
+        with phase("read"):
+            contents = await read_upload(file)
         
         # OCR with Tesseract
-        text = pytesseract.image_to_string(image, lang='chi_tra+eng')
+        text = await run_ocr(contents)
         
-        # Parse vocabulary
+        # Parse vocabulary: "中文 english pinyin" per line
         vocabulary = []
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
-        
-        for line in lines:
-            # Try to parse format: "中文 english pinyin"
-            # Remove numbering (1. 2. etc.)
-            line = re.sub(r'^\d+[\.\)]\s*', '', line)
-            
-            # Split by spaces/commas
-            parts = re.split(r'[\s,，]+', line)
-            parts = [p.strip() for p in parts if p.strip()]
-            
-            if len(parts) == 0:
-                continue
-            
-            # Detect Chinese, English, Pinyin
-            chinese = ""
-            english = ""
-            pinyin = ""
-            
-            for part in parts:
-                # Check if it's English (all ASCII letters)
-                if re.match(r'^[a-zA-Z]+$', part):
-                    if not english:
-                        english = part
-                # Check if it's Chinese (contains Chinese characters)
-                elif re.search(r'[\u4e00-\u9fff]', part):
-                    if not chinese:
-                        chinese = part
-                # Check if it's pinyin (lowercase + tone marks)
-                elif re.match(r'^[a-zāáǎàēéěèīíǐìōóǒòūúǔùǖǘǚǜ]+$', part, re.IGNORECASE):
-                    if not pinyin:
-                        pinyin = part
-            
-            # Only add if we have at least Chinese or English
-            if chinese or english:
-                vocabulary.append({
-                    "chinese": chinese,
-                    "english": english,
-                    "pinyin": pinyin
-                })
+        for line in text.split('\n'):
+            item = parse_vocabulary_line(line)
+            if item:
+                vocabulary.append(item)
         
         return {
             "vocabulary": vocabulary
         }
         
+    except HTTPException:
+        # Keep 4xx / 503 (e.g. 413 upload too large, OCR queue full) instead of turning it into 500
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"詞語提取失敗: {str(e)}")
 
@@ -158,18 +158,18 @@ async def ocr_extract_vocab(file: UploadFile = File(...)):
 @app.get("/health")
 async def health_check():
     """健康檢查"""
-    try:
-        # Test Tesseract is available
-        version = pytesseract.get_tesseract_version()
-        
-        return {
-            "status": "healthy",
-            "model": "tesseract-ocr",
-            "version": str(version),
-            "provider": "Tesseract (Open Source)"
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Service 未正常運作: {str(e)}")
+    # Engines were loaded at startup; no tesseract subprocess per health check
+    stats = tesseract.stats()
+    if stats["engine"] is None:
+        raise HTTPException(status_code=500, detail="Service 未正常運作: Tesseract pool 未啟動")
+    
+    return {
+        "status": "healthy",
+        "model": "tesseract-ocr",
+        "version": stats["version"],
+        "provider": "Tesseract (Open Source)",
+        "pool": stats
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+"""
+Prometheus metrics
+`/metrics` 提供 capacity planning 需要嘅數字：每個 route 嘅 latency、upstream latency（provider + model）、
+上載 / payload size、cache hit ratio、in-flight requests、JSON parse 失敗次數。
+"""
+
+import time
+
+from fastapi import FastAPI, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Seconds: fast cache hits up to slow vision calls / image generation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+# Bytes: 1 KB .. 32 MB
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(9))
+
+REQUEST_LATENCY = Histogram(
+    "spellquest_request_duration_seconds",
+    "HTTP request latency (until the last body chunk is sent)",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "spellquest_requests_in_flight",
+    "HTTP requests currently being handled (including open streams)",
+)
+UPSTREAM_LATENCY = Histogram(
+    "spellquest_upstream_duration_seconds",
+    "Latency of one upstream attempt",
+    ["provider", "model", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "spellquest_upstream_in_flight",
+    "Upstream requests currently waiting for a response",
+    ["provider"],
+)
+IMAGE_BYTES = Histogram(
+    "spellquest_image_bytes",
+    "Uploaded image size before and after preprocessing",
+    ["stage"],
+    buckets=SIZE_BUCKETS,
+)
+UPSTREAM_PAYLOAD_BYTES = Histogram(
+    "spellquest_upstream_payload_bytes",
+    "Encoded request body (JSON + base64 image) sent to vision providers",
+    ["provider"],
+    buckets=SIZE_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "spellquest_cache_lookups_total",
+    "Cache lookups; hit ratio = hit / (hit + miss)",
+    ["cache", "result"],
+)
+JSON_PARSE_FAILURES = Counter(
+    "spellquest_json_parse_failures_total",
+    "Model replies (or streamed items) that were not valid JSON",
+    ["source"],
+)
+
+TESSERACT_QUEUED = Gauge(
+    "spellquest_tesseract_queued",
+    "Images waiting for a Tesseract worker",
+)
+TESSERACT_BUSY = Gauge(
+    "spellquest_tesseract_busy_workers",
+    "Tesseract workers currently running OCR",
+)
+TESSERACT_SECONDS = Histogram(
+    "spellquest_tesseract_seconds",
+    "Time an image spent queued for / inside a Tesseract worker",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+HYBRID_PAGES = Counter(
+    "spellquest_hybrid_pages_total",
+    "Hybrid OCR pages by outcome (local = no vision call, hybrid = only low-confidence lines, "
+    "vision = whole page, busy = Tesseract queue full)",
+    ["outcome"],
+)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_parse_failure(source: str):
+    JSON_PARSE_FAILURES.labels(source).inc()
+
+
+def status_class(status_code: int) -> str:
+    return f"{status_code // 100}xx"
+
+
+def _route_label(scope) -> str:
+    """Route template (not the raw path) so labels stay bounded"""
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    root_path = scope.get("root_path")
+    if root_path:
+        # Static mounts (/images, /audio)
+        return f"{root_path}/*"
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses are timed to the end"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            route = _route_label(scope)
+            if route != "/metrics":
+                REQUEST_LATENCY.labels(scope["method"], route, str(status["code"])).observe(
+                    time.perf_counter() - started
+                )
+
+
+def setup_metrics(app: FastAPI):
+    """Add the timing middleware and the `/metrics` endpoint to `app`"""
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
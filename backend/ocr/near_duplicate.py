@@ -0,0 +1,395 @@
+"""
+Near-duplicate lookup for re-photographed worksheets
+同一張工作紙俾唔同家長影，角度、光暗、裁切都唔同，SHA-256 exact cache 永遠 miss，
+每張都要再 call 一次 vision model。
+
+兩步：
+1. 搵 candidate：64-bit pHash（32×32 DCT 最低頻 8×8）+ multi-index hashing
+   - hash 切 4 段 16 bit，每段一個 table（chunk → slot list）
+   - Hamming distance ≤ r 嘅兩個 hash，pigeonhole 之下最少有一段相差 ≤ r // 4 bit，
+     所以每個 table 只需要 probe 一百幾十個 bucket，唔使 scan 成個 index
+   - hash / image SHA-256 放喺 NumPy array（ring buffer，滿咗就 FIFO 覆蓋最舊嗰個）
+2. 核對：pHash 只係睇成版大概光暗分佈，同一個模板印出嚟嘅另一份詞語表 pHash 都好近。
+   所以再比較 layout signature：deskew 之後每一行入面每個詞嘅闊度（以行距為單位），
+   換咗詞語闊度就唔同；同一張紙無論點影都一樣。Signature 存喺 OCR cache entry 入面。
+"""
+
+import asyncio
+import io
+import logging
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from file_utils import atomic_write_bytes
+from image_preprocess import run_in_preprocess_pool
+from line_segment import _runs, estimate_skew, find_lines, load_gray
+from metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+OCR_NEAR_DUP = os.environ.get("OCR_NEAR_DUP", "false").lower() in ("1", "true", "yes")
+NEAR_DUP_MAX_DISTANCE = int(os.environ.get("NEAR_DUP_MAX_DISTANCE", "10"))  # pHash bits (of 64)
+NEAR_DUP_MIN_LAYOUT_MATCH = float(os.environ.get("NEAR_DUP_MIN_LAYOUT_MATCH", "0.8"))  # fraction of lines
+NEAR_DUP_MAX_CANDIDATES = int(os.environ.get("NEAR_DUP_MAX_CANDIDATES", "3"))  # layout checks per lookup
+NEAR_DUP_MAX_ENTRIES = int(os.environ.get("NEAR_DUP_MAX_ENTRIES", "500000"))
+NEAR_DUP_INDEX_PATH = Path(os.environ.get("NEAR_DUP_INDEX_PATH", "/app/cache/near_dup/index.npz"))
+NEAR_DUP_SAVE_INTERVAL = float(os.environ.get("NEAR_DUP_SAVE_INTERVAL", "300"))
+
+# Analysis resolution for the layout signature (JPEG draft-decodes close to this)
+LAYOUT_MAX_EDGE = 1024
+# Pages with fewer lines than this are too generic to match on layout
+LAYOUT_MIN_LINES = 3
+
+# Re-sort the chunk tables (in a thread) once this many entries are only scanned linearly
+REBUILD_EVERY = 4096
+
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+def _flip_masks(bits: int, radius: int) -> List[int]:
+    """Every `bits`-wide value with at most `radius` bits set"""
+    masks = [0]
+    frontier = [(0, -1)]
+    for _ in range(radius):
+        frontier = [(mask | 1 << i, i) for mask, last in frontier for i in range(last + 1, bits)]
+        masks.extend(mask for mask, _ in frontier)
+    return masks
+
+
+# --- Fingerprint (CPU-bound, runs in the preprocessing pool) ---
+
+@dataclass
+class Fingerprint:
+    phash: int
+    layout: List[List[float]]
+
+
+def phash(gray: Image.Image) -> int:
+    """64-bit perceptual hash: sign of the lowest 8×8 DCT coefficients against their median"""
+    pixels = np.asarray(gray.resize((32, 32), Image.BILINEAR), dtype=np.float64)
+    k = np.arange(32)
+    dct = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / 64)
+    coeffs = (dct @ pixels @ dct.T)[:8, :8].ravel()
+    # DC is the mean brightness: leave it out of the median
+    bits = coeffs > np.median(coeffs[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def ink_mask(gray: Image.Image) -> np.ndarray:
+    """Ink = clearly darker than the local background (uneven lighting safe, unlike a global threshold)"""
+    background = np.asarray(gray.filter(ImageFilter.BoxBlur(max(4, max(gray.size) // 40))), dtype=np.int16)
+    return np.asarray(gray, dtype=np.int16) < background - 40
+
+
+def layout_signature(gray: Image.Image) -> List[List[float]]:
+    """
+    Word widths of every text line, top to bottom, in units of the line pitch
+
+    Scale / crop / lighting invariant. Ink within 1% of the edges (paper
+    border, table edge) and specks narrower than 0.12 pitch are ignored.
+    """
+    ink = ink_mask(gray)
+    angle = estimate_skew(ink)
+    if abs(angle) >= 0.2:
+        gray = gray.rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=255)
+        ink = ink_mask(gray)
+
+    height, width = ink.shape
+    margin_x, margin_y = width * 0.01, height * 0.01
+    # 1% of the width: thin paper edges crossing a row don't make it a text row
+    lines = [(top, bottom) for top, bottom in find_lines(ink, min_fraction=0.01)
+             if top > margin_y and bottom < height - margin_y]
+    if len(lines) < LAYOUT_MIN_LINES:
+        return []
+    pitch = float(np.median(np.diff([(top + bottom) / 2 for top, bottom in lines])))
+
+    signature = []
+    for top, bottom in lines:
+        gap = (bottom - top) * 0.6
+        words: List[List[int]] = []
+        for start, end in _runs(ink[top:bottom].any(axis=0)):
+            if start < margin_x or end > width - margin_x:
+                continue
+            if words and start - words[-1][1] < gap:
+                words[-1][1] = end
+            else:
+                words.append([start, end])
+        signature.append([round((end - start) / pitch, 2) for start, end in words if end - start >= 0.12 * pitch])
+    return signature
+
+
+def fingerprint(contents: bytes) -> Optional[Fingerprint]:
+    try:
+        gray = load_gray(contents, LAYOUT_MAX_EDGE)
+        return Fingerprint(phash(gray), layout_signature(gray))
+    except Exception as e:
+        logger.warning(f"Near-duplicate fingerprint failed: {e}")
+        return None
+
+
+def _same_words(a: List[float], b: List[float]) -> bool:
+    return len(a) == len(b) and all(abs(x - y) <= max(0.08, 0.06 * max(x, y)) for x, y in zip(a, b))
+
+
+def _trims(words: List[float]) -> List[List[float]]:
+    # A stray mark at either end of a line (shadow, binder hole) adds or drops one "word"
+    return [words, words[1:], words[:-1]] if len(words) >= 2 else [words]
+
+
+def layout_similarity(a: List[List[float]], b: List[List[float]]) -> float:
+    """Fraction of lines with the same word widths (best of shifting by one line, for a cropped edge)"""
+    if len(a) < LAYOUT_MIN_LINES or len(b) < LAYOUT_MIN_LINES:
+        return 0.0
+    best = 0
+    for shift in (-1, 0, 1):
+        same = sum(
+            1 for i, words in enumerate(a) if 0 <= i + shift < len(b)
+            and any(_same_words(x, y) for x in _trims(words) for y in _trims(b[i + shift]))
+        )
+        best = max(best, same)
+    return best / max(len(a), len(b))
+
+
+# --- Index ---
+
+@dataclass
+class NearDuplicate:
+    digest: str
+    value: Dict
+    distance: int
+    layout_match: float
+
+    def stats(self) -> Dict:
+        return {"distance": self.distance, "layout_match": round(self.layout_match, 2)}
+
+
+class PHashIndex:
+    """
+    Multi-index hashing over 64-bit perceptual hashes
+
+    Fixed-capacity ring buffer: slot i holds hashes[i] and the SHA-256 of the
+    image it came from; once full, the oldest slot is overwritten.
+
+    For each of the CHUNKS 16-bit chunks, the slots are kept sorted by chunk
+    value with an offsets table (CSR), so probing a bucket is two array reads
+    and a whole search is a handful of vectorised NumPy calls. Slots written
+    since the last `rebuild()` (the `pending` newest ones) are scanned; a stale
+    sorted entry (slot since overwritten) is harmless, because distances are
+    always computed against the current hashes.
+    """
+
+    def __init__(self, capacity: int = NEAR_DUP_MAX_ENTRIES):
+        self.capacity = capacity
+        self.hashes = np.zeros(capacity, dtype=np.uint64)
+        self.digests = np.zeros((capacity, 32), dtype=np.uint8)
+        self.size = 0
+        self.next = 0
+        self.added = 0
+        self._built = 0  # `added` when the tables were last sorted
+        # Empty CSR: every bucket is [0, 0)
+        self._sorted = (np.zeros(CHUNKS * (CHUNK_MASK + 2), dtype=np.int64), np.zeros(0, dtype=np.uint32))
+        self._radius = -1
+        self._masks = np.zeros(1, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, value: int, digest: bytes):
+        slot = self.next
+        self.hashes[slot] = value
+        self.digests[slot] = np.frombuffer(digest, dtype=np.uint8)
+        self.added += 1
+        self.size = min(self.size + 1, self.capacity)
+        self.next = (slot + 1) % self.capacity
+
+    @property
+    def pending(self) -> int:
+        return min(self.added - self._built, self.size)
+
+    def _pending_slots(self) -> np.ndarray:
+        count = self.pending
+        return ((self.next - count + np.arange(count)) % self.capacity).astype(np.uint32)
+
+    def rebuild(self):
+        """Re-sort all slots into the chunk tables (safe to run in a thread while `add` continues)"""
+        added = self.added
+        hashes = self.hashes[:self.size].copy()
+        width = CHUNK_MASK + 2
+        offsets = np.zeros(CHUNKS * width, dtype=np.int64)
+        orders = []
+        for t in range(CHUNKS):
+            chunks = ((hashes >> np.uint64(CHUNK_BITS * t)) & np.uint64(CHUNK_MASK)).astype(np.int64)
+            orders.append(np.argsort(chunks, kind="stable").astype(np.uint32))
+            counts = np.bincount(chunks, minlength=CHUNK_MASK + 1)
+            # offsets[t][v] .. offsets[t][v + 1] = bucket v of table t, in the concatenated order array
+            offsets[t * width + 1:(t + 1) * width] = np.cumsum(counts) + t * len(hashes)
+            offsets[t * width] = t * len(hashes)
+        self._sorted = (offsets, np.concatenate(orders))
+        self._built = added
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, bytes]]:
+        """(distance, digest) of every entry within `radius` bits, nearest first"""
+        if not self.size:
+            return []
+        if radius != self._radius:
+            self._masks = np.array(_flip_masks(CHUNK_BITS, radius // CHUNKS), dtype=np.int64)
+            self._radius = radius
+
+        offsets, order = self._sorted
+        width = CHUNK_MASK + 2
+        chunks = np.array([(value >> (CHUNK_BITS * t)) & CHUNK_MASK for t in range(CHUNKS)], dtype=np.int64)
+        probes = ((chunks[:, None] ^ self._masks[None, :]) + (np.arange(CHUNKS) * width)[:, None]).ravel()
+        starts, ends = offsets[probes], offsets[probes + 1]
+        lengths = ends - starts
+        # Concatenate the ranges [start, end) without a Python loop
+        positions = np.arange(lengths.sum()) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        slots = np.concatenate((order[positions], self._pending_slots()))
+
+        distances = np.bitwise_count(self.hashes[slots] ^ np.uint64(value))
+        keep = np.flatnonzero(distances <= radius)
+        # A slot can come back through several chunks
+        matches = sorted(dict(zip(slots[keep].tolist(), distances[keep].tolist())).items(), key=lambda item: item[1])
+        return [(distance, self.digests[slot].tobytes()) for slot, distance in matches]
+
+    def save(self, path: Path):
+        buf = io.BytesIO()
+        np.savez(buf, hashes=self.hashes[:self.size], digests=self.digests[:self.size], next=np.array([self.next]))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_bytes(path, buf.getvalue())
+
+    def load(self, path: Path):
+        with np.load(path) as data:
+            hashes, digests, next_slot = data["hashes"], data["digests"], int(data["next"][0])
+        if len(hashes) > self.capacity:
+            # Capacity was lowered: keep the newest entries
+            order = np.roll(np.arange(len(hashes)), -next_slot)[-self.capacity:]
+            hashes, digests, next_slot = hashes[order], digests[order], 0
+        self.size = len(hashes)
+        self.hashes[:self.size] = hashes
+        self.digests[:self.size] = digests
+        self.next = next_slot % self.capacity if self.size == self.capacity else self.size
+        self.added = self.size
+        self.rebuild()
+
+
+class NearDuplicateIndex:
+    """
+    pHash candidates + layout check in front of the exact OCR cache
+
+    `load(digest)` returns the cached result of the image with that SHA-256
+    (None when it has since expired); the result must carry the "layout"
+    signature it was stored with.
+    """
+
+    def __init__(self, capacity: int = NEAR_DUP_MAX_ENTRIES, path: Path = NEAR_DUP_INDEX_PATH,
+                 enabled: bool = OCR_NEAR_DUP):
+        self.enabled = enabled
+        self.path = Path(path)
+        self.index = PHashIndex(capacity if enabled else 1)
+        self._dirty = False
+        self._janitor: Optional[asyncio.Task] = None
+        self._rebuild: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    async def fingerprint(self, contents: bytes) -> Optional[Fingerprint]:
+        return await run_in_preprocess_pool(fingerprint, contents)
+
+    async def find(self, fp: Fingerprint, load: Callable[[str], Awaitable[Optional[Dict]]]) -> Optional[NearDuplicate]:
+        candidates = self.index.search(fp.phash, NEAR_DUP_MAX_DISTANCE) if fp.layout else []
+        checked = set()
+        for distance, digest in candidates:
+            # The same image may have been indexed more than once
+            if digest in checked:
+                continue
+            if len(checked) == NEAR_DUP_MAX_CANDIDATES:
+                break
+            checked.add(digest)
+            value = await load(digest.hex())
+            if not value or not value.get("layout"):
+                continue
+            match = layout_similarity(fp.layout, value["layout"])
+            if match >= NEAR_DUP_MIN_LAYOUT_MATCH:
+                self.hits += 1
+                record_cache("ocr_near_dup", True)
+                return NearDuplicate(digest.hex(), value, distance, match)
+            # Same template, different words
+            self.rejected += 1
+        self.misses += 1
+        record_cache("ocr_near_dup", False)
+        return None
+
+    def add(self, fp: Fingerprint, digest: str):
+        if fp.layout:
+            self.index.add(fp.phash, bytes.fromhex(digest))
+            self._dirty = True
+            if self.index.pending >= REBUILD_EVERY and self._rebuild is None:
+                self._rebuild = asyncio.create_task(self._rebuild_tables())
+
+    async def _rebuild_tables(self):
+        try:
+            await asyncio.to_thread(self.index.rebuild)
+        finally:
+            self._rebuild = None
+
+    # --- persistence / lifecycle ---
+
+    async def save(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        try:
+            await asyncio.to_thread(self.index.save, self.path)
+        except OSError as e:
+            logger.error(f"Near-duplicate index: saving failed: {e}")
+
+    async def _janitor_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.save()
+
+    async def start(self, interval: float = NEAR_DUP_SAVE_INTERVAL):
+        if not self.enabled:
+            return
+        if self.path.exists():
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.index.load, self.path)
+                logger.info(f"Near-duplicate index: loaded {len(self.index)} entries "
+                            f"in {time.perf_counter() - started:.1f}s")
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Near-duplicate index: could not load {self.path}: {e}")
+        self._janitor = asyncio.create_task(self._janitor_loop(interval))
+
+    async def stop(self):
+        if self._janitor is not None:
+            self._janitor.cancel()
+            await asyncio.gather(self._janitor, return_exceptions=True)
+            self._janitor = None
+        if self._rebuild is not None:
+            await asyncio.gather(self._rebuild, return_exceptions=True)
+        if self.enabled:
+            await self.save()
+
+    def stats(self) -> Dict:
+        if not self.enabled:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "entries": len(self.index),
+            "max_entries": self.index.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,186 @@
+"""
+Content-addressed OCR result cache
+同一張圖片 + 同一個 prompt + 同一個 model → 直接用返上次嘅結果，唔使再 call vision API。
+
+兩層：
+- memory: LRU (OrderedDict)
+- disk: JSON files，有 TTL 同 size limit
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+from file_utils import atomic_write_bytes
+from metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+OCR_CACHE_DIR = Path(os.environ.get("OCR_CACHE_DIR", "/app/cache/ocr"))
+OCR_CACHE_MEMORY_ENTRIES = int(os.environ.get("OCR_CACHE_MEMORY_ENTRIES", "256"))
+OCR_CACHE_TTL_SECONDS = int(os.environ.get("OCR_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+OCR_CACHE_MAX_BYTES = int(os.environ.get("OCR_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+
+def image_digest(contents: bytes) -> str:
+    """SHA-256 of the raw uploaded bytes"""
+    return hashlib.sha256(contents).hexdigest()
+
+
+def make_cache_key(image_sha256: str, prompt: str, model: str) -> str:
+    """
+    Cache key = image hash + prompt version + model
+
+    The prompt version is a hash of the prompt text, so editing a prompt
+    automatically invalidates old results.
+    """
+    prompt_version = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+    return hashlib.sha256(f"{image_sha256}:{prompt_version}:{model}".encode()).hexdigest()
+
+
+class OCRCache:
+    """Two-tier (memory LRU + disk) cache for parsed OCR results"""
+
+    def __init__(
+        self,
+        directory: Path = OCR_CACHE_DIR,
+        max_memory_entries: int = OCR_CACHE_MEMORY_ENTRIES,
+        ttl_seconds: int = OCR_CACHE_TTL_SECONDS,
+        max_disk_bytes: int = OCR_CACHE_MAX_BYTES,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_memory_entries = max_memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._disk_bytes: Optional[int] = None
+        self._disk_lock = threading.Lock()
+
+    # --- memory tier ---
+
+    def _memory_get(self, key: str) -> Optional[Any]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        created, value = entry
+        if time.time() - created > self.ttl_seconds:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_set(self, key: str, value: Any, created: float):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    # --- disk tier (runs in a worker thread) ---
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _disk_get(self, key: str) -> Optional[Tuple[float, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry["created"] > self.ttl_seconds:
+            self._disk_remove(path)
+            return None
+        return entry["created"], entry["value"]
+
+    def _disk_set(self, key: str, value: Any, created: float):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps({"created": created, "value": value}, ensure_ascii=False).encode("utf-8")
+
+        try:
+            # Rewriting a key (e.g. after it expired) replaces the old file
+            replaced = path.stat().st_size
+        except OSError:
+            replaced = 0
+        atomic_write_bytes(path, data)
+
+        with self._disk_lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(p.stat().st_size for p in self.directory.glob("*/*.json"))
+            else:
+                self._disk_bytes += len(data) - replaced
+
+            if self._disk_bytes > self.max_disk_bytes:
+                self._prune_disk()
+
+    def _disk_remove(self, path: Path):
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except OSError:
+            return
+        with self._disk_lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes -= size
+
+    def _prune_disk(self):
+        """Drop expired entries, then oldest entries until under 90% of the byte budget"""
+        now = time.time()
+        files = []
+        for p in self.directory.glob("*/*.json"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            if now - st.st_mtime > self.ttl_seconds:
+                p.unlink(missing_ok=True)
+            else:
+                files.append((st.st_mtime, st.st_size, p))
+
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        target = int(self.max_disk_bytes * 0.9)
+        for _, size, p in files:
+            if total <= target:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+
+        self._disk_bytes = total
+        logger.info(f"OCR cache pruned to {total} bytes")
+
+    # --- public API ---
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self._memory_get(key)
+        if value is not None:
+            record_cache("ocr", True)
+            return value
+
+        entry = await asyncio.to_thread(self._disk_get, key)
+        record_cache("ocr", entry is not None)
+        if entry is None:
+            return None
+
+        created, value = entry
+        self._memory_set(key, value, created)
+        return value
+
+    async def set(self, key: str, value: Any):
+        created = time.time()
+        self._memory_set(key, value, created)
+        try:
+            await asyncio.to_thread(self._disk_set, key, value, created)
+        except OSError as e:
+            logger.error(f"OCR cache write failed: {e}")
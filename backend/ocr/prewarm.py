@@ -0,0 +1,188 @@
+"""
+Background pre-warming of TTS audio and illustrations
+第一個玩新詞語集嘅小朋友要逐個字即場等 CosyVoice 同 Wanx。
+Pre-warm 會喺 background 預先生成成個詞語集嘅讀音同插圖：
+
+- 按 play order 排先後（第 1 個字最先 ready）
+- 每個 provider 有自己嘅 rate limit 同 concurrency，唔會搶晒 live request 嘅 quota
+- job 有進度，可以 long-poll
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from resilience import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+PREWARM_TTS_RATE = float(os.environ.get("PREWARM_TTS_RATE", "2"))          # requests / second
+PREWARM_TTS_CONCURRENCY = int(os.environ.get("PREWARM_TTS_CONCURRENCY", "2"))
+PREWARM_IMAGE_RATE = float(os.environ.get("PREWARM_IMAGE_RATE", "0.5"))
+PREWARM_IMAGE_CONCURRENCY = int(os.environ.get("PREWARM_IMAGE_CONCURRENCY", "2"))
+PREWARM_RETENTION = float(os.environ.get("PREWARM_RETENTION", "3600"))
+
+MAX_ERRORS_KEPT = 20
+
+
+@dataclass
+class Warmer:
+    """How to check and generate one kind of asset for a word"""
+    is_cached: Callable[[str], bool]
+    generate: Callable[[str], Awaitable[None]]
+    rate: float
+    concurrency: int
+
+
+@dataclass
+class PrewarmJob:
+    words: List[str]
+    kinds: List[str]
+    source: Optional[str] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    counts: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    errors: List[str] = field(default_factory=list)
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def __post_init__(self):
+        for kind in self.kinds:
+            self.counts[kind] = {"total": len(self.words), "generated": 0, "cached": 0, "failed": 0}
+
+    @property
+    def total(self) -> int:
+        return len(self.words) * len(self.kinds)
+
+    @property
+    def completed(self) -> int:
+        return sum(c["generated"] + c["cached"] + c["failed"] for c in self.counts.values())
+
+    @property
+    def done(self) -> bool:
+        return self.completed >= self.total
+
+    @property
+    def status(self) -> str:
+        if self.done:
+            return "done"
+        return "running" if self.completed else "queued"
+
+    def record(self, kind: str, outcome: str, error: Optional[str] = None):
+        self.counts[kind][outcome] += 1
+        if error and len(self.errors) < MAX_ERRORS_KEPT:
+            self.errors.append(error)
+        if self.done:
+            self.finished_at = time.time()
+        self.notify()
+
+    def notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_done(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while not self.done:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return self.done
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "source": self.source,
+            "status": self.status,
+            "progress": round(100 * self.completed / self.total) if self.total else 100,
+            "words": len(self.words),
+            "counts": self.counts,
+            "errors": self.errors,
+        }
+
+
+class PrewarmScheduler:
+    """
+    One priority queue + worker pool per asset kind
+
+    Items are ordered by (position in play order, submission order), so the
+    first words of every pending word set are generated before later ones.
+    """
+
+    def __init__(self, warmers: Dict[str, Warmer]):
+        self.warmers = warmers
+        self.jobs: Dict[str, PrewarmJob] = {}
+        self._queues: Dict[str, asyncio.PriorityQueue] = {}
+        self._limiters = {kind: RateLimiter(w.rate) for kind, w in warmers.items()}
+        self._seq = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+
+    # --- lifecycle ---
+
+    def start(self):
+        for kind, warmer in self.warmers.items():
+            self._queues[kind] = asyncio.PriorityQueue()
+            for _ in range(warmer.concurrency):
+                self._tasks.append(asyncio.create_task(self._worker(kind)))
+        logger.info(f"Prewarm scheduler started ({', '.join(self.warmers)})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # --- public API ---
+
+    def submit(self, words: List[str], kinds: Optional[List[str]] = None,
+               source: Optional[str] = None) -> PrewarmJob:
+        """Queue every (kind, word); `words` must already be in play order"""
+        kinds = [k for k in (kinds or list(self.warmers)) if k in self.warmers]
+        job = PrewarmJob(words=words, kinds=kinds, source=source)
+        self.jobs[job.id] = job
+        for order, word in enumerate(words):
+            for kind in kinds:
+                self._queues[kind].put_nowait((order, next(self._seq), job, word))
+        self._forget_old_jobs()
+        return job
+
+    def get(self, job_id: str) -> Optional[PrewarmJob]:
+        return self.jobs.get(job_id)
+
+    def stats(self) -> Dict:
+        return {
+            "queued": {kind: q.qsize() for kind, q in self._queues.items()},
+            "jobs": sum(1 for job in self.jobs.values() if not job.done),
+        }
+
+    # --- internals ---
+
+    def _forget_old_jobs(self):
+        cutoff = time.time() - PREWARM_RETENTION
+        for job_id in [j.id for j in self.jobs.values() if j.done and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    async def _worker(self, kind: str):
+        warmer = self.warmers[kind]
+        queue = self._queues[kind]
+        while True:
+            _, _, job, word = await queue.get()
+            try:
+                if warmer.is_cached(word):
+                    job.record(kind, "cached")
+                    continue
+                await self._limiters[kind].acquire()
+                await warmer.generate(word)
+                job.record(kind, "generated")
+            except Exception as e:
+                logger.warning(f"Prewarm {kind} failed for {word}: {e}")
+                job.record(kind, "failed", f"{kind} {word}: {e}")
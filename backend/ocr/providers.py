@@ -0,0 +1,351 @@
+"""
+Vision provider layer with hedged requests
+將 main_*.py 入面嗰幾個 vision back end 抽象成 provider，可以同時配置幾個：
+
+- 按每個 provider 觀察到嘅 latency + error rate 排序
+- primary 超過 p95 都未返，就 hedge 一個 request 去下一個 provider
+- 第一個 valid JSON 結果勝出，其餘 request 即刻 cancel
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from http_client import get_client
+from json_extract import dumps, loads
+from metrics import UPSTREAM_PAYLOAD_BYTES
+from resilience import OPEN, get_upstream
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+OCR_PROVIDERS = os.environ.get("OCR_PROVIDERS", "dashscope")
+OCR_HEDGE_ENABLED = os.environ.get("OCR_HEDGE_ENABLED", "true").lower() in ("1", "true", "yes")
+OCR_HEDGE_DEFAULT_DELAY = float(os.environ.get("OCR_HEDGE_DEFAULT_DELAY", "8"))
+OCR_HEDGE_MIN_DELAY = float(os.environ.get("OCR_HEDGE_MIN_DELAY", "1"))
+OCR_HEDGE_MAX_DELAY = float(os.environ.get("OCR_HEDGE_MAX_DELAY", "30"))
+# Point DashScope calls at another host (e.g. bench/mock_dashscope.py)
+DASHSCOPE_BASE_URL = os.environ.get("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com").rstrip("/")
+
+# Samples needed before the observed p95 replaces the default hedge delay
+LATENCY_WINDOW = 100
+MIN_SAMPLES_FOR_P95 = 10
+ERROR_RATE_ALPHA = 0.2
+
+# Stands in for the base64 image while the rest of the JSON body is serialised
+IMAGE_PLACEHOLDER = "__SPELLQUEST_IMAGE_B64__"
+
+
+def encode_json_with_image(payload: Dict, image_b64: bytes) -> bytes:
+    """
+    Serialise `payload` with IMAGE_PLACEHOLDER replaced by `image_b64`
+
+    The base64 bytes are spliced into the encoded body instead of going
+    through str → data URL f-string → json.dumps → encode, so a request
+    holds the image as base64 once plus once inside the body.
+    Base64 needs no JSON escaping.
+    """
+    head, tail = dumps(payload).encode("utf-8").split(IMAGE_PLACEHOLDER.encode(), 1)
+    return b"".join((head, image_b64, tail))
+
+
+class ProviderError(Exception):
+    """Upstream returned an error or an unusable reply"""
+
+    def __init__(self, provider: str, status_code: int, detail: str):
+        super().__init__(f"{provider}: HTTP {status_code}: {detail}")
+        self.provider = provider
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class ProviderStats:
+    """Rolling latency window + EWMA error rate for one provider"""
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+    error_rate: float = 0.0
+    requests: int = 0
+    errors: int = 0
+    hedges_won: int = 0
+
+    def record(self, latency: float, ok: bool):
+        self.requests += 1
+        if ok:
+            self.latencies.append(latency)
+        else:
+            self.errors += 1
+        self.error_rate = (1 - ERROR_RATE_ALPHA) * self.error_rate + ERROR_RATE_ALPHA * (0.0 if ok else 1.0)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < MIN_SAMPLES_FOR_P95:
+            return OCR_HEDGE_DEFAULT_DELAY
+        return min(OCR_HEDGE_MAX_DELAY, max(OCR_HEDGE_MIN_DELAY, self.percentile(0.95)))
+
+    def score(self) -> float:
+        """Lower is better: median latency, penalised by recent errors"""
+        p50 = self.percentile(0.5) or OCR_HEDGE_DEFAULT_DELAY
+        return p50 * (1 + 4 * self.error_rate)
+
+    def snapshot(self) -> Dict:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 3),
+            "p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000) if p95 is not None else None,
+            "hedges_won": self.hedges_won,
+        }
+
+
+@dataclass
+class VisionProvider:
+    """One vision back end (same request shapes as the main_*.py variants)"""
+    name: str
+    api_url: str
+    model: str
+    key_envs: Tuple[str, ...]
+    style: str = "openai"  # openai / anthropic / github
+    max_tokens: int = 4000
+
+    @property
+    def api_key(self) -> Optional[str]:
+        for env in self.key_envs:
+            value = os.environ.get(env)
+            if value:
+                return value
+        return None
+
+    def _request(self, prompt: str, media_type: str, max_tokens: Optional[int] = None) -> Tuple[Dict, Dict]:
+        """Headers and payload, with IMAGE_PLACEHOLDER where the image goes (`max_tokens` capped at the provider's)"""
+        if self.style == "anthropic":
+            headers = {
+                "x-api-key": self.api_key,
+                "anthropic-version": "2023-06-01",
+                "Content-Type": "application/json"
+            }
+            image_block = {
+                "type": "image",
+                "source": {"type": "base64", "media_type": media_type, "data": IMAGE_PLACEHOLDER}
+            }
+        else:
+            headers = {
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            }
+            if self.style == "github":
+                image_block = {
+                    "type": "image",
+                    "source": {"type": "base64", "media_type": media_type, "data": IMAGE_PLACEHOLDER}
+                }
+            else:
+                image_block = {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:{media_type};base64,{IMAGE_PLACEHOLDER}"}
+                }
+
+        payload = {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [image_block, {"type": "text", "text": prompt}]
+                }
+            ],
+            "temperature": 0.1,
+            "max_tokens": min(max_tokens, self.max_tokens) if max_tokens else self.max_tokens
+        }
+        return headers, payload
+
+    @property
+    def upstream(self):
+        return get_upstream(self.name, self.api_key)
+
+    async def call(self, image_b64: bytes, prompt: str, media_type: str = "image/jpeg",
+                   retries: Optional[int] = None, max_tokens: Optional[int] = None) -> str:
+        """Send one request (rate-limited, retried on 429/5xx), return the raw text of the reply"""
+        headers, payload = self._request(prompt, media_type, max_tokens)
+        body = encode_json_with_image(payload, image_b64)
+        client = get_client(self.api_url)
+        UPSTREAM_PAYLOAD_BYTES.labels(self.name).observe(len(body))
+        response = await self.upstream.call(
+            lambda: client.post(self.api_url, headers=headers, content=body),
+            max_retries=retries,
+            model=self.model
+        )
+
+        if response.status_code != 200:
+            raise ProviderError(self.name, response.status_code, response.text)
+
+        data = loads(response.content)
+        if self.style == "anthropic":
+            return data["content"][0]["text"]
+        return data["choices"][0]["message"]["content"]
+
+
+PROVIDERS: Dict[str, VisionProvider] = {
+    "dashscope": VisionProvider(
+        name="dashscope",
+        api_url=f"{DASHSCOPE_BASE_URL}/compatible-mode/v1/chat/completions",
+        model="qwen-vl-max",
+        key_envs=("DASHSCOPE_API_KEY", "QWEN_API_KEY"),
+        max_tokens=4096,
+    ),
+    "dashscope-intl": VisionProvider(
+        name="dashscope-intl",
+        api_url="https://dashscope-intl.aliyuncs.com/compatible-mode/v1/chat/completions",
+        model="qwen3-vl-plus",
+        key_envs=("DASHSCOPE_INTL_API_KEY", "DASHSCOPE_API_KEY"),
+    ),
+    "openai": VisionProvider(
+        name="openai",
+        api_url="https://api.openai.com/v1/chat/completions",
+        model="gpt-4o",
+        key_envs=("OPENAI_API_KEY",),
+    ),
+    "anthropic": VisionProvider(
+        name="anthropic",
+        api_url="https://api.anthropic.com/v1/messages",
+        model="claude-3-5-sonnet-20241022",
+        key_envs=("ANTHROPIC_API_KEY",),
+        style="anthropic",
+    ),
+    "github": VisionProvider(
+        name="github",
+        api_url="https://api.githubcopilot.com/chat/completions",
+        model="claude-sonnet-4-20250514",
+        key_envs=("GITHUB_TOKEN",),
+        style="github",
+    ),
+}
+
+
+class HedgedVisionRouter:
+    """
+    Route vision calls across providers, hedging slow ones
+
+    `parse` turns the raw reply into a result and raises ValueError when the
+    reply is not usable; an unusable reply counts as a provider error.
+    """
+
+    def __init__(self, providers: List[VisionProvider], hedge: bool = OCR_HEDGE_ENABLED):
+        if not providers:
+            raise ValueError("No vision provider configured")
+        self.providers = providers
+        self.hedge = hedge and len(providers) > 1
+        self.stats: Dict[str, ProviderStats] = {p.name: ProviderStats() for p in providers}
+
+    @classmethod
+    def from_env(cls, names: str = OCR_PROVIDERS) -> "HedgedVisionRouter":
+        providers = []
+        for name in [n.strip() for n in names.split(",") if n.strip()]:
+            provider = PROVIDERS.get(name)
+            if provider is None:
+                logger.warning(f"Unknown OCR provider: {name}")
+            elif not provider.api_key:
+                logger.warning(f"OCR provider {name} skipped: {'/'.join(provider.key_envs)} not set")
+            else:
+                providers.append(provider)
+        if not providers:
+            # Keep the service importable; calls will fail with the upstream's auth error
+            providers = [PROVIDERS["dashscope"]]
+        return cls(providers)
+
+    @property
+    def cache_model(self) -> str:
+        """Model identity used in OCR cache keys"""
+        return "+".join(sorted(p.model for p in self.providers))
+
+    @property
+    def upstream_urls(self) -> List[str]:
+        return [p.api_url for p in self.providers]
+
+    def ranked(self) -> List[VisionProvider]:
+        """Best first; providers with an open circuit go last"""
+        return sorted(self.providers, key=lambda p: (p.upstream.breaker.state == OPEN, self.stats[p.name].score()))
+
+    async def _attempt(self, provider: VisionProvider, image_b64: bytes, prompt: str,
+                       media_type: str, parse: Callable[[str], Any], max_tokens: Optional[int]) -> Any:
+        started = time.perf_counter()
+        try:
+            # With other providers to fail over to, don't sit in backoff on this one
+            retries = 0 if len(self.providers) > 1 else None
+            content = await provider.call(image_b64, prompt, media_type, retries, max_tokens)
+            result = parse(content)
+        except asyncio.CancelledError:
+            raise
+        except ValueError as e:
+            self.stats[provider.name].record(time.perf_counter() - started, ok=False)
+            raise ProviderError(provider.name, 502, f"Unusable reply: {e}")
+        except Exception:
+            self.stats[provider.name].record(time.perf_counter() - started, ok=False)
+            raise
+        self.stats[provider.name].record(time.perf_counter() - started, ok=True)
+        return result
+
+    async def call(self, image_b64: bytes, prompt: str, media_type: str,
+                   parse: Callable[[str], Any], max_tokens: Optional[int] = None) -> Tuple[Any, str]:
+        """Return (parsed result, provider name) from the first provider with a valid reply"""
+        queue = self.ranked()
+
+        pending: Dict[asyncio.Task, VisionProvider] = {}
+        last_error: Optional[Exception] = None
+
+        def launch():
+            provider = queue.pop(0)
+            task = asyncio.create_task(self._attempt(provider, image_b64, prompt, media_type, parse, max_tokens))
+            pending[task] = provider
+            return provider
+
+        primary = launch()
+        try:
+            while pending:
+                # Hedge after the primary's p95; without hedging, remaining providers are failover only
+                timeout = self.stats[primary.name].hedge_delay() if self.hedge and queue else None
+                done, _ = await asyncio.wait(pending.keys(), timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = launch()
+                    logger.info(f"OCR hedge: {primary.name} slower than "
+                                f"{timeout:.1f}s, also trying {hedged.name}")
+                    continue
+
+                for task in done:
+                    provider = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        logger.warning(f"OCR provider {provider.name} failed: {e}")
+                        last_error = e
+                        continue
+                    if provider is not primary:
+                        self.stats[provider.name].hedges_won += 1
+                    return result, provider.name
+
+                if not pending and queue:
+                    # Everything in flight failed: fail over right away
+                    primary = launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise last_error or ProviderError("router", 502, "No provider returned a result")
+
+    def snapshot(self) -> Dict:
+        return {
+            "hedge": self.hedge,
+            "providers": {
+                p.name: {"model": p.model, "circuit": p.upstream.breaker.state, **self.stats[p.name].snapshot()}
+                for p in self.ranked()
+            }
+        }
@@ -0,0 +1,261 @@
+"""
+Upstream resilience: rate limiting, retry with backoff, circuit breaker
+DashScope 一返 429 / 5xx，以前就即刻變 HTTPException，client 即刻 retry，越 retry 越 overload。
+
+而家每個 (provider, API key) 有一個 `Upstream`：
+- token bucket rate limit：唔會自己打爆 quota
+- 429 / 5xx / network error：jittered exponential backoff，有 `Retry-After` 就跟佢
+- circuit breaker：連續失敗就 open，fail fast 一段時間，之後 half-open 試一個 request
+"""
+
+import asyncio
+import email.utils
+import hashlib
+import logging
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+
+from metrics import UPSTREAM_IN_FLIGHT, UPSTREAM_LATENCY, status_class
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+UPSTREAM_RATE_LIMIT = float(os.environ.get("UPSTREAM_RATE_LIMIT", "5"))   # requests / second
+UPSTREAM_BURST = float(os.environ.get("UPSTREAM_BURST", "10"))
+UPSTREAM_MAX_RETRIES = int(os.environ.get("UPSTREAM_MAX_RETRIES", "3"))
+UPSTREAM_BACKOFF_BASE = float(os.environ.get("UPSTREAM_BACKOFF_BASE", "0.5"))
+UPSTREAM_BACKOFF_MAX = float(os.environ.get("UPSTREAM_BACKOFF_MAX", "20"))
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.environ.get("BREAKER_RESET_TIMEOUT", "30"))
+
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(Exception):
+    """The provider is failing; calls are rejected until the breaker resets"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} unavailable (circuit open, retry in {retry_after:.1f}s)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Token bucket: `rate` requests per second, bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe"""
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probing = False
+
+    def check(self):
+        """Raise CircuitOpenError unless a call may go through now"""
+        if self.state == OPEN:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(self.name, remaining)
+            self.state = HALF_OPEN
+            logger.info(f"Circuit {self.name}: half-open, probing")
+        if self.state == HALF_OPEN:
+            if self._probing:
+                raise CircuitOpenError(self.name, self.reset_timeout)
+            self._probing = True
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info(f"Circuit {self.name}: closed")
+        self.state = CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def release(self):
+        """A call ended without an outcome (cancelled): let another probe through"""
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.times_opened += 1
+                logger.warning(f"Circuit {self.name}: open after {self.failures} failures")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict:
+        snap = {"state": self.state, "consecutive_failures": self.failures, "times_opened": self.times_opened}
+        if self.state == OPEN:
+            snap["retry_in_s"] = round(max(0.0, self.opened_at + self.reset_timeout - time.monotonic()), 1)
+        return snap
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """`Retry-After` as seconds (delta-seconds or HTTP date), None when absent"""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+        return max(0.0, when.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float = UPSTREAM_BACKOFF_BASE, cap: float = UPSTREAM_BACKOFF_MAX) -> float:
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class Upstream:
+    """Rate limiter + retries + breaker for one (provider, API key)"""
+
+    def __init__(self, name: str, rate: float = UPSTREAM_RATE_LIMIT, burst: float = UPSTREAM_BURST,
+                 max_retries: int = UPSTREAM_MAX_RETRIES, provider: Optional[str] = None):
+        self.name = name
+        self.provider = provider or name
+        self.limiter = RateLimiter(rate, burst)
+        self.breaker = CircuitBreaker(name)
+        self.max_retries = max_retries
+        self.requests = 0
+        self.retries = 0
+        self.rejected = 0
+
+    async def call(self, send: Callable[[], Awaitable[httpx.Response]],
+                   max_retries: Optional[int] = None, model: str = "") -> httpx.Response:
+        """
+        Run `send` under the rate limit, retrying 429 / 5xx / network errors
+
+        Returns the last response even when it is an error, so callers keep
+        their own error handling; raises CircuitOpenError while the breaker is open.
+        """
+        retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            try:
+                self.breaker.check()
+            except CircuitOpenError:
+                self.rejected += 1
+                raise
+            await self.limiter.acquire()
+            self.requests += 1
+
+            started = time.perf_counter()
+            outcome = "error"
+            UPSTREAM_IN_FLIGHT.labels(self.provider).inc()
+            try:
+                response = await send()
+                outcome = status_class(response.status_code)
+            except httpx.TransportError as e:
+                self.breaker.record_failure()
+                if attempt >= retries:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"{self.name}: {type(e).__name__}, retry {attempt + 1}/{retries} in {delay:.1f}s")
+            except BaseException:
+                # Cancelled (e.g. hedge lost): don't leave a half-open probe hanging
+                self.breaker.release()
+                outcome = "cancelled"
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS:
+                    self.breaker.record_success()
+                    return response
+                self.breaker.record_failure()
+                if attempt >= retries:
+                    return response
+                retry_after = retry_after_seconds(response) or 0.0
+                if retry_after > UPSTREAM_BACKOFF_MAX:
+                    # Upstream wants a longer pause than we'd hold a request for
+                    return response
+                delay = max(retry_after, backoff_delay(attempt))
+                logger.warning(f"{self.name}: HTTP {response.status_code}, "
+                               f"retry {attempt + 1}/{retries} in {delay:.1f}s")
+                await response.aclose()
+            finally:
+                UPSTREAM_IN_FLIGHT.labels(self.provider).dec()
+                UPSTREAM_LATENCY.labels(self.provider, model, outcome).observe(time.perf_counter() - started)
+
+            self.retries += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def snapshot(self) -> Dict:
+        return {
+            "circuit": self.breaker.snapshot(),
+            "rate_limit": self.limiter.rate,
+            "tokens": round(self.limiter.tokens, 1),
+            "requests": self.requests,
+            "retries": self.retries,
+            "rejected": self.rejected,
+        }
+
+
+_upstreams: Dict[Tuple[str, str], Upstream] = {}
+
+
+def _env_rate(provider: str) -> float:
+    """Per-provider override, e.g. WANX_RATE_LIMIT=0.5"""
+    env = f"{provider.upper().replace('-', '_')}_RATE_LIMIT"
+    return float(os.environ.get(env, UPSTREAM_RATE_LIMIT))
+
+
+def get_upstream(provider: str, api_key: Optional[str]) -> Upstream:
+    """Shared Upstream for (provider, API key); keys are only kept as a short hash"""
+    key_id = hashlib.sha256((api_key or "").encode()).hexdigest()[:8]
+    upstream = _upstreams.get((provider, key_id))
+    if upstream is None:
+        upstream = Upstream(f"{provider}:{key_id}", rate=_env_rate(provider), provider=provider)
+        _upstreams[(provider, key_id)] = upstream
+    return upstream
+
+
+def upstreams_snapshot() -> Dict:
+    return {upstream.name: upstream.snapshot() for upstream in _upstreams.values()}
+
+
+def any_circuit_open() -> bool:
+    return any(u.breaker.state == OPEN for u in _upstreams.values())
@@ -0,0 +1,53 @@
+"""
+In-process request coalescing (single-flight)
+同一個 key 嘅 concurrent request 只會 call upstream 一次，其他人等同一個結果。
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key
+
+    The upstream call runs in its own task, so a caller that disconnects
+    (and gets cancelled) does not cancel the work the others are waiting for.
+    """
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._inflight
+
+    def start(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[asyncio.Task, bool]:
+        """
+        Start `fn` for `key`, or join the call already in flight
+
+        Returns (task, leader); `fn` is only invoked when leader is True.
+        Synchronous, so check-and-start cannot race with another request.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            logger.info(f"{self.name}: joined in-flight call for {key}")
+            return task, False
+
+        task = asyncio.create_task(fn())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._finished(key, t))
+        return task, True
+
+    def _finished(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        # Retrieve the exception even if every waiter has gone away
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"{self.name}: call for {key} failed: {task.exception()}")
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task, _ = self.start(key, fn)
+        return await asyncio.shield(task)
@@ -0,0 +1,345 @@
+"""
+Tesseract worker pool
+以前 main_tesseract.py 喺 async handler 入面直接 call `pytesseract.image_to_string`：
+OCR 做緊嗰幾秒 event loop 成個 block 住（/health 都要等），而且每次都 spawn 一個新 tesseract
+process 重新 load `chi_tra+eng` traineddata。
+
+而家：
+- ProcessPoolExecutor，worker 數 = CPU cores；每個 worker 一起身就 load 好 engine，之後一直重用
+  （有 tesserocr 就用 PyTessBaseAPI；冇就 fallback 返 pytesseract，起碼唔會 block event loop，
+  但每次照舊 spawn tesseract，所以 startup 會 log error）
+- Request 入 asyncio.Queue，每個 worker 一個 dispatcher 逐張交俾 pool，排隊中嘅相唔會塞爆 pool
+- Queue 滿咗就 TesseractBusyError（503），唔會無限咁排
+- Worker crash（BrokenProcessPool）會自動重開 pool
+- 成版工作紙先喺 worker 度 binarise / deskew / 切 line strip（line_segment.py），
+  再將啲 strip 平行分晒俾所有 worker（PSM 7），按次序砌返；切唔到行就成版 OCR
+- `recognize_lines` 仲會返每行嘅 confidence 同 strip 圖（hybrid mode 用嚟決定邊幾行要再問 vision model）
+"""
+
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from metrics import TESSERACT_BUSY, TESSERACT_QUEUED, TESSERACT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+TESSERACT_WORKERS = int(os.environ.get("TESSERACT_WORKERS", str(os.cpu_count() or 2)))
+TESSERACT_LANG = os.environ.get("TESSERACT_LANG", "chi_tra+eng")
+TESSERACT_PSM = int(os.environ.get("TESSERACT_PSM", "3"))  # 3 = fully automatic page segmentation
+TESSERACT_QUEUE_SIZE = int(os.environ.get("TESSERACT_QUEUE_SIZE", str(TESSERACT_WORKERS * 8)))
+TESSERACT_SEGMENT_LINES = os.environ.get("TESSERACT_SEGMENT_LINES", "true").lower() in ("1", "true", "yes")
+TESSERACT_LINE_PSM = int(os.environ.get("TESSERACT_LINE_PSM", "7"))  # 7 = single text line
+
+# Roughly how long one page takes, only used for Retry-After
+EXPECTED_OCR_SECONDS = 2.0
+
+
+class TesseractBusyError(Exception):
+    """Too many images waiting for OCR"""
+
+    def __init__(self, queued: int, retry_after: float):
+        super().__init__(f"OCR queue full ({queued} images waiting)")
+        self.queued = queued
+        self.retry_after = retry_after
+
+
+# --- worker process side ---
+
+_engine: Optional["_Engine"] = None
+_engine_error: Optional[str] = None
+
+
+class _Engine:
+    """One loaded Tesseract, kept for the life of the worker process"""
+
+    def __init__(self, lang: str, psm: int):
+        self.lang = lang
+        self.psm = psm
+        try:
+            import tesserocr
+            self._api = tesserocr.PyTessBaseAPI(lang=lang, psm=tesserocr.PSM(psm))
+            self._psm = psm
+            self.name = "tesserocr"
+            self.version = tesserocr.tesseract_version().splitlines()[0]
+        except ImportError:
+            import pytesseract
+            self._api = None
+            self.name = "pytesseract"
+            self.version = str(pytesseract.get_tesseract_version())
+
+    def _set_image(self, image, psm: int):
+        if psm != self._psm:
+            import tesserocr
+            self._api.SetPageSegMode(tesserocr.PSM(psm))
+            self._psm = psm
+        self._api.SetImage(image)
+
+    def recognize(self, image, psm: Optional[int] = None) -> str:
+        psm = self.psm if psm is None else psm
+        if self._api is not None:
+            self._set_image(image, psm)
+            return self._api.GetUTF8Text()
+        import pytesseract
+        return pytesseract.image_to_string(image, lang=self.lang, config=f"--psm {psm}")
+
+    def recognize_data(self, image, psm: Optional[int] = None) -> Tuple[str, float]:
+        """Text plus mean word confidence (0-100, 0 when nothing was read)"""
+        psm = self.psm if psm is None else psm
+        if self._api is not None:
+            self._set_image(image, psm)
+            return self._api.GetUTF8Text(), float(self._api.MeanTextConf())
+        import pytesseract
+        data = pytesseract.image_to_data(image, lang=self.lang, config=f"--psm {psm}",
+                                         output_type=pytesseract.Output.DICT)
+        words = [(text, float(conf)) for text, conf in zip(data["text"], data["conf"])
+                 if text.strip() and float(conf) >= 0]
+        if not words:
+            return "", 0.0
+        # Weighted by length so a stray 1-char word doesn't count as much as a whole English word
+        chars = sum(len(text) for text, _ in words)
+        return " ".join(text for text, _ in words), sum(len(text) * conf for text, conf in words) / chars
+
+
+def _init_worker(lang: str, psm: int):
+    global _engine, _engine_error
+    # One core per worker: Tesseract's own OpenMP threads would fight the other workers
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    try:
+        _engine = _Engine(lang, psm)
+    except Exception as e:
+        # Raising here would only surface as "BrokenProcessPool"; report it from _warm instead
+        _engine_error = f"{type(e).__name__}: {e}"
+
+
+def _warm() -> Dict:
+    if _engine is None:
+        raise RuntimeError(f"Tesseract engine failed to load: {_engine_error}")
+    # Hold the task briefly so each warm-up call lands on a different (already initialised) worker
+    time.sleep(0.05)
+    return {"pid": os.getpid(), "engine": _engine.name, "version": _engine.version}
+
+
+def _load(source: Union[bytes, np.ndarray]):
+    from PIL import Image
+
+    if isinstance(source, bytes):
+        image = Image.open(io.BytesIO(source))
+        image.load()
+        return image
+    return Image.fromarray(source)
+
+
+def _recognize(source: Union[bytes, np.ndarray], psm: Optional[int] = None) -> str:
+    """Decode + OCR inside the worker, so Pillow doesn't run on the event loop either"""
+    return _engine.recognize(_load(source), psm)
+
+
+def _recognize_data(source: Union[bytes, np.ndarray], psm: Optional[int] = None) -> Tuple[str, float]:
+    return _engine.recognize_data(_load(source), psm)
+
+
+def _segment(contents: bytes) -> List[np.ndarray]:
+    from line_segment import segment_lines
+
+    return segment_lines(contents)
+
+
+# --- event loop side ---
+
+@dataclass
+class OCRLine:
+    """One recognised line; `image` is the grayscale strip (None when the page didn't segment)"""
+    text: str
+    confidence: float
+    image: Optional[np.ndarray] = None
+
+
+@dataclass
+class _Job:
+    contents: bytes
+    future: asyncio.Future
+    lines: bool = False
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+class TesseractPool:
+    """Async front-end for a pool of warm Tesseract worker processes"""
+
+    def __init__(self, workers: int = TESSERACT_WORKERS, lang: str = TESSERACT_LANG,
+                 psm: int = TESSERACT_PSM, queue_size: int = TESSERACT_QUEUE_SIZE,
+                 segment_lines: bool = TESSERACT_SEGMENT_LINES, line_psm: int = TESSERACT_LINE_PSM):
+        self.workers = max(1, workers)
+        self.lang = lang
+        self.psm = psm
+        self.queue_size = queue_size
+        self.segment_lines = segment_lines
+        self.line_psm = line_psm
+        self.engine: Optional[str] = None
+        self.version: Optional[str] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._queue: Optional["asyncio.Queue[_Job]"] = None
+        self._tasks: List[asyncio.Task] = []
+        self._busy = 0
+
+    # --- lifecycle ---
+
+    async def start(self):
+        """Start the workers and wait until every one has loaded its traineddata"""
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._executor = self._new_executor()
+        await self._warm_up()
+        self._tasks = [asyncio.create_task(self._dispatcher()) for _ in range(self.workers)]
+        logger.info(f"Tesseract pool started ({self.workers} workers, {self.engine} {self.version}, lang={self.lang})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    # --- public API ---
+
+    async def recognize(self, contents: bytes) -> str:
+        """OCR one image (encoded bytes); raises TesseractBusyError when the queue is full"""
+        return await self._submit(contents, lines=False)
+
+    async def recognize_lines(self, contents: bytes) -> List[OCRLine]:
+        """Like `recognize`, but per line with confidences and the strip images"""
+        return await self._submit(contents, lines=True)
+
+    async def _submit(self, contents: bytes, lines: bool):
+        loop = asyncio.get_running_loop()
+        job = _Job(contents, loop.create_future(), lines)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            queued = self._queue.qsize()
+            raise TesseractBusyError(queued, EXPECTED_OCR_SECONDS * queued / self.workers)
+        TESSERACT_QUEUED.set(self._queue.qsize())
+        return await job.future
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "busy": self._busy,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "engine": self.engine,
+            "version": self.version,
+            "lang": self.lang,
+            "segment_lines": self.segment_lines,
+        }
+
+    # --- internals ---
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn (not fork): never copy the event loop / threads of the running server into a worker
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.lang, self.psm),
+        )
+
+    async def _warm_up(self):
+        loop = asyncio.get_running_loop()
+        infos = await asyncio.gather(*(loop.run_in_executor(self._executor, _warm) for _ in range(self.workers)))
+        self.engine = infos[0]["engine"]
+        self.version = infos[0]["version"]
+        if self.engine == "pytesseract":
+            logger.error("tesserocr is not installed: falling back to pytesseract, which spawns a tesseract "
+                         "process and reloads traineddata on every call. Install tesserocr (see Dockerfile) "
+                         "for the warm pool.")
+
+    async def _dispatcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            TESSERACT_QUEUED.set(self._queue.qsize())
+            if job.future.done():
+                # Client went away while the image was queued
+                continue
+            self._busy += 1
+            TESSERACT_BUSY.set(self._busy)
+            started = time.monotonic()
+            executor = self._executor
+            try:
+                if job.lines:
+                    result = await self._ocr_lines(executor, job.contents)
+                else:
+                    result = await self._ocr_page(executor, job.contents)
+            except BrokenProcessPool as e:
+                if self._executor is executor:
+                    # Only the first dispatcher to notice replaces it
+                    logger.error(f"Tesseract worker died, restarting pool: {e}")
+                    self._restart()
+                if not job.future.done():
+                    job.future.set_exception(RuntimeError("Tesseract worker crashed"))
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                TESSERACT_SECONDS.labels("queue").observe(started - job.queued_at)
+                TESSERACT_SECONDS.labels("ocr").observe(time.monotonic() - started)
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self._busy -= 1
+                TESSERACT_BUSY.set(self._busy)
+
+    async def _segment(self, executor: ProcessPoolExecutor, contents: bytes) -> List[np.ndarray]:
+        """Line strips of the page, [] to OCR it whole"""
+        if not self.segment_lines:
+            return []
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        try:
+            strips = await loop.run_in_executor(executor, _segment, contents)
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            logger.warning(f"Line segmentation failed, OCR whole page: {e}")
+            strips = []
+        TESSERACT_SECONDS.labels("segment").observe(time.monotonic() - started)
+        return strips
+
+    async def _ocr_page(self, executor: ProcessPoolExecutor, contents: bytes) -> str:
+        """Line strips spread over every worker when the page segments cleanly, else one whole-page call"""
+        loop = asyncio.get_running_loop()
+        strips = await self._segment(executor, contents)
+        if strips:
+            texts = await asyncio.gather(*(
+                loop.run_in_executor(executor, _recognize, strip, self.line_psm) for strip in strips
+            ))
+            return "\n".join(text.strip() for text in texts if text.strip())
+        return await loop.run_in_executor(executor, _recognize, contents, self.psm)
+
+    async def _ocr_lines(self, executor: ProcessPoolExecutor, contents: bytes) -> List[OCRLine]:
+        loop = asyncio.get_running_loop()
+        strips = await self._segment(executor, contents)
+        if strips:
+            results = await asyncio.gather(*(
+                loop.run_in_executor(executor, _recognize_data, strip, self.line_psm) for strip in strips
+            ))
+            return [OCRLine(text.strip(), conf, strip) for (text, conf), strip in zip(results, strips)]
+        text, conf = await loop.run_in_executor(executor, _recognize_data, contents, self.psm)
+        return [OCRLine(text.strip(), conf)]
+
+    def _restart(self):
+        """Replace a broken executor; other dispatchers pick up the new one on their next job"""
+        broken, self._executor = self._executor, self._new_executor()
+        if broken is not None:
+            broken.shutdown(wait=False, cancel_futures=True)
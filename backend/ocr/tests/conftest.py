@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The service modules are flat files in backend/ocr, imported by name (as uvicorn main:app does)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
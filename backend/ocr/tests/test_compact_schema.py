@@ -0,0 +1,108 @@
+import io
+
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+from compact_schema import (COMPACT_UPLOAD, COMPACT_VOCAB, OCR_MIN_OUTPUT_TOKENS, OCR_TOKENS_PER_LINE, ReplyFormat,
+                            VocabularyRowStreamParser, estimate_text_items, expand_text, expand_vocabulary, parse_row)
+
+APPLE = {"chinese": "蘋果", "english": "apple", "pinyin": "píng guǒ"}
+BANANA = {"chinese": "香蕉", "english": "banana", "pinyin": ""}
+
+
+def test_max_tokens():
+    assert COMPACT_VOCAB.max_tokens(None) is None
+    assert COMPACT_VOCAB.max_tokens(0) is None
+    assert COMPACT_VOCAB.max_tokens(10) == OCR_MIN_OUTPUT_TOKENS + 10 * OCR_TOKENS_PER_LINE
+    assert COMPACT_UPLOAD.max_tokens(10) == OCR_MIN_OUTPUT_TOKENS + 20 * OCR_TOKENS_PER_LINE
+    # A JSON prompt keeps the provider's fixed budget
+    assert ReplyFormat("JSON please").max_tokens(10) is None
+
+
+@pytest.mark.parametrize("row", ["蘋果\tapple\tpíng guǒ", "1. 蘋果\tapple\tpíng guǒ", "| 蘋果 | apple | píng guǒ |"])
+def test_parse_row(row):
+    assert parse_row(row) == APPLE
+
+
+def test_parse_row_fills_missing_columns():
+    assert parse_row("香蕉\tbanana") == BANANA
+    assert parse_row("\t\t") is None
+
+
+def test_expand_vocabulary_complete():
+    assert expand_vocabulary("蘋果\tapple\tpíng guǒ\n\n香蕉\tbanana\t\nEND\n") == {"vocabulary": [APPLE, BANANA]}
+
+
+def test_expand_vocabulary_truncated_drops_the_half_row():
+    assert expand_vocabulary("蘋果\tapple\tpíng guǒ\n香蕉\tban") == {"vocabulary": [APPLE], "partial": True}
+    # Cut off right after a newline: the last row is complete
+    assert expand_vocabulary("蘋果\tapple\tpíng guǒ\n") == {"vocabulary": [APPLE], "partial": True}
+    assert expand_vocabulary("蘋果\tap") is None
+
+
+@pytest.mark.parametrize("reply", ['{"vocabulary": []}', '```json\n{"vocabulary": []}\n```', '[{"english": "a"}]'])
+def test_json_reply_is_left_to_the_json_parser(reply):
+    assert expand_vocabulary(reply) is None
+    assert expand_text(reply) is None
+
+
+def test_expand_text():
+    reply = "1. 蘋果 apple píng guǒ\n2. 香蕉 banana\n---\n蘋果\tapple\tpíng guǒ\n香蕉\tbanana\t\nEND"
+    assert expand_text(reply) == {
+        "text": "1. 蘋果 apple píng guǒ\n2. 香蕉 banana",
+        "words": [APPLE, BANANA],
+        "lines": ["1. 蘋果 apple píng guǒ", "2. 香蕉 banana"],
+    }
+
+
+def test_expand_text_cut_off_before_the_word_rows():
+    result = expand_text("蘋果 apple\n香蕉 banana\n橙 ora")
+    assert result["partial"] is True
+    assert result["lines"] == ["蘋果 apple", "香蕉 banana"]
+    assert [w["english"] for w in result["words"]] == ["apple", "banana"]
+
+
+@pytest.mark.parametrize("size", [1, 4, 1000])
+def test_row_stream_parser(size):
+    text = "蘋果\tapple\tpíng guǒ\n香蕉\tbanana\t\nEND\n橙\torange\t\n"
+    parser = VocabularyRowStreamParser()
+    emitted = []
+    for i in range(0, len(text), size):
+        emitted.extend(parser.feed(text[i:i + size]))
+    assert emitted == [APPLE, BANANA]
+    assert parser.items == emitted
+
+
+def test_row_stream_parser_hands_json_to_the_json_parser():
+    text = '```json\n{"vocabulary": [{"english": "apple", "chinese": "蘋果"}]}\n```'
+    parser = VocabularyRowStreamParser()
+    emitted = []
+    for i in range(0, len(text), 3):
+        emitted.extend(parser.feed(text[i:i + 3]))
+    assert emitted == [{"english": "apple", "chinese": "蘋果"}]
+    assert parser.items == emitted
+
+
+def worksheet(columns: int, rows: int) -> bytes:
+    font = ImageFont.load_default(size=40)
+    page = Image.new("L", (2480, 3508), 240)
+    draw = ImageDraw.Draw(page)
+    for c in range(columns):
+        for i in range(rows):
+            draw.text((150 + c * 2400 // columns, 200 + i * 3000 // rows), f"{i + 1}. apple píng", fill=20, font=font)
+    buf = io.BytesIO()
+    page.save(buf, "JPEG")
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("columns", [1, 2, 3])
+def test_estimate_counts_every_column(columns):
+    # Two-column word lists used to count as half their items and get too small a budget
+    assert estimate_text_items(worksheet(columns, 30)) == 30 * columns
+
+
+def test_estimate_unknown_for_blank_or_undecodable():
+    blank = io.BytesIO()
+    Image.new("L", (800, 600), 255).save(blank, "JPEG")
+    assert estimate_text_items(blank.getvalue()) is None
+    assert estimate_text_items(b"not an image") is None
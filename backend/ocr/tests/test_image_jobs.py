@@ -0,0 +1,53 @@
+import asyncio
+
+from image_jobs import FAILED, RUNNING, SUCCEEDED, ImageJobScheduler
+
+
+async def start_task(word):
+    return f"task-{word}"
+
+
+async def on_success(word, url):
+    return f"/images/{word}.png"
+
+
+def test_failing_polls_time_out_and_free_the_slot():
+    async def broken_task(task_id):
+        raise KeyError("output")
+
+    async def scenario():
+        scheduler = ImageJobScheduler(start_task, broken_task, on_success, concurrency=1, poll_interval=0.01, timeout=0.05)
+        scheduler.start()
+        try:
+            first = scheduler.submit("apple")
+            assert await first.wait_done(2)
+            assert first.status == FAILED
+            assert "timed out" in first.error
+            assert scheduler.stats()["running"] == 0
+
+            # The single slot came back, so the next job still gets submitted
+            second = scheduler.submit("banana")
+            await asyncio.sleep(0.03)
+            assert second.status in (RUNNING, FAILED)
+            assert second.task_id == "task-banana"
+        finally:
+            await scheduler.stop()
+
+    asyncio.run(scenario())
+
+
+def test_successful_poll():
+    async def done_task(task_id):
+        return {"task_status": "SUCCEEDED", "results": [{"url": "http://x/1.png"}]}
+
+    async def scenario():
+        scheduler = ImageJobScheduler(start_task, done_task, on_success, concurrency=1, poll_interval=0.01)
+        scheduler.start()
+        try:
+            job = scheduler.submit("apple")
+            assert await job.wait_done(2)
+            assert (job.status, job.url) == (SUCCEEDED, "/images/apple.png")
+        finally:
+            await scheduler.stop()
+
+    asyncio.run(scenario())
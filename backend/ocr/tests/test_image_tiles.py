@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from image_tiles import OCR_TILE_OVERLAP, plan_bands
+
+
+def page_ink(lines: int, height: int = 1000, width: int = 600, line_height: int = 14):
+    """Binary mask with `lines` evenly spaced text lines; returns (ink, [(top, bottom)])"""
+    ink = np.zeros((height, width), dtype=bool)
+    pitch = (height - 100) // lines
+    spans = []
+    for i in range(lines):
+        top = 50 + i * pitch
+        ink[top:top + line_height, 40:width - 40:3] = True
+        spans.append((top, top + line_height))
+    return ink, spans
+
+
+def contains(band, span, scale=1.0):
+    return band[0] <= span[0] * scale and span[1] * scale <= band[1]
+
+
+@pytest.mark.parametrize("count", [2, 3, 4])
+def test_bands_cut_between_lines_and_overlap_by_a_line(count):
+    ink, spans = page_ink(30)
+    bands = plan_bands(ink, ink.shape[0], count)
+
+    assert len(bands) == count
+    assert bands[0][0] == 0 and bands[-1][1] == ink.shape[0]
+    for band in bands:
+        # No cut goes through a line of text
+        for top, bottom in spans:
+            assert not top < band[0] < bottom and not top < band[1] < bottom
+    for upper, lower in zip(bands, bands[1:]):
+        assert lower[0] < upper[1]
+        shared = [span for span in spans if contains(upper, span) and contains(lower, span)]
+        assert len(shared) >= 1
+    # Every line is whole in at least one band
+    assert all(any(contains(band, span) for band in bands) for span in spans)
+
+
+def test_bands_scale_from_the_small_mask():
+    ink, spans = page_ink(24)
+    scale = 3.0
+    height = int(ink.shape[0] * scale)
+    bands = plan_bands(ink, height, 3, scale)
+    assert bands[0][0] == 0 and bands[-1][1] == height
+    assert all(any(contains(band, span, scale) for band in bands) for span in spans)
+
+
+@pytest.mark.parametrize("ink", [None, page_ink(3)[0]], ids=["no-mask", "too-few-lines"])
+def test_fixed_overlap_fallback(ink):
+    height = 1000
+    bands = plan_bands(ink, height, 4)
+    assert len(bands) == 4
+    assert bands[0][0] == 0 and bands[-1][1] == height
+    overlap = int(height / 4 * OCR_TILE_OVERLAP)
+    for upper, lower in zip(bands, bands[1:]):
+        assert upper[1] - lower[0] >= 2 * overlap - 1
+
+
+def jpeg(width: int, height: int) -> bytes:
+    import io
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new("L", (width, height), 255).save(buf, "JPEG")
+    return buf.getvalue()
+
+
+def test_tile_count():
+    from image_tiles import OCR_TILE_MAX_TILES, OCR_TILE_MIN_EDGE, OCR_TILE_TARGET_HEIGHT, tile_count
+    small, tall = jpeg(800, 600), jpeg(1000, OCR_TILE_MIN_EDGE + 200)
+    assert tile_count(small) == 1
+    assert tile_count(tall) == min(OCR_TILE_MAX_TILES, -(-(OCR_TILE_MIN_EDGE + 200) // OCR_TILE_TARGET_HEIGHT))
+    assert tile_count(tall, requested=1) == 1
+    assert tile_count(small, requested=3) == 3
+    assert tile_count(small, requested=99) == OCR_TILE_MAX_TILES
+    assert tile_count(small, minimum=2) == 2
+    assert tile_count(b"not an image", requested=3) == 1
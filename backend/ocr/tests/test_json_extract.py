@@ -0,0 +1,104 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from json_extract import JSONExtractError, extract_json, recover_vocabulary
+
+FIXTURES = Path(__file__).resolve().parent.parent / "bench" / "fixtures" / "model_outputs.jsonl"
+RECORDS = [json.loads(line) for line in FIXTURES.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+
+@pytest.mark.parametrize("record", RECORDS, ids=[r["name"] for r in RECORDS])
+def test_recorded_model_outputs(record):
+    result, repaired = extract_json(record["output"])
+    key = record["expect_key"]
+    assert isinstance(result, dict) and key in result
+    if key != "vocabulary":
+        return
+    if record["expected_items"] is not None and not repaired:
+        assert len(result[key]) == record["expected_items"]
+    else:
+        # Truncated, or a broken item in the middle: only complete items are kept
+        assert repaired
+        assert result[key]
+        assert all(set(item) == {"english", "chinese"} for item in result[key])
+        if record["expected_items"] is not None:
+            assert len(result[key]) <= record["expected_items"]
+
+
+def test_plain_and_fenced():
+    assert extract_json('{"a": 1}') == ({"a": 1}, False)
+    assert extract_json('Here:\n```json\n{"a": [1, 2]}\n```\nDone') == ({"a": [1, 2]}, False)
+
+
+def test_braces_inside_strings_and_prose():
+    text = 'Note {not json} then {"vocabulary": [{"english": "brace }", "chinese": "括號 ]"}]}'
+    result, repaired = extract_json(text)
+    assert result == {"vocabulary": [{"english": "brace }", "chinese": "括號 ]"}]}
+    assert not repaired
+
+
+def test_expected_type_skips_a_bracketed_prefix():
+    text = 'Page [1]: {"vocabulary": [{"english": "apple", "chinese": "蘋果"}]}'
+    assert extract_json(text)[0] == [1]
+    assert extract_json(text, expect=dict) == ({"vocabulary": [{"english": "apple", "chinese": "蘋果"}]}, False)
+    fenced = '```json\n[1]\n```\nSee [2] below {"vocabulary": []}'
+    assert extract_json(fenced, expect=dict) == ({"vocabulary": []}, False)
+    truncated = 'Page [1]: {"vocabulary": [{"english": "apple", "chinese": "蘋果"}, {"eng'
+    assert extract_json(truncated, expect=dict) == ({"vocabulary": [{"english": "apple", "chinese": "蘋果"}]}, True)
+    with pytest.raises(JSONExtractError):
+        extract_json("Pages [1] and [2]", expect=dict)
+
+
+def test_trailing_commas():
+    assert extract_json('{"a": [1, 2,], "b": {"c": 3,},}')[0] == {"a": [1, 2], "b": {"c": 3}}
+
+
+def test_truncated_inside_an_item_keeps_complete_items():
+    text = '{"vocabulary": [{"english": "apple", "chinese": "蘋果"}, {"english": "ban'
+    result, repaired = extract_json(text)
+    assert repaired
+    assert result == {"vocabulary": [{"english": "apple", "chinese": "蘋果"}]}
+
+
+def test_half_written_item_is_dropped_not_closed():
+    text = '{"vocabulary": [{"english": "apple", "chinese": "蘋果"}, {"english": "banana", "chin'
+    result, repaired = extract_json(text)
+    assert repaired
+    assert result == {"vocabulary": [{"english": "apple", "chinese": "蘋果"}]}
+
+
+def test_truncated_top_level_object_keeps_complete_fields():
+    text = '{"text": "abc", "words": ["a", "b"], "lines": ["l1", "l2'
+    assert extract_json(text) == ({"text": "abc", "words": ["a", "b"], "lines": ["l1"]}, True)
+
+
+def test_truncated_after_escaped_quote():
+    text = '{"vocabulary": [{"english": "a"}, {"english": "say \\"hi\\'
+    result, repaired = extract_json(text)
+    assert repaired
+    assert result == {"vocabulary": [{"english": "a"}]}
+
+
+def test_truncated_before_first_item_is_an_empty_list():
+    result, repaired = extract_json('{"vocabulary": [{"english": "ap')
+    assert repaired
+    assert result == {"vocabulary": []}
+
+
+def test_repair_can_be_disabled():
+    with pytest.raises(JSONExtractError):
+        extract_json('{"vocabulary": [{"english": "a"}, {"eng', repair=False)
+
+
+def test_nothing_to_extract():
+    with pytest.raises(JSONExtractError):
+        extract_json("no json here")
+    with pytest.raises(JSONExtractError):
+        extract_json('{"unterminated')
+
+
+def test_recover_vocabulary_skips_malformed_items():
+    text = '{"vocabulary": [{"english": "a"}, {"english": oops}, {"english": "c"}]}'
+    assert recover_vocabulary(text) == [{"english": "a"}, {"english": "c"}]
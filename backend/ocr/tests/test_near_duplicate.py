@@ -0,0 +1,120 @@
+import asyncio
+import hashlib
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, ImageEnhance
+
+from near_duplicate import (NEAR_DUP_MAX_DISTANCE, NEAR_DUP_MIN_LAYOUT_MATCH, Fingerprint, NearDuplicateIndex,
+                            PHashIndex, fingerprint, layout_similarity)
+
+
+def digest(i: int) -> bytes:
+    return hashlib.sha256(str(i).encode()).digest()
+
+
+def flip(rng: np.random.Generator, value: int, bits: int) -> int:
+    for bit in rng.choice(64, bits, replace=False):
+        value ^= 1 << int(bit)
+    return value
+
+
+def brute_force(hashes, value: int, radius: int):
+    return sorted((bin(h ^ value).count("1"), d) for d, h in hashes.items() if bin(h ^ value).count("1") <= radius)
+
+
+@pytest.mark.parametrize("rebuild_at", [0, 1500, 3000], ids=["all-pending", "half-built", "all-built"])
+def test_search_matches_brute_force(rebuild_at):
+    rng = np.random.default_rng(1)
+    index = PHashIndex(5000)
+    centers = [int(v) for v in rng.integers(0, 2 ** 63, 50, dtype=np.int64)]
+    hashes = {}
+    for i in range(3000):
+        value = flip(rng, centers[i % 50], int(rng.integers(0, 14)))
+        hashes[digest(i)] = value
+        index.add(value, digest(i))
+        if i + 1 == rebuild_at:
+            index.rebuild()
+
+    for _ in range(200):
+        query = flip(rng, centers[int(rng.integers(0, 50))], int(rng.integers(0, NEAR_DUP_MAX_DISTANCE + 1)))
+        found = index.search(query, NEAR_DUP_MAX_DISTANCE)
+        assert sorted(found) == brute_force(hashes, query, NEAR_DUP_MAX_DISTANCE)
+        assert [d for d, _ in found] == sorted(d for d, _ in found)
+
+
+def test_full_ring_forgets_the_oldest():
+    index = PHashIndex(4)
+    for i in range(6):
+        index.add(i << 40, digest(i))
+        if i == 3:
+            index.rebuild()
+    assert len(index) == 4
+    # Slots 0 and 1 were overwritten by entries 4 and 5 (after the tables were built)
+    assert index.search(0, 0) == []
+    assert index.search(5 << 40, 0) == [(0, digest(5))]
+    assert index.search(2 << 40, 0) == [(0, digest(2))]
+
+
+def test_save_and_load(tmp_path):
+    index = PHashIndex(8)
+    for i in range(10):
+        index.add((i + 1) * 0x0101010101010101, digest(i))
+    path = tmp_path / "index.npz"
+    index.save(path)
+
+    same = PHashIndex(8)
+    same.load(path)
+    smaller = PHashIndex(3)
+    smaller.load(path)
+    for i in range(2, 10):
+        assert same.search((i + 1) * 0x0101010101010101, 0) == [(0, digest(i))]
+    # Lower capacity keeps the newest entries
+    assert [smaller.search((i + 1) * 0x0101010101010101, 0) != [] for i in range(10)] == [False] * 7 + [True] * 3
+
+
+LAYOUT = [[0.1, 0.3, 0.2], [0.2, 0.2], [0.1, 0.4, 0.1], [0.3, 0.1]]
+OTHER = [[0.3, 0.1], [0.1, 0.1, 0.1, 0.1], [0.4], [0.2, 0.2, 0.3]]
+
+
+def test_find_checks_the_layout_and_counts():
+    index = NearDuplicateIndex(capacity=16, enabled=True)
+    stored = {digest(1).hex(): {"vocabulary": ["a"], "layout": LAYOUT},
+              digest(2).hex(): {"vocabulary": ["b"], "layout": OTHER}}
+
+    async def load(key):
+        return stored.get(key)
+
+    async def go():
+        index.add(Fingerprint(0xFF00FF00FF00FF00, LAYOUT), digest(1).hex())
+        index.add(Fingerprint(0xFF00FF00FF00FF01, OTHER), digest(2).hex())
+        hit = await index.find(Fingerprint(0xFF00FF00FF00FF03, LAYOUT), load)
+        rejected = await index.find(Fingerprint(0xFF00FF00FF00FF01, [[0.9], [0.9], [0.9]]), load)
+        far = await index.find(Fingerprint(0x00FF00FF00FF00FF, LAYOUT), load)
+        return hit, rejected, far
+
+    hit, rejected, far = asyncio.run(go())
+    assert hit.value["vocabulary"] == ["a"] and hit.distance == 2 and hit.layout_match == 1.0
+    assert rejected is None and far is None
+    # The hit first rejects the nearer hash with the other layout; the second query rejects both
+    assert (index.hits, index.rejected, index.misses) == (1, 3, 2)
+
+
+def jpeg(image: Image.Image, quality: int) -> bytes:
+    buf = io.BytesIO()
+    image.convert("RGB").save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def test_rephotographed_page_matches_and_other_page_does_not():
+    from bench.tesseract_pages import synthetic_page
+
+    page = Image.open(io.BytesIO(synthetic_page(20, None, 0.5)[0]))
+    again = ImageEnhance.Brightness(page.rotate(0.8, fillcolor=240)).enhance(0.9)
+    other = Image.open(io.BytesIO(synthetic_page(14, None, 0.5)[0]))
+
+    a, b, c = (fingerprint(jpeg(image, q)) for image, q in ((page, 90), (again, 70), (other, 90)))
+    assert bin(a.phash ^ b.phash).count("1") <= NEAR_DUP_MAX_DISTANCE
+    assert layout_similarity(a.layout, b.layout) >= NEAR_DUP_MIN_LAYOUT_MATCH
+    assert layout_similarity(a.layout, c.layout) < NEAR_DUP_MIN_LAYOUT_MATCH
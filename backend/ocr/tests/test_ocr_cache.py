@@ -0,0 +1,55 @@
+import asyncio
+import time
+from pathlib import Path
+
+from ocr_cache import OCRCache, make_cache_key
+
+
+def disk_size(directory: Path) -> int:
+    return sum(p.stat().st_size for p in directory.glob("*/*.json"))
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_cache_key_changes_with_prompt_and_model():
+    key = make_cache_key("abc", "prompt v1", "qwen-vl-max")
+    assert key == make_cache_key("abc", "prompt v1", "qwen-vl-max")
+    assert key != make_cache_key("abc", "prompt v2", "qwen-vl-max")
+    assert key != make_cache_key("abc", "prompt v1", "hybrid+qwen-vl-max")
+
+
+def test_get_from_disk_after_memory_eviction(tmp_path):
+    cache = OCRCache(tmp_path, max_memory_entries=1)
+    run(cache.set("a" * 64, {"vocabulary": [1]}))
+    run(cache.set("b" * 64, {"vocabulary": [2]}))
+    assert run(cache.get("a" * 64)) == {"vocabulary": [1]}
+    assert run(cache.get("c" * 64)) is None
+
+
+def test_rewriting_a_key_does_not_inflate_disk_bytes(tmp_path):
+    cache = OCRCache(tmp_path)
+    run(cache.set("a" * 64, {"vocabulary": []}))
+    run(cache.set("b" * 64, {"vocabulary": []}))
+    for i in range(20):
+        run(cache.set("a" * 64, {"vocabulary": list(range(i))}))
+    assert cache._disk_bytes == disk_size(tmp_path)
+
+
+def test_expired_entry_is_removed_and_subtracted(tmp_path):
+    cache = OCRCache(tmp_path, max_memory_entries=0, ttl_seconds=60)
+    run(cache.set("a" * 64, {"x": 1}))
+    run(cache.set("b" * 64, {"x": 2}))
+    cache._disk_set("a" * 64, {"x": 1}, time.time() - 120)  # written long ago
+    assert run(cache.get("a" * 64)) is None
+    assert not cache._path("a" * 64).exists()
+    assert cache._disk_bytes == disk_size(tmp_path)
+
+
+def test_prune_keeps_disk_under_budget(tmp_path):
+    cache = OCRCache(tmp_path, max_disk_bytes=2000)
+    for i in range(100):
+        run(cache.set(f"{i:064x}", {"text": "x" * 50}))
+    assert cache._disk_bytes == disk_size(tmp_path)
+    assert cache._disk_bytes <= 2000
@@ -0,0 +1,103 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, File, UploadFile
+
+from uploads import UploadLimitMiddleware, read_upload
+
+REQUEST_LIMIT = 256 * 1024
+FILE_LIMIT = 64 * 1024
+BOUNDARY = "testboundary"
+
+
+def make_app(seen: Dict, request_limit: int = REQUEST_LIMIT, file_limit: int = FILE_LIMIT) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(UploadLimitMiddleware, max_bytes=request_limit)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        # SpooledTemporaryFile: True once the part went to a temp file instead of memory
+        seen["on_disk"] = file.file._rolled
+        contents = await read_upload(file, max_bytes=file_limit)
+        seen["read"] = len(contents)
+        return {"size": len(contents)}
+
+    return app
+
+
+def multipart(size: int) -> bytes:
+    return (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.jpg\"\r\n"
+        f"Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + b"\xff" * size + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def post(app, body: bytes, content_length: Optional[int], chunk: int = 16 * 1024) -> Tuple[int, int]:
+    """Drive the ASGI app directly; returns (status, body chunks the app pulled)"""
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+    scope = {"type": "http", "method": "POST", "path": "/upload", "raw_path": b"/upload", "query_string": b"",
+             "headers": headers, "http_version": "1.1", "scheme": "http", "server": ("t", 80), "client": ("c", 1),
+             "root_path": ""}
+    chunks = [body[i:i + chunk] for i in range(0, len(body), chunk)]
+    pulled = 0
+    sent: List[Dict] = []
+
+    async def receive():
+        nonlocal pulled
+        if pulled < len(chunks):
+            pulled += 1
+            return {"type": "http.request", "body": chunks[pulled - 1], "more_body": pulled < len(chunks)}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return sent[0]["status"], pulled
+
+
+def test_content_length_over_limit_is_rejected_unread():
+    seen: Dict = {}
+    body = multipart(REQUEST_LIMIT * 2)
+    status, pulled = post(make_app(seen), body, len(body))
+    assert status == 413
+    assert pulled == 0
+    assert seen == {}
+
+
+def test_chunked_body_stops_at_the_limit():
+    seen: Dict = {}
+    chunk = 16 * 1024
+    status, pulled = post(make_app(seen), multipart(REQUEST_LIMIT * 4), None, chunk)
+    assert status == 413
+    # Reading stopped one chunk past the limit, not at the end of the 1 MB body
+    assert pulled <= REQUEST_LIMIT // chunk + 1
+    assert "read" not in seen
+
+
+def test_file_over_limit_is_rejected_from_its_size():
+    seen: Dict = {}
+    body = multipart(FILE_LIMIT * 3)  # over the per-file limit, under the request limit
+    status, _ = post(make_app(seen), body, len(body))
+    assert status == 413
+    assert "read" not in seen
+
+
+def test_large_file_part_is_spooled_to_disk_not_memory():
+    seen: Dict = {}
+    mb = 1024 * 1024
+    body = multipart(3 * mb)
+    status, _ = post(make_app(seen, request_limit=8 * mb, file_limit=2 * mb), body, len(body))
+    assert status == 413
+    assert seen["on_disk"] is True
+    assert "read" not in seen
+
+
+def test_file_within_limit_is_read_once():
+    seen: Dict = {}
+    body = multipart(FILE_LIMIT // 2)
+    status, _ = post(make_app(seen), body, len(body))
+    assert status == 200
+    assert seen["read"] == FILE_LIMIT // 2
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from vocab_stream import VocabularyStreamParser
+
+ITEMS = [
+    {"english": "apple", "chinese": "蘋果"},
+    {"english": "brace } and ]", "chinese": "括號 {"},
+    {"english": 'quote \\" here', "chinese": "引號"},
+    {"english": "nested", "chinese": "巢", "extra": {"a": [1, 2]}},
+]
+
+
+def feed_all(text: str, size: int):
+    parser = VocabularyStreamParser()
+    emitted = []
+    for i in range(0, len(text), size):
+        emitted.extend(parser.feed(text[i:i + size]))
+    return parser, emitted
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 10_000])
+def test_items_are_emitted_whatever_the_chunking(size):
+    text = "以下係結果：\n```json\n" + json.dumps({"vocabulary": ITEMS}, ensure_ascii=False, indent=2) + "\n```"
+    parser, emitted = feed_all(text, size)
+    assert emitted == json.loads(json.dumps(ITEMS))
+    assert parser.items == emitted
+
+
+def test_each_item_is_emitted_as_soon_as_it_closes():
+    parser = VocabularyStreamParser()
+    assert parser.feed('{"vocabulary": [{"english": "apple", "chinese": "蘋') == []
+    assert parser.feed('果"}, {"english": "ban') == [{"english": "apple", "chinese": "蘋果"}]
+    assert parser.feed('ana", "chinese": "香蕉"}') == [{"english": "banana", "chinese": "香蕉"}]
+
+
+def test_stops_at_the_end_of_the_array():
+    text = '{"vocabulary": [{"english": "a"}], "other": [{"english": "not vocabulary"}]}'
+    parser, emitted = feed_all(text, 5)
+    assert emitted == [{"english": "a"}]
+    assert parser.feed('{"english": "later"}') == []
+
+
+def test_ignores_objects_before_the_vocabulary_key():
+    text = '{"meta": {"english": "x"}, "vocabulary": [{"english": "a"}]}'
+    _, emitted = feed_all(text, 4)
+    assert emitted == [{"english": "a"}]
+
+
+def test_malformed_item_is_skipped():
+    text = '{"vocabulary": [{"english": "a"}, {"english": bad}, {"english": "c"}]}'
+    _, emitted = feed_all(text, 3)
+    assert emitted == [{"english": "a"}, {"english": "c"}]
+
+
+def test_truncated_stream_keeps_complete_items():
+    text = '{"vocabulary": [{"english": "a"}, {"english": "b"}, {"english": "c'
+    parser, emitted = feed_all(text, 6)
+    assert emitted == [{"english": "a"}, {"english": "b"}]
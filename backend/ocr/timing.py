@@ -0,0 +1,132 @@
+"""
+Per-request phase timing (Server-Timing) and opt-in profiling
+每個 response 都有 `Server-Timing` header，講晒 read / preprocess / encode / upstream / parse / db 各用咗幾耐。
+
+Profiling 要 admin token 先開到：
+    curl -H "X-Admin-Token: $PROFILE_ADMIN_TOKEN" -H "X-Profile: 1" ...   (或者 ?profile=1)
+會用 pyinstrument（sampling profiler）跑成個 request，HTML report 寫去 PROFILE_DIR。
+"""
+
+import asyncio
+import hmac
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import parse_qs
+
+from fastapi import FastAPI
+
+logger = logging.getLogger(__name__)
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+# --- Configuration ---
+PROFILE_ADMIN_TOKEN = os.environ.get("PROFILE_ADMIN_TOKEN")
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", "/app/profiles"))
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.001"))
+
+_phases: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_phases", default=None)
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Time a block as phase `name` of the current request
+
+    Repeated / concurrent phases with the same name are summed (e.g. the
+    upstream calls of a multi-page batch). Outside a request this is a no-op.
+    """
+    phases = _phases.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if phases is not None:
+            phases[name] = phases.get(name, 0.0) + (time.perf_counter() - started)
+
+
+def server_timing_header(phases: Dict[str, float], total: float) -> bytes:
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in phases.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries).encode("latin-1")
+
+
+def _profile_requested(scope) -> bool:
+    """Admin token must match; the flag can be a header or ?profile=1"""
+    if not PROFILE_ADMIN_TOKEN:
+        return False
+    headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+    token = headers.get("x-admin-token", "")
+    if not hmac.compare_digest(token.encode(), PROFILE_ADMIN_TOKEN.encode()):
+        return False
+    if headers.get("x-profile") in ("1", "true"):
+        return True
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return query.get("profile", [""])[0] in ("1", "true")
+
+
+def _write_profile(path: Path, html: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(html, encoding="utf-8")
+
+
+class TimingMiddleware:
+    """Pure ASGI middleware: Server-Timing header + optional profiling"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        phases: Dict[str, float] = {}
+        token = _phases.set(phases)
+        started = time.perf_counter()
+
+        profiler = None
+        profile_path = None
+        if _profile_requested(scope):
+            if Profiler is None:
+                logger.warning("Profiling requested but pyinstrument is not installed")
+            else:
+                profile_path = PROFILE_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.html"
+                profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # Streaming responses only report the phases finished before the first byte
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing_header(phases, time.perf_counter() - started)))
+                if profile_path is not None:
+                    headers.append((b"x-profile-file", profile_path.name.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            if profiler is not None:
+                profiler.start()
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profiler is not None:
+                profiler.stop()
+                try:
+                    await asyncio.to_thread(_write_profile, profile_path, profiler.output_html())
+                    logger.info(f"Profile written to {profile_path} ({scope['path']})")
+                except OSError as e:
+                    logger.error(f"Writing profile failed: {e}")
+            _phases.reset(token)
+
+
+def setup_timing(app: FastAPI):
+    """Add Server-Timing (and admin-only profiling) to every response of `app`"""
+    app.add_middleware(TimingMiddleware)
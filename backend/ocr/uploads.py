@@ -0,0 +1,89 @@
+"""
+Size-capped, disk-spooled upload intake
+以前上載冇上限，幾張 20 MB 手機相同時上載就可以令 container memory 爆升。
+
+- Middleware：`Content-Length` 超過上限即刻 413，唔會讀 body；chunked upload 就邊收邊數，超過就 413
+- Starlette 嘅 multipart parser 本身就將超過 1 MB 嘅檔案 part 寫落 temp file（SpooledTemporaryFile），唔會成個 request 擺喺 memory
+- `read_upload()`：先睇 spooled file 嘅 size，過大就 413，之後先讀入 memory（只讀一次）
+"""
+
+import json
+import logging
+import os
+
+from fastapi import FastAPI, HTTPException, UploadFile
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))            # per file
+UPLOAD_MAX_REQUEST_BYTES = int(os.environ.get("UPLOAD_MAX_REQUEST_BYTES", str(100 * 1024 * 1024)))  # whole body
+
+
+def too_large(limit: int, what: str = "Upload") -> HTTPException:
+    return HTTPException(status_code=413, detail=f"{what} too large (max {limit // (1024 * 1024)} MB)")
+
+
+async def read_upload(file: UploadFile, max_bytes: int = UPLOAD_MAX_BYTES) -> bytes:
+    """Read a (spooled) upload into memory once, 413 when it is over `max_bytes`"""
+    if file.size is not None:
+        if file.size > max_bytes:
+            raise too_large(max_bytes, file.filename or "Upload")
+        return await file.read()
+    # Size unknown: never read more than one byte past the limit
+    contents = await file.read(max_bytes + 1)
+    if len(contents) > max_bytes:
+        raise too_large(max_bytes, file.filename or "Upload")
+    return contents
+
+
+class UploadLimitMiddleware:
+    """Pure ASGI middleware: cap request bodies before the multipart parser sees them"""
+
+    def __init__(self, app, max_bytes: int = UPLOAD_MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            # Reject without reading the body
+            await self._reject(send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised inside body parsing → FastAPI turns it into the 413 response
+                    raise too_large(self.max_bytes, "Request")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": too_large(self.max_bytes, "Request").detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def setup_uploads(app: FastAPI):
+    """Cap request bodies (file parts over 1 MB are already spooled to disk by Starlette)"""
+    app.add_middleware(UploadLimitMiddleware)
@@ -0,0 +1,108 @@
+"""
+Incremental vocabulary parser for streamed model output
+Model 一邊 stream 出 JSON，我哋一邊 parse `"vocabulary": [...]` 入面嘅 object，
+每個 object 完整咗就即刻交俾 client，唔使等成個 completion 完。
+"""
+
+import json
+import logging
+from typing import Dict, List
+
+from metrics import record_parse_failure
+
+logger = logging.getLogger(__name__)
+
+
+class VocabularyStreamParser:
+    """
+    Feed text chunks, get back each vocabulary item as soon as it is complete
+
+    Only the objects directly inside the `vocabulary` array are emitted;
+    markdown fences or text around the JSON are ignored.
+    """
+
+    def __init__(self, key: str = "vocabulary"):
+        self._marker = f'"{key}"'
+        self._buffer = ""
+        self._pos = 0              # next char to scan
+        self._in_array = False
+        self._done = False
+        self._depth = 0            # object depth inside the array
+        self._in_string = False
+        self._escape = False
+        self._item_start = -1
+        self.items: List[Dict] = []
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """Add a chunk of model output, return the items completed by it"""
+        if self._done:
+            return []
+        self._buffer += chunk
+        completed: List[Dict] = []
+
+        if not self._in_array:
+            idx = self._buffer.find(self._marker, self._pos)
+            if idx < 0:
+                # keep the tail in case the marker is split across chunks
+                self._buffer = self._buffer[-len(self._marker):]
+                self._pos = 0
+                return completed
+            bracket = self._buffer.find("[", idx + len(self._marker))
+            if bracket < 0:
+                self._pos = idx
+                return completed
+            self._in_array = True
+            self._pos = bracket + 1
+
+        buf = self._buffer
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._item_start = i
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._item_start >= 0:
+                    item = self._decode(buf[self._item_start:i + 1])
+                    if item is not None:
+                        self.items.append(item)
+                        completed.append(item)
+                    self._item_start = -1
+            elif ch == "]" and self._depth == 0:
+                self._done = True
+                i += 1
+                break
+            i += 1
+        self._pos = i
+
+        # Drop consumed text so the buffer stays small
+        if self._item_start < 0:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        elif self._item_start > 0:
+            self._buffer = self._buffer[self._item_start:]
+            self._pos -= self._item_start
+            self._item_start = 0
+
+        return completed
+
+    @staticmethod
+    def _decode(text: str):
+        try:
+            item = json.loads(text)
+        except ValueError:
+            logger.warning(f"Skipping malformed streamed item: {text[:80]}")
+            record_parse_failure("vocab_stream")
+            return None
+        return item if isinstance(item, dict) else None
@@ -0,0 +1,94 @@
+"""
+Vocabulary helpers shared by the OCR endpoints
+合併多頁 / 多個 tile 嘅詞彙，去除重複；將本地 OCR（Tesseract）嘅一行字拆做 中文 / english / pinyin。
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+VOCAB_FIELDS = ("chinese", "english", "pinyin")
+
+
+def normalize_item(item: Dict) -> Dict:
+    """Strip whitespace and make sure every field is a string (pinyin is optional)"""
+    normalized = {}
+    for field in VOCAB_FIELDS:
+        if field == "pinyin" and field not in item:
+            continue
+        normalized[field] = str(item.get(field) or "").strip()
+    return normalized
+
+
+def vocab_key(item: Dict) -> Tuple[str, str]:
+    """
+    Dedup key: English (case-insensitive) when present, otherwise Chinese
+    """
+    english = str(item.get("english") or "").strip().lower()
+    if english:
+        return ("en", english)
+    return ("zh", str(item.get("chinese") or "").strip())
+
+
+def merge_vocabulary(pages: Iterable[List[Dict]]) -> List[Dict]:
+    """
+    Merge vocabulary lists, keeping first-seen order
+
+    Duplicates are collapsed; empty fields of the first occurrence are
+    filled from later ones (e.g. a page that also has the pinyin).
+    """
+    merged: Dict[Tuple[str, str], Dict] = {}
+    for vocabulary in pages:
+        for raw in vocabulary or []:
+            if not isinstance(raw, dict):
+                continue
+            item = normalize_item(raw)
+            key = vocab_key(item)
+            if not key[1]:
+                continue
+
+            existing = merged.get(key)
+            if existing is None:
+                merged[key] = item
+                continue
+            for field, value in item.items():
+                if value and not existing.get(field):
+                    existing[field] = value
+
+    return list(merged.values())
+
+
+def parse_vocabulary_line(line: str) -> Optional[Dict]:
+    """
+    One OCR'd line like "1. 蘋果 apple píng guǒ" → vocabulary item
+
+    Numbering is dropped; the first all-ASCII word is the English, the first
+    part with Chinese characters the Chinese, the first tone-marked word the
+    pinyin. None when the line has neither Chinese nor English.
+    """
+    # Remove numbering (1. 2. etc.)
+    line = re.sub(r'^\d+[\.\)]\s*', '', line.strip())
+
+    # Split by spaces/commas
+    parts = [p.strip() for p in re.split(r'[\s,，]+', line) if p.strip()]
+
+    chinese = ""
+    english = ""
+    pinyin = ""
+    for part in parts:
+        # Check if it's English (all ASCII letters)
+        if re.match(r'^[a-zA-Z]+$', part):
+            if not english:
+                english = part
+        # Check if it's Chinese (contains Chinese characters)
+        elif re.search(r'[\u4e00-\u9fff]', part):
+            if not chinese:
+                chinese = part
+        # Check if it's pinyin (lowercase + tone marks)
+        elif re.match(r'^[a-zāáǎàēéěèīíǐìōóǒòūúǔùǖǘǚǜ]+$', part, re.IGNORECASE):
+            if not pinyin:
+                pinyin = part
+
+    # Only add if we have at least Chinese or English
+    if not (chinese or english):
+        return None
+    return {"chinese": chinese, "english": english, "pinyin": pinyin}
@@ -222,27 +222,32 @@ GRANT EXECUTE ON FUNCTION get_word_set_details TO web_anon;
 -- ========================================
 -- 8. 批量插入詞語 (for OCR import)
 -- ========================================
+-- 英文唔分大小寫唯一（冇英文嘅中文詞語唔受限制）
+-- 已有 database 如果有重複英文，要先清走先建到 index
+CREATE UNIQUE INDEX IF NOT EXISTS idx_words_english_lower
+    ON words (lower(english))
+    WHERE english IS NOT NULL AND english <> '';
+
 CREATE OR REPLACE FUNCTION bulk_insert_words(
     p_words JSONB
 )
 RETURNS INTEGER AS $$
 DECLARE
     v_count INTEGER := 0;
-    v_word JSONB;
 BEGIN
-    FOR v_word IN SELECT * FROM jsonb_array_elements(p_words)
-    LOOP
-        INSERT INTO words (chinese, english, pinyin, category, grade)
-        VALUES (
-            v_word->>'chinese',
-            v_word->>'english',
-            v_word->>'pinyin',
-            COALESCE(v_word->>'category', 'general'),
-            COALESCE(v_word->>'grade', 'P1')
-        );
-        v_count := v_count + 1;
-    END LOOP;
-
+    -- 一條 INSERT 搞掂，已存在嘅英文詞語直接跳過
+    INSERT INTO words (chinese, english, pinyin, category, grade)
+    SELECT
+        w->>'chinese',
+        btrim(w->>'english'),
+        w->>'pinyin',
+        COALESCE(w->>'category', 'general'),
+        COALESCE(w->>'grade', 'P1')
+    FROM jsonb_array_elements(p_words) AS t(w)
+    ON CONFLICT (lower(english)) WHERE english IS NOT NULL AND english <> ''
+    DO NOTHING;
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
     RETURN v_count;
 END;
 $$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
@@ -250,6 +255,88 @@ $$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
 GRANT EXECUTE ON FUNCTION bulk_insert_words TO web_anon;
 
 
+-- ========================================
+-- 9. 批量 upsert 詞語 (OCR 儲存，一次 round trip)
+-- ========================================
+-- 回傳 {"created": [...], "skipped": [...], "errors": [...]}
+-- - created: 新插入嘅詞語
+-- - skipped: 已存在（或者同一批重複）嘅英文
+-- - errors: 冇英文、處理唔到嘅項目
+CREATE OR REPLACE FUNCTION upsert_words(
+    p_words JSONB
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_result JSONB;
+BEGIN
+    WITH input AS (
+        SELECT
+            t.ord,
+            NULLIF(btrim(t.w->>'english'), '') AS english,
+            COALESCE(btrim(t.w->>'chinese'), '') AS chinese,
+            COALESCE(t.w->>'pinyin', '') AS pinyin,
+            CASE WHEN t.w ? 'category' THEN t.w->>'category' ELSE 'general' END AS category,
+            CASE WHEN t.w ? 'grade' THEN t.w->>'grade' ELSE 'P1' END AS grade
+        FROM jsonb_array_elements(p_words) WITH ORDINALITY AS t(w, ord)
+    ),
+    -- 同一批入面重複嘅英文只保留第一個
+    deduped AS (
+        SELECT DISTINCT ON (lower(english)) *
+        FROM input
+        WHERE english IS NOT NULL
+        ORDER BY lower(english), ord
+    ),
+    inserted AS (
+        INSERT INTO words (chinese, english, pinyin, category, grade)
+        SELECT chinese, english, pinyin, category, grade
+        FROM deduped
+        ORDER BY ord
+        ON CONFLICT (lower(english)) WHERE english IS NOT NULL AND english <> ''
+        DO NOTHING
+        RETURNING id, chinese, english, pinyin, category, grade
+    )
+    SELECT jsonb_build_object(
+        'created', COALESCE(
+            (SELECT jsonb_agg(to_jsonb(i) ORDER BY i.id) FROM inserted i),
+            '[]'::jsonb
+        ),
+        'skipped', COALESCE(
+            (SELECT jsonb_agg(
+                    jsonb_build_object(
+                        'english', s.english,
+                        'reason', CASE WHEN d.ord IS NULL THEN 'duplicate in batch' ELSE 'already exists' END,
+                        'id', COALESCE(
+                            (SELECT i.id FROM inserted i WHERE lower(i.english) = lower(s.english)),
+                            (SELECT w.id FROM words w WHERE lower(w.english) = lower(s.english) LIMIT 1)
+                        )
+                    ) ORDER BY s.ord)
+             FROM input s
+             LEFT JOIN deduped d ON d.ord = s.ord
+             WHERE s.english IS NOT NULL
+               AND NOT EXISTS (
+                   SELECT 1 FROM inserted i
+                   WHERE d.ord IS NOT NULL AND lower(i.english) = lower(s.english)
+               )),
+            '[]'::jsonb
+        ),
+        'errors', COALESCE(
+            (SELECT jsonb_agg(
+                    jsonb_build_object('english', '', 'chinese', s.chinese, 'error', 'english is required')
+                    ORDER BY s.ord)
+             FROM input s
+             WHERE s.english IS NULL),
+            '[]'::jsonb
+        )
+    )
+    INTO v_result;
+
+    RETURN v_result;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+GRANT EXECUTE ON FUNCTION upsert_words TO web_anon;
+
+
 -- ========================================
 -- 測試查詢
 -- ========================================
@@ -273,6 +360,6 @@ GRANT EXECUTE ON FUNCTION bulk_insert_words TO web_anon;
 DO $$
 BEGIN
     RAISE NOTICE 'SpellQuest custom functions created!';
-    RAISE NOTICE 'Functions: get_random_words, get_quiz_questions, submit_learning_record, get_random_sentences, get_word_set_details, bulk_insert_words';
+    RAISE NOTICE 'Functions: get_random_words, get_quiz_questions, submit_learning_record, get_random_sentences, get_word_set_details, bulk_insert_words, upsert_words';
     RAISE NOTICE 'Views: word_accuracy_stats, learning_progress';
 END $$;
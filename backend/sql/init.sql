@@ -60,6 +60,10 @@ CREATE INDEX IF NOT EXISTS idx_words_category ON words(category);
 CREATE INDEX IF NOT EXISTS idx_words_grade ON words(grade);
 CREATE INDEX IF NOT EXISTS idx_sentences_category ON sentences(category);
 CREATE INDEX IF NOT EXISTS idx_learning_records_word_id ON learning_records(word_id);
+-- 英文唔分大小寫唯一（OCR 匯入用 ON CONFLICT 跳過重複）
+CREATE UNIQUE INDEX IF NOT EXISTS idx_words_english_lower
+    ON words (lower(english))
+    WHERE english IS NOT NULL AND english <> '';
 
 -- 插入示例數據：中文詞語
 INSERT INTO words (chinese, english, pinyin, category, grade) VALUES
@@ -14,71 +14,53 @@ interface VocabularyItem {
 
 interface SaveResult {
   created: any[]
-  skipped: { english: string; reason: string }[]
+  skipped: { english: string; reason: string; id?: number }[]
   errors: { english: string; error: string }[]
 }
 
 /**
  * 儲存單字到 DB，跳過已存在嘅
+ * 一次 call `upsert_words` RPC，唔再逐個字 GET + POST
  */
 async function saveVocabularyToDb(vocabulary: VocabularyItem[]): Promise<SaveResult> {
-  const result: SaveResult = {
-    created: [],
-    skipped: [],
-    errors: []
+  const words = vocabulary
+    .filter(word => word.english && word.english.trim() !== '')
+    .map(word => ({
+      english: word.english.trim().toLowerCase(),
+      chinese: word.chinese?.trim() || '',
+      pinyin: '', // Not used anymore
+      category: 'ocr', // Mark as OCR-imported
+      grade: 'P1'
+    }))
+
+  if (words.length === 0) {
+    return { created: [], skipped: [], errors: [] }
   }
-  
-  for (const word of vocabulary) {
-    if (!word.english || word.english.trim() === '') {
-      continue
-    }
-    
-    const english = word.english.trim().toLowerCase()
-    
-    try {
-      // Check if word already exists
-      const checkResponse = await fetch(
-        `${POSTGREST_URL}/words?english=ilike.${encodeURIComponent(english)}`,
-        { method: 'GET', headers: { 'Accept': 'application/json' } }
-      )
-      
-      const existing = await checkResponse.json()
-      
-      if (existing && existing.length > 0) {
-        result.skipped.push({ english, reason: 'already exists' })
-        continue
-      }
-      
-      // Insert new word
-      const insertResponse = await fetch(`${POSTGREST_URL}/words`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'Prefer': 'return=representation'
-        },
-        body: JSON.stringify({
-          english: english,
-          chinese: word.chinese?.trim() || '',
-          pinyin: '', // Not used anymore
-          category: 'ocr', // Mark as OCR-imported
-          grade: 'P1'
-        })
-      })
-      
-      if (insertResponse.ok) {
-        const created = await insertResponse.json()
-        result.created.push(created[0] || created)
-      } else {
-        const errorText = await insertResponse.text()
-        result.errors.push({ english, error: errorText })
+
+  try {
+    const response = await fetch(`${POSTGREST_URL}/rpc/upsert_words`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ p_words: words })
+    })
+
+    if (!response.ok) {
+      const errorText = await response.text()
+      return {
+        created: [],
+        skipped: [],
+        errors: words.map(w => ({ english: w.english, error: errorText }))
       }
-      
-    } catch (error: any) {
-      result.errors.push({ english, error: error.message })
+    }
+
+    return await response.json() as SaveResult
+  } catch (error: any) {
+    return {
+      created: [],
+      skipped: [],
+      errors: words.map(w => ({ english: w.english, error: error.message }))
     }
   }
-  
-  return result
 }
 
 export default defineEventHandler(async (event) => {